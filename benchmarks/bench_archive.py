@@ -0,0 +1,114 @@
+"""
+量測 SQLite 訊息封存的寫入吞吐量與查詢延遲
+
+以與訊息寫入器相同的批次大小寫入大量模擬訊息，再量測全文搜尋與範圍查詢。
+
+用法：
+    python -m benchmarks.bench_archive [--messages 1000000] [--channels 200] [--queries 200]
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from bot.core.archive import MessageArchive
+from .bench_load import WORDS
+from .bench_web_server import percentile
+from .fake_discord import make_snowflake
+from .fake_gateway import VIRTUAL_EPOCH_MS
+
+
+def generate(args, rng):
+    # 依時間順序產生訊息，每毫秒一則
+    guild_count = max(1, args.channels // 20)
+    for index in range(args.messages):
+        channel = rng.randrange(args.channels)
+        content = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 12)))
+        if rng.random() < 0.001:
+            content += ' needle'
+        yield {
+            'id': str(make_snowflake(VIRTUAL_EPOCH_MS + index, index)),
+            'guild_id': str(1000 + channel % guild_count),
+            'channel_id': str(2000 + channel),
+            'author_id': str(3000 + rng.randrange(500)),
+            'author': f'user{rng.randrange(500)}',
+            'content': content,
+            'timestamp': None,
+            'attachments': [],
+        }
+
+
+def measure(name, queries, function):
+    latencies = []
+    returned = 0
+    for query in queries:
+        started = time.perf_counter()
+        messages, _ = function(query)
+        latencies.append(time.perf_counter() - started)
+        returned += len(messages)
+    print(f"{name:<28}{len(latencies):>8}{percentile(latencies, 0.5) * 1000:>10.2f}"
+          f"{percentile(latencies, 0.99) * 1000:>10.2f}{returned / max(1, len(latencies)):>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=1000000)
+    parser.add_argument('--channels', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, 'archive.db')
+        archive = MessageArchive(path)
+
+        started = time.perf_counter()
+        batch = []
+        for message in generate(args, rng):
+            batch.append(message)
+            if len(batch) == args.batch_size:
+                archive.insert_many(batch)
+                batch = []
+        if batch:
+            archive.insert_many(batch)
+        elapsed = time.perf_counter() - started
+        size = sum(os.path.getsize(os.path.join(workdir, name)) for name in os.listdir(workdir))
+        print(f"inserted {args.messages} messages in {elapsed:.1f}s "
+              f"({args.messages / elapsed:.0f} msg/s), {size / 2 ** 20:.1f} MiB, "
+              f"tokenizer {archive.tokenizer}")
+
+        channels = [2000 + rng.randrange(args.channels) for _ in range(args.queries)]
+        newest = make_snowflake(VIRTUAL_EPOCH_MS + args.messages, 0)
+        cursors = [make_snowflake(VIRTUAL_EPOCH_MS + rng.randrange(args.messages), 0)
+                   for _ in range(args.queries)]
+        print(f"{'query':<28}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}{'rows':>10}")
+        measure('search common word', ['discord'] * args.queries,
+                lambda text: archive.search(text, limit=50))
+        measure('search rare word', ['needle'] * args.queries,
+                lambda text: archive.search(text, limit=50))
+        measure('search CJK', ['測試'] * args.queries,
+                lambda text: archive.search(text, limit=50))
+        measure('search in channel', channels,
+                lambda channel: archive.search('hello world', channel_id=channel, limit=50))
+        measure('search page (before_id)', cursors,
+                lambda cursor: archive.search('panel', before_id=cursor, limit=50))
+        measure('range latest page', channels,
+                lambda channel: archive.range(channel, limit=100))
+        measure('range before cursor', list(zip(channels, cursors)),
+                lambda query: archive.range(query[0], before_id=query[1], limit=100))
+        measure('range after cursor', list(zip(channels, cursors)),
+                lambda query: archive.range(query[0], after_id=query[1], limit=100))
+        measure('range window', list(zip(channels, cursors)),
+                lambda query: archive.range(query[0], after_id=query[1],
+                                            before_id=min(newest, query[1] + (60000 << 22)),
+                                            limit=100, forward=True))
+        archive.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+量測控制面板首次載入與重新載入的請求數、傳輸量與時間
+
+比較兩種做法：
+- 原始檔案：各自以 /static 載入，未壓縮，每次載入都重新驗證（304）
+- 資源處理：合併、縮減並預先壓縮，以含內容雜湊的網址載入，重新載入時直接使用瀏覽器快取
+
+頁面中的資源由首頁 HTML 解析，請求以 Flask 測試用戶端送出。時間為伺服器處理時間，
+加上依 --rtt 與 --bandwidth 估算的網路時間：首頁一個來回，資源平行載入再一個來回。
+
+用法：
+    python -m benchmarks.bench_assets [--rtt 0.05] [--bandwidth 2] [--rounds 50]
+"""
+
+import argparse
+import re
+import time
+
+from web.app import FlaskApp
+from web.assets import brotli
+from .fake_discord import build_world, start_loop_thread
+
+ASSET_PATTERN = re.compile(r'(?:href|src)="(/(?:static|assets)/[^"]+)"')
+ACCEPT_ENCODING = 'gzip, deflate, br' if brotli is not None else 'gzip, deflate'
+
+
+def load_page(client, cache):
+    # 模擬瀏覽器載入頁面；cache 保存各資源的 ETag 與是否為 immutable
+    started = time.perf_counter()
+    requests = 1
+    transferred = 0
+    page = client.get('/', headers={'Accept-Encoding': ACCEPT_ENCODING})
+    transferred += len(page.data)
+    waves = 1
+    assets = ASSET_PATTERN.findall(page.get_data(as_text=True))
+    fetched = False
+    for path in assets:
+        cached = cache.get(path)
+        if cached and cached['immutable']:
+            continue
+        headers = {'Accept-Encoding': ACCEPT_ENCODING}
+        if cached and cached['etag']:
+            headers['If-None-Match'] = cached['etag']
+        response = client.get(path, headers=headers)
+        requests += 1
+        fetched = True
+        transferred += len(response.data)
+        if response.status_code == 200:
+            cache[path] = {
+                'etag': response.headers.get('ETag'),
+                'immutable': 'immutable' in response.headers.get('Cache-Control', ''),
+            }
+        response.close()
+    if fetched:
+        waves += 1
+    return time.perf_counter() - started, requests, transferred, waves, len(assets)
+
+
+def measure(client, rounds, rtt, bandwidth):
+    first = []
+    repeat = []
+    for _ in range(rounds):
+        cache = {}
+        first.append(load_page(client, cache))
+        repeat.append(load_page(client, cache))
+
+    def summarize(samples):
+        server = sum(sample[0] for sample in samples) / len(samples)
+        _, requests, transferred, waves, files = samples[-1]
+        estimated = server + waves * rtt + transferred / (bandwidth * 1024 * 1024 / 8)
+        return server * 1000, requests, transferred, estimated * 1000, files
+
+    return summarize(first), summarize(repeat)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=50)
+    parser.add_argument('--rtt', type=float, default=0.05, help='網路來回時間（秒）')
+    parser.add_argument('--bandwidth', type=float, default=2.0, help='頻寬（Mbit/s）')
+    args = parser.parse_args()
+
+    flask_app = FlaskApp(build_world(start_loop_thread()))
+    client = flask_app.app.test_client()
+    assets = flask_app.routes.assets
+
+    print(f"brotli: {'available' if brotli is not None else 'not installed (gzip only)'}")
+    print(f"network model: rtt {args.rtt * 1000:.0f} ms, {args.bandwidth:g} Mbit/s")
+    for label, enabled in (('original files', False), ('asset pipeline', True)):
+        assets.enabled = enabled
+        first, repeat = measure(client, args.rounds, args.rtt, args.bandwidth)
+        print(f"{label} ({first[4]} files):")
+        for name, (server_ms, requests, transferred, estimated_ms, _) in (
+                ('first load', first), ('repeat load', repeat)):
+            print(f"  {name:<12} {requests} requests, {transferred / 1024:6.1f} KiB, "
+                  f"server {server_ms:5.2f} ms, estimated {estimated_ms:6.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
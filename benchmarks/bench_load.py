@@ -0,0 +1,327 @@
+"""
+以假 Gateway 與假 REST API 重播訊息流量，量測機器人與控制面板的延遲與資源用量
+
+涵蓋的路徑：
+- on_message：Gateway 事件經 setup_events 註冊的處理器（包含命令處理）
+- get_messages：透過 Flask Routes 輪詢頻道訊息
+- send_message：透過 Flask Routes 排入發送佇列，到假 REST API 完成發送
+
+流量由種子決定，相同參數每次產生相同的訊息順序與內容，
+可以把 --json 的輸出存下來與之後的結果比較。
+
+用法：
+    python -m benchmarks.bench_load [--rate 200] [--channels 20] [--duration 10]
+        [--pollers 4] [--send-rate 5] [--rest-latency 0.05] [--seed 1] [--json out.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from bot import DiscordBot
+from bot.core.logger import setup_logging, stop_logging
+from web.app import FlaskApp
+from .bench_web_server import percentile
+from .fake_gateway import FakeGateway
+
+WORDS = ('hello', 'world', 'discord', 'panel', 'message', 'latency', 'cache', 'queue',
+         'test', 'channel', '你好', '測試', '訊息', '頻道')
+
+
+def current_rss():
+    # 目前的常駐記憶體（位元組），無法取得時返回 None
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss():
+    if resource is None:
+        return None
+    # Linux 以 KB 為單位，macOS 以位元組為單位
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+
+def summarize(latencies):
+    return {
+        'count': len(latencies),
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': max(latencies) * 1000 if latencies else 0.0,
+    }
+
+
+def build_schedule(args):
+    # 預先產生整段流量：(相對秒數, 頻道索引, 內容)
+    rng = random.Random(args.seed)
+    total = int(args.rate * args.duration)
+    schedule = []
+    for index in range(total):
+        if rng.random() < args.command_ratio:
+            content = '!ping'
+        else:
+            content = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 12)))
+        schedule.append((index / args.rate, rng.randrange(args.channels), content))
+    return schedule
+
+
+class LoadRun:
+    def __init__(self, args, discord_bot, gateway):
+        self.args = args
+        self.discord_bot = discord_bot
+        self.gateway = gateway
+        self.flask_app = FlaskApp(discord_bot)
+        self.local = threading.local()
+        self.stopping = threading.Event()
+
+        self.injected = {}
+        self.on_message_latency = []
+        self.ingest_lag = []
+        self.poll_latency = []
+        self.poll_errors = 0
+        self.send_latency = []
+        self.send_errors = 0
+        self.job_ids = []
+
+    def instrument(self):
+        # 包裝 setup_events 註冊的 on_message，記錄從收到事件到處理完成的時間
+        bot = self.discord_bot.bot
+        handler = bot.on_message
+
+        async def on_message(message):
+            try:
+                await handler(message)
+            finally:
+                started = self.injected.pop(message.id, None)
+                if started is not None:
+                    self.on_message_latency.append(time.perf_counter() - started)
+
+        bot.on_message = on_message
+
+    def client(self):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = self.flask_app.app.test_client()
+        return client
+
+    async def replay(self, schedule):
+        loop = asyncio.get_running_loop()
+        channel_ids = self.gateway.channel_ids
+        started = loop.time()
+        previous_ms = 0
+        for offset, channel_index, content in schedule:
+            target = started + offset
+            delay = target - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.ingest_lag.append(max(0.0, loop.time() - target))
+            # 虛擬時鐘與排程同步前進，訊息時間戳與實際執行速度無關
+            offset_ms = round(offset * 1000)
+            self.gateway.advance(offset_ms - previous_ms)
+            previous_ms = offset_ms
+            # 處理器在下次讓出事件迴圈後才會執行，事件送出後再記錄 ID 即可
+            injected = time.perf_counter()
+            message_id = self.gateway.feed_message(channel_ids[channel_index], content)
+            self.injected[message_id] = injected
+
+    def poll(self, poller_index):
+        # 模擬一個開著控制面板的使用者，輪詢固定的頻道
+        channel_id = self.gateway.channel_ids[poller_index % len(self.gateway.channel_ids)]
+        after_id = None
+        while not self.stopping.is_set():
+            started = time.perf_counter()
+            response = self.client().get(f'/messages/{channel_id}',
+                                         query_string={'after_id': after_id} if after_id else None)
+            self.poll_latency.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                self.poll_errors += 1
+            else:
+                messages = response.get_json()
+                if messages:
+                    after_id = messages[-1]['id']
+            self.stopping.wait(self.args.poll_interval)
+
+    def send(self, channel_id, content):
+        started = time.perf_counter()
+        response = self.client().post('/send-message',
+                                      json={'channel_id': str(channel_id), 'content': content})
+        self.send_latency.append(time.perf_counter() - started)
+        if response.status_code != 202:
+            self.send_errors += 1
+        else:
+            self.job_ids.append(response.get_json()['job_id'])
+
+    async def senders(self, pool):
+        if not self.args.send_rate:
+            return
+        loop = asyncio.get_running_loop()
+        rng = random.Random(self.args.seed + 1)
+        total = int(self.args.send_rate * self.args.duration)
+        started = loop.time()
+        pending = []
+        for index in range(total):
+            delay = started + index / self.args.send_rate - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            channel_id = rng.choice(self.gateway.channel_ids)
+            pending.append(loop.run_in_executor(pool, self.send, channel_id, f'broadcast {index}'))
+        await asyncio.gather(*pending)
+
+    async def drain_jobs(self, timeout):
+        deadline = time.monotonic() + timeout
+        dispatcher = self.discord_bot.dispatcher
+        while time.monotonic() < deadline:
+            jobs = [dispatcher.get_job(job_id) for job_id in self.job_ids]
+            if all(job and job['status'] in ('sent', 'failed') for job in jobs):
+                break
+            await asyncio.sleep(0.05)
+        jobs = [dispatcher.get_job(job_id) for job_id in self.job_ids]
+        return [job for job in jobs if job]
+
+    async def run(self, schedule):
+        loop = asyncio.get_running_loop()
+        self.instrument()
+        pool = ThreadPoolExecutor(max_workers=self.args.pollers + 8)
+        pollers = [loop.run_in_executor(pool, self.poll, index)
+                   for index in range(self.args.pollers)]
+
+        cpu_started = time.process_time()
+        wall_started = time.perf_counter()
+        await asyncio.gather(self.replay(schedule), self.senders(pool))
+        # 等待已排程的事件處理完成
+        while self.injected and time.perf_counter() - wall_started < self.args.duration + 30:
+            await asyncio.sleep(0.01)
+        wall = time.perf_counter() - wall_started
+        cpu = time.process_time() - cpu_started
+
+        self.stopping.set()
+        await asyncio.gather(*pollers)
+        jobs = await self.drain_jobs(self.args.drain_timeout)
+        pool.shutdown()
+
+        job_latency = [job['latency_ms'] / 1000 for job in jobs if job['status'] == 'sent']
+        return {
+            'config': {key: value for key, value in vars(self.args).items() if key != 'json'},
+            'messages': len(schedule),
+            'wall_seconds': wall,
+            'throughput_per_second': len(schedule) / wall if wall else 0.0,
+            'on_message': summarize(self.on_message_latency),
+            'ingest_lag': summarize(self.ingest_lag),
+            'get_messages': dict(summarize(self.poll_latency), errors=self.poll_errors),
+            'send_message': dict(summarize(self.send_latency), errors=self.send_errors),
+            'send_job': dict(summarize(job_latency),
+                             failed=sum(1 for job in jobs if job['status'] == 'failed'),
+                             unfinished=len(self.job_ids) - len(job_latency)),
+            'cpu_seconds': cpu,
+            'cpu_percent': cpu / wall * 100 if wall else 0.0,
+            'rss_bytes': current_rss(),
+            'peak_rss_bytes': peak_rss(),
+            'rest_calls': dict(self.gateway.rest.calls),
+            'dispatcher': {key: value for key, value in self.discord_bot.dispatcher.get_stats().items()
+                           if key != 'queued'},
+            'persistence': self.discord_bot.get_persistence_stats(),
+        }
+
+
+def print_report(result):
+    config = result['config']
+    print(f"rate={config['rate']}/s channels={config['channels']} duration={config['duration']}s "
+          f"pollers={config['pollers']} send_rate={config['send_rate']}/s "
+          f"rest_latency={config['rest_latency']}s seed={config['seed']}")
+    print(f"{'path':<16}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name in ('on_message', 'ingest_lag', 'get_messages', 'send_message', 'send_job'):
+        row = result[name]
+        print(f"{name:<16}{row['count']:>8}{row['p50_ms']:>10.2f}"
+              f"{row['p99_ms']:>10.2f}{row['max_ms']:>10.2f}")
+    print(f"throughput: {result['throughput_per_second']:.1f} msg/s "
+          f"over {result['wall_seconds']:.2f}s")
+    print(f"cpu: {result['cpu_seconds']:.2f}s ({result['cpu_percent']:.1f}% of one core)")
+    if result['rss_bytes'] is not None or result['peak_rss_bytes'] is not None:
+        rss = (result['rss_bytes'] or 0) / 2 ** 20
+        peak = (result['peak_rss_bytes'] or 0) / 2 ** 20
+        print(f"rss: {rss:.1f} MiB (peak {peak:.1f} MiB)")
+    print(f"rest calls: {result['rest_calls']}")
+    print(f"dispatcher: {result['dispatcher']}")
+    print(f"persistence: flushed {result['persistence'].get('flushed_messages', 0)} messages "
+          f"in {result['persistence'].get('flushed_batches', 0)} batches, "
+          f"dropped {result['persistence'].get('dropped', 0)}")
+    print(f"errors: get_messages={result['get_messages']['errors']} "
+          f"send_message={result['send_message']['errors']} "
+          f"send_job_failed={result['send_job']['failed']}")
+
+
+async def run(args):
+    # 機器人會在工作目錄下建立 log/，在暫存目錄中執行以免影響正式資料
+    with tempfile.TemporaryDirectory() as workdir:
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            discord_bot = DiscordBot('benchmark-token')
+            gateway = FakeGateway(discord_bot, args.rest_latency, args.rest_jitter, args.seed)
+            await gateway.connect(guilds=args.guilds,
+                                  channels_per_guild=-(-args.channels // args.guilds),
+                                  messages_per_channel=args.history)
+            discord_bot.writer.start()
+            load = LoadRun(args, discord_bot, gateway)
+            try:
+                return await load.run(build_schedule(args))
+            finally:
+                await discord_bot.close_bot()
+        finally:
+            os.chdir(cwd)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rate', type=float, default=200, help='每秒重播的訊息數')
+    parser.add_argument('--channels', type=int, default=20, help='訊息分散的頻道數')
+    parser.add_argument('--guilds', type=int, default=1)
+    parser.add_argument('--duration', type=float, default=10, help='重播秒數')
+    parser.add_argument('--history', type=int, default=20,
+                        help='每個頻道在連線前已有的訊息數（只能透過 REST 取得）')
+    parser.add_argument('--command-ratio', type=float, default=0.02,
+                        help='訊息中為 !ping 命令的比例')
+    parser.add_argument('--pollers', type=int, default=4, help='同時輪詢的控制面板數')
+    parser.add_argument('--poll-interval', type=float, default=0.5)
+    parser.add_argument('--send-rate', type=float, default=5,
+                        help='每秒透過控制面板發送的訊息數')
+    parser.add_argument('--rest-latency', type=float, default=0.05,
+                        help='模擬 Discord REST 呼叫的延遲（秒）')
+    parser.add_argument('--rest-jitter', type=float, default=0.0,
+                        help='REST 延遲的隨機抖動上限（秒），由種子決定')
+    parser.add_argument('--drain-timeout', type=float, default=30,
+                        help='結束後等待發送佇列清空的秒數')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--log-level', default='INFO')
+    parser.add_argument('--log-sample-every', type=int, default=1)
+    parser.add_argument('--json', help='將結果寫入 JSON 檔案，方便與之前的結果比較')
+    args = parser.parse_args()
+
+    # 使用與正式環境相同的日誌管線，讓日誌成本反映在結果中
+    setup_logging(args.log_level, args.log_sample_every)
+
+    result = asyncio.run(run(args))
+    stop_logging()
+    print_report(result)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
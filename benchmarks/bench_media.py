@@ -0,0 +1,96 @@
+"""
+量測媒體代理的頁面大小與重複瀏覽延遲
+
+對本機的假 CDN 比較：
+- 直接載入原始圖片（舊做法）
+- 第一次經過 /media 載入縮圖（需要向 CDN 讀取並縮圖）
+- 再次載入（磁碟快取命中）
+- 帶 If-None-Match 的重新驗證（304，不讀取磁碟）
+
+用法：
+    python -m benchmarks.bench_media [--images 50] [--width 320] [--cdn-latency 0.05]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import urllib.request
+from urllib.parse import quote, urlsplit
+
+from web.app import FlaskApp
+from web.media import Image, MediaCache
+from .fake_cdn import FakeCDN
+from .fake_discord import build_world, start_loop_thread
+
+
+def timed_requests(client, paths, headers=None):
+    started = time.perf_counter()
+    total = 0
+    statuses = {}
+    etags = []
+    for path in paths:
+        response = client.get(path, headers=headers or {})
+        total += len(response.data)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        etags.append(response.headers.get('ETag'))
+    elapsed = time.perf_counter() - started
+    return elapsed / len(paths) * 1000, total, statuses, etags
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=50)
+    parser.add_argument('--width', type=int, default=320, help='縮圖寬度')
+    parser.add_argument('--cdn-latency', type=float, default=0.05, help='假 CDN 的回應延遲（秒）')
+    args = parser.parse_args()
+
+    cdn = FakeCDN(latency=args.cdn_latency).start()
+    urls = [cdn.attachment_url(2000, 900000 + index) for index in range(args.images)]
+    # 先產生圖片，兩種做法都只量測傳輸與快取
+    for url in urls:
+        cdn.image(urlsplit(url).path, cdn.size)
+
+    started = time.perf_counter()
+    direct_bytes = sum(len(urllib.request.urlopen(url).read()) for url in urls)
+    direct_ms = (time.perf_counter() - started) / len(urls) * 1000
+
+    with tempfile.TemporaryDirectory() as workdir:
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            flask_app = FlaskApp(build_world(start_loop_thread()))
+            flask_app.routes.media = MediaCache('media', 256 * 1024 * 1024, (cdn.origin,))
+            client = flask_app.app.test_client()
+            paths = [f'/media?url={quote(url, safe="")}&w={args.width}' for url in urls]
+
+            cold_ms, cold_bytes, cold_status, etags = timed_requests(client, paths)
+            cdn_requests = cdn.requests
+            # CDN 網址的簽章參數改變後仍命中同一個附件 ID
+            warm_paths = [f'/media?url={quote(cdn.attachment_url(2000, 900000 + index), safe="")}'
+                          f'&w={args.width}' for index in range(args.images)]
+            warm_ms, warm_bytes, warm_status, _ = timed_requests(client, warm_paths)
+            revalidate = [timed_requests(client, [path], {'If-None-Match': etag})
+                          for path, etag in zip(warm_paths, etags)]
+        finally:
+            os.chdir(cwd)
+            cdn.stop()
+
+    revalidate_ms = sum(result[0] for result in revalidate) / len(revalidate)
+    revalidate_status = {}
+    for result in revalidate:
+        for status, count in result[2].items():
+            revalidate_status[status] = revalidate_status.get(status, 0) + count
+
+    print(f"thumbnails: {'Pillow' if Image is not None else 'disabled (Pillow not installed)'}")
+    print(f"direct from CDN: {direct_bytes / 1024:.0f} KiB, {direct_ms:.2f} ms/image")
+    print(f"/media cold:     {cold_bytes / 1024:.0f} KiB, {cold_ms:.2f} ms/image {cold_status}")
+    print(f"/media warm:     {warm_bytes / 1024:.0f} KiB, {warm_ms:.2f} ms/image {warm_status}")
+    print(f"/media 304:      {revalidate_ms:.2f} ms/image {revalidate_status}")
+    print(f"CDN requests: cold pass {cdn_requests - len(urls)}, "
+          f"warm and 304 passes {cdn.requests - cdn_requests}")
+
+
+if __name__ == '__main__':
+    main()
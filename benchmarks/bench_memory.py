@@ -0,0 +1,116 @@
+"""
+量測各執行設定檔的記憶體用量
+
+每個設定檔在獨立的子程序中執行：以假 Gateway 建立伺服器（GUILD_CREATE）並送出訊息
+（MESSAGE_CREATE），事件經過 discord.py 的 ConnectionState 與 setup_events 的處理器，
+和正式環境相同。部分頻道模擬有人在控制面板中瀏覽（頻道快取已載入）。
+
+輸出每個設定檔的基準 RSS，以及換算為每 10k 個伺服器與每 100k 則訊息增加的 RSS。
+
+用法：
+    python -m benchmarks.bench_memory [--guilds 10000] [--channels-per-guild 5]
+        [--messages 100000] [--watched 200] [--profiles default,lean]
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from .bench_load import WORDS, current_rss
+
+GUILD_UNIT = 10000
+MESSAGE_UNIT = 100000
+
+
+async def measure(args):
+    # 在子程序中執行，輸出一行 JSON
+    from bot import DiscordBot
+    from bot.core.profile import get_profile
+    from .fake_gateway import FakeGateway
+
+    os.chdir(tempfile.mkdtemp())
+    gc.collect()
+    imported = current_rss()
+    discord_bot = DiscordBot('benchmark', profile=get_profile(args.child))
+    discord_bot.writer.start()
+    gateway = FakeGateway(discord_bot)
+    gc.collect()
+    base = current_rss()
+
+    await gateway.connect(guilds=args.guilds, channels_per_guild=args.channels_per_guild,
+                          messages_per_channel=0)
+    gc.collect()
+    with_guilds = current_rss()
+
+    # 控制面板中瀏覽的頻道，新訊息會寫入頻道快取
+    channel_ids = gateway.channel_ids
+    for channel_id in channel_ids[:args.watched]:
+        discord_bot.message_cache.fill(str(channel_id), [])
+    for index in range(args.messages):
+        channel_id = channel_ids[index % args.watched] if index % 2 else channel_ids[
+            (index * 7919) % len(channel_ids)]
+        gateway.feed_message(channel_id, f'{WORDS[index % len(WORDS)]} {index}')
+        if index % 500 == 0:
+            # 假 Gateway 為 REST 保存所有訊息資料，量測時不需要
+            gateway.stored.clear()
+            await asyncio.sleep(0)
+    gateway.stored.clear()
+    await asyncio.sleep(0.1)
+    await discord_bot.writer.close()
+    gc.collect()
+    with_messages = current_rss()
+
+    print(json.dumps({
+        'profile': args.child,
+        'imported': imported,
+        'base': base,
+        'guilds': with_guilds - base,
+        'messages': with_messages - with_guilds,
+        'discord_py_messages': len(discord_bot.bot.cached_messages),
+        'history': len(discord_bot.message_history),
+        'cached_channels': len(discord_bot.message_cache.export()),
+    }))
+    discord_bot.journal.close()
+    discord_bot.archive.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--guilds', type=int, default=GUILD_UNIT)
+    parser.add_argument('--channels-per-guild', type=int, default=5)
+    parser.add_argument('--messages', type=int, default=MESSAGE_UNIT)
+    parser.add_argument('--watched', type=int, default=200, help='控制面板中瀏覽的頻道數')
+    parser.add_argument('--profiles', default='default,lean')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        asyncio.run(measure(args))
+        return
+
+    mib = 1024 * 1024
+    print(f"{args.guilds} guilds x {args.channels_per_guild} channels, "
+          f"{args.messages} messages, {args.watched} watched channels")
+    for profile in args.profiles.split(','):
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_memory', '--child', profile,
+             '--guilds', str(args.guilds), '--channels-per-guild', str(args.channels_per_guild),
+             '--messages', str(args.messages), '--watched', str(args.watched)],
+            check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        per_guilds = result['guilds'] / args.guilds * GUILD_UNIT / mib
+        per_messages = result['messages'] / args.messages * MESSAGE_UNIT / mib
+        print(f"{profile:<8} base {result['base'] / mib:6.1f} MiB, "
+              f"{per_guilds:6.1f} MiB per 10k guilds, {per_messages:6.1f} MiB per 100k messages "
+              f"(discord.py cache {result['discord_py_messages']}, "
+              f"history {result['history']}, panel channels {result['cached_channels']})")
+
+
+if __name__ == '__main__':
+    main()
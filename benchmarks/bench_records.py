@@ -0,0 +1,115 @@
+"""
+量測訊息紀錄的記憶體用量與 JSON 編碼成本
+
+比較舊的做法（控制面板與訊息歷史各保存一份巢狀字典，每次回應都重新編碼）
+與精簡的 MessageRecord（共用一個紀錄，JSON 編碼只產生一次）。
+
+用法：
+    python -m benchmarks.bench_records [--messages 100000] [--authors 200] [--polls 20]
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+from bot.core.serializer import encode_messages, serialize_message
+from .bench_load import WORDS
+from .fake_discord import FakeChannel, FakeGuild, FakeMessage, FakeUser, make_snowflake
+from .fake_gateway import VIRTUAL_EPOCH_MS
+
+
+def legacy_panel(message):
+    # 舊版 serialize_message 產生的控制面板字典
+    return {
+        'id': str(message.id),
+        'content': message.content,
+        'author': {
+            'id': str(message.author.id),
+            'name': message.author.name,
+            'avatar': str(message.author.avatar.url) if message.author.avatar else None
+        },
+        'timestamp': message.created_at.isoformat(),
+        'attachments': []
+    }
+
+
+def legacy_history(message):
+    # 舊版 on_message 另外建立的訊息歷史字典
+    return {
+        'id': str(message.id),
+        'author': str(message.author),
+        'author_id': str(message.author.id),
+        'content': message.content,
+        'timestamp': message.created_at.isoformat(),
+        'channel_id': str(message.channel.id),
+        'channel_name': str(message.channel.name),
+        'guild_id': str(message.guild.id) if message.guild else None,
+        'guild_name': str(message.guild.name) if message.guild else None,
+        'attachments': []
+    }
+
+
+def build_messages(args, rng):
+    guild = FakeGuild(1000)
+    channels = [FakeChannel(2000 + index, guild) for index in range(20)]
+    authors = [FakeUser(3000 + index) for index in range(args.authors)]
+    messages = []
+    for index in range(args.messages):
+        content = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 12)))
+        messages.append(FakeMessage(make_snowflake(VIRTUAL_EPOCH_MS + index, index),
+                                    rng.choice(channels), rng.choice(authors), content))
+    return messages
+
+
+def measure_memory(function, messages):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = function(messages)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return kept, (after - before) / len(messages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--authors', type=int, default=200)
+    parser.add_argument('--polls', type=int, default=20, help='每頁 100 則訊息的回應次數')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    messages = build_messages(args, random.Random(args.seed))
+    legacy, legacy_bytes = measure_memory(
+        lambda items: [(legacy_panel(message), legacy_history(message)) for message in items],
+        messages)
+    records, record_bytes = measure_memory(
+        lambda items: [serialize_message(message) for message in items], messages)
+    print(f"memory per message: legacy {legacy_bytes:.0f} B, record {record_bytes:.0f} B "
+          f"({record_bytes / legacy_bytes:.0%})")
+
+    page = 100
+    pages = [index * page for index in range(min(args.polls, len(messages) // page))]
+    started = time.perf_counter()
+    for start in pages:
+        json.dumps([panel for panel, _ in legacy[start:start + page]], ensure_ascii=False)
+    legacy_seconds = time.perf_counter() - started
+
+    for start in pages:
+        encode_messages(records[start:start + page])
+    started = time.perf_counter()
+    for start in pages:
+        encode_messages(records[start:start + page])
+    record_seconds = time.perf_counter() - started
+    print(f"encode {page} messages: legacy {legacy_seconds / len(pages) * 1000:.3f} ms, "
+          f"cached {record_seconds / len(pages) * 1000:.3f} ms")
+    encoded = [record.panel_json() for record in records[:pages[-1] + page]]
+    print(f"cached JSON adds {sum(map(sys.getsizeof, encoded)) / len(encoded):.0f} B "
+          f"per message that has been served")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+比較 werkzeug 執行緒伺服器與非同步伺服器的併發吞吐量
+
+用法：
+    python -m benchmarks.bench_web_server [--requests 2000] [--concurrency 50] [--rest-latency 0.05]
+"""
+
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+
+import aiohttp
+
+from web.app import FlaskApp
+from web.async_server import AsyncPanelServer
+from .fake_discord import build_world, start_loop_thread
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(len(ordered) * fraction))
+    return ordered[index]
+
+
+async def run_load(base_url, paths, concurrency):
+    latencies = []
+    errors = 0
+    queue = asyncio.Queue()
+    for path in paths:
+        queue.put_nowait(path)
+
+    async def worker(session):
+        nonlocal errors
+        while not queue.empty():
+            path = queue.get_nowait()
+            started = time.perf_counter()
+            try:
+                async with session.get(base_url + path) as response:
+                    await response.read()
+                    if response.status != 200:
+                        errors += 1
+            except aiohttp.ClientError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        'requests': len(paths),
+        'errors': errors,
+        'seconds': elapsed,
+        'rps': len(paths) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'mean_ms': statistics.mean(latencies) * 1000 if latencies else 0.0,
+    }
+
+
+def build_paths(discord_bot, scenario, total):
+    channels = [channel for guild in discord_bot.bot.guilds for channel in guild.text_channels]
+    if scenario == 'cold':
+        # 每個請求都是不同的冷頻道，必須透過 REST 補齊
+        return [f'/messages/{channels[index % len(channels)].id}' for index in range(total)]
+    paths = []
+    for index in range(total):
+        if index % 2:
+            paths.append('/guilds')
+        else:
+            paths.append(f'/messages/{channels[index % 10].id}')
+    return paths
+
+
+async def bench_server(kind, scenario, args, port):
+    loop = start_loop_thread() if kind == 'threaded' else asyncio.get_running_loop()
+    channel_count = args.requests if scenario == 'cold' else 10
+    discord_bot = build_world(loop, guilds=1, channels_per_guild=channel_count,
+                              rest_latency=args.rest_latency)
+    flask_app = FlaskApp(discord_bot)
+
+    if kind == 'threaded':
+        flask_app.start(args.host, port)
+    else:
+        server = AsyncPanelServer(flask_app, host=args.host, port=port)
+        await server.start()
+
+    base_url = f'http://{args.host}:{port}'
+    try:
+        if scenario == 'warm':
+            # 先暖機，讓快取載入
+            await run_load(base_url, build_paths(discord_bot, 'warm', 20), 1)
+        return await run_load(base_url, build_paths(discord_bot, scenario, args.requests),
+                              args.concurrency)
+    finally:
+        if kind == 'threaded':
+            flask_app.shutdown()
+            loop.call_soon_threadsafe(loop.stop)
+        else:
+            await server.shutdown()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--rest-latency', type=float, default=0.05,
+                        help='模擬 Discord REST 呼叫的延遲（秒）')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5100)
+    args = parser.parse_args()
+
+    # 只顯示測試結果
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    port = args.port
+    print(f"{'server':<10}{'scenario':<10}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for scenario in ('warm', 'cold'):
+        for kind in ('threaded', 'async'):
+            result = await bench_server(kind, scenario, args, port)
+            port += 1
+            print(f"{kind:<10}{scenario:<10}{result['rps']:>10.1f}"
+                  f"{result['p50_ms']:>10.2f}{result['p99_ms']:>10.2f}{result['errors']:>8}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,112 @@
+"""
+本機的假 Discord CDN，供媒體代理的測試與效能量測使用
+
+路徑與 Discord CDN 相同：
+    /attachments/<頻道 ID>/<附件 ID>/<檔名>.png?ex=...&hm=...
+    /avatars/<使用者 ID>/<雜湊值>.png
+回應的 PNG 依路徑產生，內容固定，可指定尺寸（?size=寬x高）與回應延遲。
+"""
+
+import hashlib
+import random
+import struct
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+def make_png(width, height, seed=b''):
+    # 不依賴 Pillow 產生 RGB PNG；以雜訊填滿，壓縮後的大小接近一般照片
+    noise = random.Random(hashlib.blake2b(seed).digest())
+    rows = [b'\x00' + noise.randbytes(width * 3) for _ in range(height)]
+
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data
+                + struct.pack('>I', zlib.crc32(kind + data) & 0xFFFFFFFF))
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header)
+            + chunk(b'IDAT', zlib.compress(b''.join(rows), 6)) + chunk(b'IEND', b''))
+
+
+class FakeCDN:
+    # 在背景執行緒執行的 HTTP 伺服器，記錄收到的請求數
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, size=(1024, 768)):
+        self.latency = latency
+        self.size = size
+        self.requests = 0
+        self.bytes_sent = 0
+        self._images = {}
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def origin(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def attachment_url(self, channel_id, attachment_id, filename='image.png'):
+        # 模擬 CDN 網址中每次都不同的簽章參數
+        return (f'{self.origin}/attachments/{channel_id}/{attachment_id}/{filename}'
+                f'?ex={int(time.time()):x}&hm={attachment_id:x}')
+
+    def avatar_url(self, user_id, avatar_hash='a1b2c3'):
+        return f'{self.origin}/avatars/{user_id}/{avatar_hash}.png?size=128'
+
+    def image(self, path, size):
+        key = (path, size)
+        with self._lock:
+            body = self._images.get(key)
+        if body is None:
+            body = make_png(size[0], size[1], path.encode('utf-8'))
+            with self._lock:
+                self._images[key] = body
+        return body
+
+    def _handler(self):
+        cdn = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                with cdn._lock:
+                    cdn.requests += 1
+                if cdn.latency:
+                    time.sleep(cdn.latency)
+                if not parts.path.startswith(('/attachments/', '/avatars/')):
+                    self.send_error(404)
+                    return
+                size = cdn.size
+                requested = parse_qs(parts.query).get('size')
+                if requested and 'x' in requested[0]:
+                    width, height = requested[0].split('x', 1)
+                    size = (int(width), int(height))
+                elif parts.path.startswith('/avatars/'):
+                    size = (128, 128)
+                body = cdn.image(parts.path, size)
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/png')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                with cdn._lock:
+                    cdn.bytes_sent += len(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='FakeCDN',
+                                       daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
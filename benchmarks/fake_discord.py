@@ -0,0 +1,153 @@
+import asyncio
+import datetime
+import threading
+
+from bot.core.cache import ChannelMessageCache
+from bot.core.directory import GuildDirectory
+from bot.core.dispatcher import OutboundDispatcher
+from bot.core.hub import MessageHub
+from bot.core.singleflight import SingleFlight
+
+# Discord 的 epoch（2015-01-01），用於產生 snowflake ID
+DISCORD_EPOCH_MS = 1420070400000
+
+
+def make_snowflake(timestamp_ms, sequence=0):
+    return ((timestamp_ms - DISCORD_EPOCH_MS) << 22) | (sequence & 0xFFF)
+
+
+class FakeUser:
+    def __init__(self, user_id, name=None):
+        self.id = user_id
+        self.name = name or f'user{user_id}'
+        self.avatar = None
+        self.bot = False
+
+    def __str__(self):
+        return self.name
+
+
+class FakeMessage:
+    def __init__(self, message_id, channel, author, content):
+        self.id = message_id
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+        self.attachments = []
+        self.created_at = datetime.datetime.fromtimestamp(
+            ((message_id >> 22) + DISCORD_EPOCH_MS) / 1000, datetime.timezone.utc)
+
+
+class FakeChannel:
+    # 模擬文字頻道與其 REST API（history / send）
+    def __init__(self, channel_id, guild, rest_latency=0.0):
+        self.id = channel_id
+        self.name = f'channel{channel_id}'
+        self.guild = guild
+        self.position = len(guild.text_channels)
+        self.rest_latency = rest_latency
+        self.messages = []
+        self.rest_calls = 0
+        self.sent = []
+
+    @property
+    def last_message_id(self):
+        return self.messages[-1].id if self.messages else None
+
+    async def history(self, limit=100, after=None, before=None, oldest_first=None):
+        self.rest_calls += 1
+        if self.rest_latency:
+            await asyncio.sleep(self.rest_latency)
+        messages = [message for message in self.messages
+                    if (after is None or message.id > after.id)
+                    and (before is None or message.id < before.id)]
+        if oldest_first or (oldest_first is None and after is not None):
+            selected = messages[:limit]
+        else:
+            selected = list(reversed(messages))[:limit]
+        for message in selected:
+            yield message
+
+    async def send(self, content):
+        self.rest_calls += 1
+        if self.rest_latency:
+            await asyncio.sleep(self.rest_latency)
+        self.sent.append(content)
+        return None
+
+
+class FakeGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+        self.name = f'guild{guild_id}'
+        self.icon = None
+        self.member_count = 0
+        self.text_channels = []
+
+
+class FakeBot:
+    # 模擬 commands.Bot 中控制面板會用到的部分
+    def __init__(self, loop):
+        self.loop = loop
+        self.guilds = []
+        self.user = FakeUser(1, 'bot')
+        self._guilds = {}
+        self._channels = {}
+
+    def get_guild(self, guild_id):
+        return self._guilds.get(guild_id)
+
+    def get_channel(self, channel_id):
+        return self._channels.get(channel_id)
+
+    def add_guild(self, guild):
+        self.guilds.append(guild)
+        self._guilds[guild.id] = guild
+        for channel in guild.text_channels:
+            self._channels[channel.id] = channel
+
+
+class FakeDiscordBot:
+    # 模擬 DiscordBot，只包含控制面板需要的屬性
+    def __init__(self, bot):
+        self.bot = bot
+        self.hub = MessageHub()
+        self.message_cache = ChannelMessageCache()
+        self.directory = GuildDirectory()
+        self.dispatcher = OutboundDispatcher(bot)
+        self.history_requests = SingleFlight()
+
+    def get_persistence_stats(self):
+        return {}
+
+
+def build_world(loop, guilds=1, channels_per_guild=10, messages_per_channel=20,
+                rest_latency=0.0):
+    # 建立含有指定數量伺服器、頻道與訊息的假 Discord 環境
+    bot = FakeBot(loop)
+    author = FakeUser(2, 'tester')
+    now_ms = DISCORD_EPOCH_MS + 300 * 24 * 3600 * 1000
+    next_id = 1000
+    for guild_index in range(guilds):
+        guild = FakeGuild(next_id)
+        next_id += 1
+        for _ in range(channels_per_guild):
+            channel = FakeChannel(next_id, guild, rest_latency)
+            next_id += 1
+            for sequence in range(messages_per_channel):
+                now_ms += 1
+                message_id = make_snowflake(now_ms, sequence)
+                channel.messages.append(
+                    FakeMessage(message_id, channel, author, f'message {sequence}'))
+            guild.text_channels.append(channel)
+        bot.add_guild(guild)
+    return FakeDiscordBot(bot)
+
+
+def start_loop_thread():
+    # 在背景執行緒執行事件迴圈，模擬機器人的事件迴圈
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, name='FakeBotLoop', daemon=True)
+    thread.start()
+    return loop
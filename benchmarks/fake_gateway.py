@@ -0,0 +1,163 @@
+import asyncio
+import datetime
+import random
+
+import discord
+
+from .fake_discord import DISCORD_EPOCH_MS, make_snowflake
+
+# 模擬環境的起始時間，讓每次產生的 snowflake ID 都相同
+VIRTUAL_EPOCH_MS = DISCORD_EPOCH_MS + 300 * 24 * 3600 * 1000
+
+BOT_USER = {'id': '1', 'username': 'bot', 'discriminator': '0', 'avatar': None, 'bot': True}
+
+
+def user_payload(user_id):
+    return {'id': str(user_id), 'username': f'user{user_id}', 'discriminator': '0',
+            'avatar': None, 'global_name': None}
+
+
+def message_payload(message_id, channel_id, guild_id, author, content):
+    # 與 Discord Gateway 的 MESSAGE_CREATE 相同格式的訊息資料
+    timestamp = datetime.datetime.fromtimestamp(
+        ((message_id >> 22) + DISCORD_EPOCH_MS) / 1000, datetime.timezone.utc)
+    return {
+        'id': str(message_id),
+        'channel_id': str(channel_id),
+        'guild_id': str(guild_id),
+        'author': author,
+        'content': content,
+        'timestamp': timestamp.isoformat(),
+        'edited_timestamp': None,
+        'tts': False,
+        'mention_everyone': False,
+        'mentions': [],
+        'mention_roles': [],
+        'attachments': [],
+        'embeds': [],
+        'pinned': False,
+        'type': 0,
+    }
+
+
+class FakeREST:
+    # 取代 discord.py 的 HTTPClient，只實作機器人與控制面板會呼叫的 REST API
+    # 每個呼叫都等待固定延遲加上以種子產生的抖動，結果可重現
+    def __init__(self, gateway, latency=0.0, jitter=0.0, seed=0):
+        self.gateway = gateway
+        self.latency = latency
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.calls = {'logs_from': 0, 'send_message': 0}
+        self.loop = None
+
+    async def _wait(self):
+        delay = self.latency + (self.random.random() * self.jitter if self.jitter else 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+
+    async def logs_from(self, channel_id, limit, before=None, after=None, around=None):
+        # 與 Discord 相同，一律由新到舊返回
+        self.calls['logs_from'] += 1
+        await self._wait()
+        stored = self.gateway.stored.get(int(channel_id), [])
+        selected = [payload for payload in stored
+                    if (after is None or int(payload['id']) > int(after))
+                    and (before is None or int(payload['id']) < int(before))]
+        if after is not None and before is None:
+            selected = selected[:limit]
+        else:
+            selected = selected[-limit:]
+        return list(reversed(selected))
+
+    async def send_message(self, channel_id, *, params):
+        self.calls['send_message'] += 1
+        await self._wait()
+        payload = self.gateway.create_payload(int(channel_id), BOT_USER,
+                                              params.payload.get('content') or '')
+        # Discord 會把機器人自己發送的訊息也透過 Gateway 推送回來
+        asyncio.get_running_loop().call_soon(self.gateway.dispatch_payload, payload)
+        return payload
+
+    async def close(self):
+        pass
+
+
+class FakeGateway:
+    # 以原始 Gateway 事件驅動真正的 commands.Bot，不需要 Discord 令牌
+    # 事件經過 discord.py 的 ConnectionState 解析，setup_events 與 setup_commands
+    # 註冊的處理器會收到與正式環境相同的物件
+    def __init__(self, discord_bot, rest_latency=0.0, rest_jitter=0.0, seed=0):
+        self.discord_bot = discord_bot
+        self.bot = discord_bot.bot
+        self.state = self.bot._connection
+        self.rest = FakeREST(self, rest_latency, rest_jitter, seed)
+        self.random = random.Random(seed)
+        self.stored = {}
+        self.guild_of = {}
+        self.channel_ids = []
+        self.clock_ms = VIRTUAL_EPOCH_MS
+        self.sequence = 0
+
+    def next_id(self):
+        # 以虛擬時鐘產生遞增的 snowflake，不受實際時間影響
+        self.sequence += 1
+        if self.sequence & 0xFFF == 0:
+            self.clock_ms += 1
+        return make_snowflake(self.clock_ms, self.sequence)
+
+    def advance(self, milliseconds):
+        self.clock_ms += milliseconds
+
+    def create_payload(self, channel_id, author, content):
+        payload = message_payload(self.next_id(), channel_id, self.guild_of[channel_id],
+                                  author, content)
+        self.stored.setdefault(channel_id, []).append(payload)
+        return payload
+
+    async def connect(self, guilds=1, channels_per_guild=10, messages_per_channel=20):
+        # 相當於登入並收到 READY 與 GUILD_CREATE
+        await self.bot._async_setup_hook()
+        self.rest.loop = asyncio.get_running_loop()
+        self.bot.http = self.state.http = self.rest
+        self.state.user = discord.ClientUser(state=self.state, data=BOT_USER)
+
+        next_id = 1000
+        for _ in range(guilds):
+            guild_id = next_id
+            next_id += 1
+            channels = []
+            for position in range(channels_per_guild):
+                channel_id = next_id
+                next_id += 1
+                channels.append({'id': str(channel_id), 'type': 0, 'name': f'channel{channel_id}',
+                                 'position': position, 'guild_id': str(guild_id),
+                                 'permission_overwrites': []})
+                self.guild_of[channel_id] = guild_id
+                self.channel_ids.append(channel_id)
+            self.state._add_guild_from_data({
+                'id': str(guild_id), 'name': f'guild{guild_id}', 'icon': None,
+                'channels': channels, 'roles': [], 'members': [], 'member_count': 1,
+                'emojis': [], 'stickers': [], 'features': [],
+            })
+
+        # 頻道在連線前已有的訊息，只能透過 REST 取得
+        for channel_id in self.channel_ids:
+            for index in range(messages_per_channel):
+                self.create_payload(channel_id, user_payload(2), f'history {index}')
+            self.bot.get_channel(channel_id).last_message_id = int(
+                self.stored[channel_id][-1]['id']) if messages_per_channel else None
+
+        self.bot.dispatch('ready')
+        await asyncio.sleep(0)
+
+    def dispatch_payload(self, payload):
+        self.state.parse_message_create(payload)
+
+    def feed_message(self, channel_id, content, author_id=None):
+        # 模擬收到一則 MESSAGE_CREATE，返回訊息 ID
+        if author_id is None:
+            author_id = 2 + self.random.randrange(50)
+        payload = self.create_payload(channel_id, user_payload(author_id), content)
+        self.dispatch_payload(payload)
+        return int(payload['id'])
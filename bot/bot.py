@@ -4,16 +4,36 @@ Discord 機器人主模組
 此模組包含 Discord 機器人的主要類別和功能。
 """
 
+import asyncio
 import json
 import os
-from datetime import datetime
 from typing import List, Dict, Optional, Any
 import discord
 from discord.ext import commands
 
 from .core.logger import logger
+from .core.archive import MessageArchive
+from .core.journal import MessageJournal
+from .core.persistence import MessageWriter
+from .core.hub import MessageHub
+from .core.cache import ChannelMessageCache
+from .core.directory import GuildDirectory
+from .core.dispatcher import OutboundDispatcher
+from .core.export import HistoryExporter
+from .core.history import MessageRing, timestamp_to_snowflake
+from .core.serializer import MessageRecord
+from .core.shards import ShardMonitor
+from .core.profile import RuntimeProfile, get_profile
+from .core.router import CommandRouter
+from .core.singleflight import SingleFlight
+from .core.snapshot import read_snapshot, write_snapshot
+from .core.startup import startup
+from .core.metrics import (ADD_MESSAGE_SECONDS, HISTORY_QUERY_SECONDS, QUEUE_DEPTH,
+                           LoopLagMonitor, timed)
 from .handlers.events import setup_events
 from .handlers.commands import setup_commands
+from utils.config import (COMMAND_PREFIX, COMMAND_THREADS, DATA_DIR, EXPORT_CONCURRENCY,
+                          EXPORT_DIR, HISTORY_NEGATIVE_TTL, MEMORY_PROFILE, SNAPSHOT_PATH)
 
 
 class DiscordBot:
@@ -25,182 +45,302 @@ class DiscordBot:
     - 訊息歷史記錄
     """
 
-    def __init__(self, token: str) -> None:
+    def __init__(self, token: str, sharded: bool = False, shard_count: Optional[int] = None,
+                 shard_ids: Optional[List[int]] = None,
+                 profile: Optional[RuntimeProfile] = None) -> None:
         """
         初始化 Discord 機器人
 
         Args:
             token (str): Discord 機器人的令牌
+            sharded (bool): 是否使用 AutoShardedBot
+            shard_count (Optional[int]): 分片總數，None 表示由 Discord 建議
+            shard_ids (Optional[List[int]]): 此程序負責的分片 ID，None 表示全部
+            profile (Optional[RuntimeProfile]): 執行設定檔，None 表示使用 MEMORY_PROFILE
         """
         self.token = token
-        # 設置 intents
-        intents = discord.Intents.default()
-        intents.message_content = True  # 啟用訊息內容權限
-        intents.members = False  # 禁用成員權限
-        intents.presences = False  # 禁用狀態權限
-
-        # 創建 bot 實例
-        self.bot = commands.Bot(
-            command_prefix='!',
-            intents=intents,
-            help_command=None  # 禁用預設的幫助命令
+        # 執行設定檔決定 intents、discord.py 的快取與各訊息容器的大小
+        self.profile = profile or get_profile(MEMORY_PROFILE)
+        options: Dict[str, Any] = self.profile.bot_options(self.profile.intents())
+
+        # 創建 bot 實例；伺服器數量多時以 AutoShardedBot 在同一個程序中維持多個 Gateway 連線
+        bot_class = commands.Bot
+        if sharded:
+            bot_class = commands.AutoShardedBot
+            options.update(shard_count=shard_count, shard_ids=shard_ids)
+        self.bot = bot_class(
+            command_prefix=COMMAND_PREFIX,
+            help_command=None,  # 禁用預設的幫助命令
+            **options
         )
 
-        # 確保 log 目錄存在
-        self.log_dir = 'log'
+        # 確保資料目錄存在；分片分散到多個程序時各自使用不同的目錄
+        self.log_dir = DATA_DIR
         os.makedirs(self.log_dir, exist_ok=True)
 
-        self.message_history: List[Dict] = []
-        self.message_file = os.path.join(self.log_dir, 'messages.json')
-        self.max_messages = 100
-
-        # 初始化伺服器和頻道資訊字典
-        self.guilds_info: Dict[str, Dict] = {}
-
-        # 載入歷史訊息
-        self.load_messages()
+        self.max_messages = self.profile.history_size
+        # 固定容量的訊息緩衝區，記憶體用量不會隨執行時間成長
+        self.message_history = MessageRing(self.max_messages)
+        self.message_file = os.path.join(self.log_dir, 'messages.jsonl')
+        self.legacy_message_file = os.path.join(self.log_dir, 'messages.json')
+        self.journal = MessageJournal(self.message_file, keep=self.max_messages)
+        # 保存所有訊息的 SQLite 封存，供控制面板搜尋與瀏覽
+        self.archive = MessageArchive(os.path.join(self.log_dir, 'archive.db'))
+        # 訊息寫入器：在背景任務中批次寫入日誌與封存，不阻塞事件處理
+        self.writer = MessageWriter(self.journal, self.archive)
+
+        # 依頻道推送新訊息給控制面板的訂閱者
+        self.hub = MessageHub()
+        # 由 Gateway 事件更新的頻道訊息快取，供控制面板讀取
+        self.message_cache = ChannelMessageCache(self.profile.cache_per_channel,
+                                                 self.profile.cache_max_channels)
+        # 合併控制面板同時送出的相同 REST 請求，並短暫保留空結果
+        self.history_requests = SingleFlight(HISTORY_NEGATIVE_TTL)
+
+        # 具備速率限制與訊息合併的發送佇列
+        self.dispatcher = OutboundDispatcher(self.bot)
+
+        # 背景匯出完整的頻道歷史，與發送佇列共用全域速率限制
+        self.exporter = HistoryExporter(self.bot, EXPORT_DIR, EXPORT_CONCURRENCY,
+                                        self.dispatcher.global_bucket)
+
+        # 伺服器和頻道目錄，由伺服器與頻道事件逐筆更新
+        self.directory = GuildDirectory()
+
+        # 各分片的延遲、連線狀態與事件速率
+        self.shards = ShardMonitor(self.bot)
+
+        # 佇列深度在讀取指標時才計算；事件迴圈延遲由背景任務量測
+        QUEUE_DEPTH.labels('writer').set_function(self.writer.queue.qsize)
+        QUEUE_DEPTH.labels('dispatcher').set_function(self.dispatcher.queue_depth)
+        QUEUE_DEPTH.labels('hub_subscribers').set_function(
+            lambda: sum(self.hub.get_stats().values()))
+        self.loop_monitor = LoopLagMonitor()
+
+        # 從啟動快照還原訊息歷史、頻道快取與伺服器目錄；快照與日誌不一致時，啟動後在背景讀取日誌
+        self.snapshot_path = SNAPSHOT_PATH
+        self.history_current = self.restore_snapshot()
+        self._history_task: Optional[asyncio.Task] = None
 
         # 設置事件處理器
         setup_events(self.bot, self)
-        # 設置命令處理器
-        setup_commands(self.bot)
+        # 設置命令處理器；命令由 CommandRouter 分派，不經過 discord.py 的 process_commands
+        self.router = CommandRouter(COMMAND_PREFIX, COMMAND_THREADS)
+        setup_commands(self.router)
 
-        logger.info("DiscordBot 初始化完成")
+        logger.info("DiscordBot 初始化完成 (執行設定檔: %s)", self.profile.name)
 
-    def load_messages(self) -> None:
+    def restore_snapshot(self) -> bool:
         """
-        從檔案載入歷史訊息
+        從啟動快照還原訊息歷史、頻道訊息快取與伺服器目錄
+
+        Returns:
+            bool: 快照中的訊息歷史是否與日誌一致，一致時不需要再讀取日誌
         """
+        if not self.snapshot_path:
+            return False
         try:
-            if os.path.exists(self.message_file):
-                with open(self.message_file, 'r', encoding='utf-8') as f:
-                    self.message_history = json.load(f)
-                logger.debug(f"已從檔案載入 {len(self.message_history)} 條歷史訊息")
-            else:
-                logger.debug("沒有找到歷史訊息檔案")
+            snapshot = read_snapshot(self.snapshot_path)
+            if snapshot is None:
+                return False
+            records = [MessageRecord.from_wire(data) for data in snapshot['history']]
+            self.message_history.extend((self._message_key(record), record) for record in records)
+            for channel_id, messages in snapshot['channels']:
+                self.message_cache.fill(channel_id, [MessageRecord.from_wire(data) for data in messages])
+            if snapshot['directory']['guilds']:
+                self.directory.load(snapshot['directory'])
+            logger.info("已從快照還原 %s 條歷史訊息與 %s 個頻道的訊息快取",
+                        len(records), len(snapshot['channels']))
+            startup.mark('snapshot')
+            return snapshot['journal_size'] == self.journal.size
         except Exception as e:
-            logger.error(f"載入歷史訊息時發生錯誤: {e}")
-            self.message_history = []
+            logger.error("還原快照時發生錯誤: %s", e)
+            self.message_history.clear()
+            self.message_cache.clear()
+            return False
 
-    def save_messages(self) -> None:
+    def save_snapshot(self) -> None:
         """
-        保存訊息到檔案
+        將訊息歷史、頻道訊息快取與伺服器目錄寫入啟動快照，需在日誌關閉後呼叫
         """
+        if not self.snapshot_path:
+            return
         try:
-            # 只保留最新的100條訊息
-            messages_to_save = self.message_history[-self.max_messages:]
-            with open(self.message_file, 'w', encoding='utf-8') as f:
-                json.dump(messages_to_save, f, ensure_ascii=False, indent=2)
-            logger.debug(f"已保存 {len(messages_to_save)} 條訊息到檔案")
+            size = write_snapshot(self.snapshot_path, {
+                'journal_size': self.journal.size,
+                'history': [record.to_wire() for record in self.message_history.items()],
+                'channels': [(channel_id, [record.to_wire() for record in messages])
+                             for channel_id, messages in self.message_cache.export()],
+                'directory': self.directory.export(),
+            })
+            logger.info("已寫入快照 %s (%s 位元組)", self.snapshot_path, size)
         except Exception as e:
-            logger.error(f"保存訊息時發生錯誤: {e}")
+            logger.error("寫入快照時發生錯誤: %s", e)
 
-    def add_message(self, message_data: Dict) -> None:
+    async def load_history(self) -> None:
+        """
+        在背景執行緒讀取日誌尾端，完成後在事件迴圈上與目前的歷史記錄合併
         """
-        添加新訊息到歷史記錄
+        try:
+            records = await asyncio.get_running_loop().run_in_executor(None, self.read_history)
+        except Exception as e:
+            logger.error("載入歷史訊息時發生錯誤: %s", e)
+            return
+
+        # 在事件迴圈上替換緩衝區，與 add_message 不會同時執行；讀取期間收到的訊息保留下來
+        history = MessageRing(self.max_messages)
+        history.extend((self._message_key(record), record) for record in records)
+        loaded = {record.id for record in records}
+        history.extend((self._message_key(record), record)
+                       for record in self.message_history.items() if record.id not in loaded)
+        self.message_history = history
+        self.history_current = True
+        if len(history):
+            logger.debug("已從日誌載入 %s 條歷史訊息", len(history))
+        else:
+            logger.debug("沒有找到歷史訊息")
+        startup.mark('history')
+
+    def read_history(self) -> List[MessageRecord]:
+        """
+        從日誌檔案尾端讀取最新的歷史訊息，在背景執行緒執行
+
+        Returns:
+            List[MessageRecord]: 訊息紀錄
+        """
+        self.migrate_legacy_messages()
+        tail = self.journal.read_tail(self.max_messages)
+        records = [MessageRecord.from_dict(message_data) for message_data in tail]
+        # 封存建立前的歷史訊息也放入封存，已存在的會被略過
+        self.archive.insert_many(tail)
+        return records
+
+    @staticmethod
+    def _message_key(record: MessageRecord) -> int:
+        """
+        取得訊息在歷史緩衝區中的排序鍵
 
         Args:
-            message_data (Dict): 訊息資料
+            record (MessageRecord): 訊息紀錄
+
+        Returns:
+            int: 訊息的 snowflake ID；沒有 ID 的舊資料以時間戳記換算，
+                 都無法取得時使用目前時間
+        """
+        if record.id:
+            return record.id
+        key = timestamp_to_snowflake(record.timestamp)
+        return key if key is not None else discord.utils.time_snowflake(discord.utils.utcnow())
+
+    def migrate_legacy_messages(self) -> None:
+        """
+        將舊版的 messages.json 匯入日誌檔案
+        """
+        if not os.path.exists(self.legacy_message_file):
+            return
+        if os.path.getsize(self.message_file) > 0:
+            return
+
+        with open(self.legacy_message_file, 'r', encoding='utf-8') as f:
+            legacy_messages = json.load(f)
+        count = self.journal.append_many(legacy_messages)
+        os.replace(self.legacy_message_file, self.legacy_message_file + '.bak')
+        logger.info("已將 %s 條舊版歷史訊息匯入日誌", count)
+
+    @timed(ADD_MESSAGE_SECONDS)
+    def add_message(self, record: MessageRecord) -> None:
         """
-        self.message_history.append(message_data)
-        self.save_messages()
+        添加新訊息到歷史記錄，並放入寫入佇列
 
-    def get_message_history(self, after_timestamp: Optional[str] = None) -> List[Dict]:
+        Args:
+            record (MessageRecord): 訊息紀錄
+        """
+        self.message_history.append(record.id, record)
+        self.writer.enqueue(record)
+
+    def get_persistence_stats(self) -> Dict[str, Any]:
+        """
+        獲取訊息寫入佇列的統計資料
+
+        Returns:
+            Dict[str, Any]: 佇列深度、丟棄數、寫入批次數等統計資料
+        """
+        return self.writer.get_stats()
+
+    @timed(HISTORY_QUERY_SECONDS)
+    def get_message_history(self, after_id: Optional[int] = None,
+                            before_id: Optional[int] = None,
+                            limit: Optional[int] = None,
+                            after_timestamp: Optional[str] = None) -> List[Dict]:
         """
         獲取訊息歷史
 
+        有 before_id 時往回翻頁，返回 before_id 之前最新的 limit 條；
+        否則返回 after_id 之後最舊的 limit 條。結果一律由舊到新排列。
+
         Args:
-            after_timestamp (Optional[str]): 時間戳記，只返回此時間之後的訊息
+            after_id (Optional[int]): 只返回 ID 大於此值的訊息
+            before_id (Optional[int]): 只返回 ID 小於此值的訊息
+            limit (Optional[int]): 最多返回的訊息數量，None 表示不限制
+            after_timestamp (Optional[str]): 舊版的時間戳記參數，只在沒有 after_id 時使用
 
         Returns:
             List[Dict]: 訊息列表
         """
         try:
-            if after_timestamp is None:
-                logger.debug(f"獲取所有訊息歷史，共 {len(self.message_history)} 條")
-                return self.message_history
-
-            # 將時間戳記轉換為 datetime 物件進行比較
-            try:
-                # 清理時間戳記格式
-                after_timestamp = after_timestamp.strip()
-                if ' ' in after_timestamp:
-                    after_timestamp = after_timestamp.replace(' ', '+')
-                after_datetime = datetime.fromisoformat(after_timestamp)
-                logger.debug(f"過濾時間戳記之後的訊息: {after_datetime}")
-            except ValueError as e:
-                logger.error(f"時間戳記格式錯誤: {after_timestamp}, 錯誤: {e}")
-                return []
-
-            # 過濾出指定時間戳之後的訊息
-            filtered_messages = []
-            for msg in self.message_history:
-                try:
-                    msg_timestamp = datetime.fromisoformat(
-                        msg['timestamp'].replace(' ', '+'))
-                    if msg_timestamp > after_datetime:
-                        filtered_messages.append(msg)
-                except ValueError as e:
-                    logger.error(f"訊息時間戳記格式錯誤: {msg['timestamp']}, 錯誤: {e}")
-                    continue
-
-            if len(filtered_messages) == 0:
-                logger.debug(f"時間戳 {after_timestamp} 之後沒有新訊息")
+            if after_id is None and after_timestamp is not None:
+                # 只換算一次查詢的時間戳記，之後以 ID 二分搜尋
+                after_id = timestamp_to_snowflake(after_timestamp)
+                if after_id is None:
+                    logger.error("時間戳記格式錯誤: %s", after_timestamp)
+                    return []
+
+            if before_id is not None:
+                messages = self.message_history.before(before_id, limit)
+                if after_id is not None:
+                    messages = [message for message in messages
+                                if self._message_key(message) > after_id]
+            elif after_id is not None:
+                messages = self.message_history.after(after_id, limit)
             else:
-                logger.debug(
-                    f"獲取 {after_timestamp} 之後的訊息，共 {len(filtered_messages)} 條")
+                messages = self.message_history.items()
+                if limit is not None:
+                    messages = messages[-limit:]
 
-            return filtered_messages
+            logger.debug("獲取訊息歷史 (after_id=%s, before_id=%s)，共 %s 條",
+                         after_id, before_id, len(messages))
+            return [record.to_dict() for record in messages]
         except Exception as e:
-            logger.error(f"獲取訊息時發生錯誤: {e}")
+            logger.error("獲取訊息時發生錯誤: %s", e)
             return []
 
     def update_guilds_info(self) -> None:
         """
-        更新伺服器和頻道資訊
+        以目前所有伺服器重建伺服器和頻道目錄
+
+        一般只在連線就緒時呼叫，之後由事件逐筆更新。
         """
         try:
-            self.guilds_info.clear()
-            for guild in self.bot.guilds:
-                guild_info = {
-                    'id': str(guild.id),
-                    'name': guild.name,
-                    'channels': {}
-                }
-
-                for channel in guild.text_channels:
-                    guild_info['channels'][str(channel.id)] = {
-                        'id': str(channel.id),
-                        'name': channel.name,
-                        'type': 'text'
-                    }
-
-                self.guilds_info[str(guild.id)] = guild_info
-                logger.debug(f"已更新伺服器資訊: {guild.name} ({guild.id})")
+            self.directory.rebuild(self.bot.guilds)
         except Exception as e:
-            logger.error(f"更新伺服器資訊時發生錯誤: {e}")
+            logger.error("更新伺服器資訊時發生錯誤: %s", e)
 
     def get_guilds(self) -> List[Dict]:
         """
         獲取機器人加入的所有伺服器列表
 
         Returns:
-            List[Dict]: 伺服器列表，每個伺服器包含 id 和 name
+            List[Dict]: 伺服器列表，每個伺服器包含 id、name 和 icon
         """
         try:
-            # 更新伺服器資訊
-            self.update_guilds_info()
-
-            guilds = []
-            for guild_id, guild_info in self.guilds_info.items():
-                guilds.append({
-                    'id': guild_id,
-                    'name': guild_info['name']
-                })
-            logger.debug(f"獲取到 {len(guilds)} 個伺服器")
+            if not self.directory.built:
+                self.update_guilds_info()
+
+            guilds = self.directory.guilds()
+            logger.debug("獲取到 %s 個伺服器", len(guilds))
             return guilds
         except Exception as e:
-            logger.error(f"獲取伺服器列表時發生錯誤: {e}")
+            logger.error("獲取伺服器列表時發生錯誤: %s", e)
             return []
 
     def get_channels(self, guild_id: str) -> List[Dict]:
@@ -214,31 +354,48 @@ class DiscordBot:
             List[Dict]: 頻道列表
         """
         try:
-            # 更新伺服器資訊
-            self.update_guilds_info()
+            if not self.directory.built:
+                self.update_guilds_info()
 
-            if guild_id not in self.guilds_info:
-                logger.error(f"找不到伺服器: {guild_id}")
+            channels = self.directory.channels(guild_id)
+            if channels is None:
+                logger.error("找不到伺服器: %s", guild_id)
                 return []
 
-            channels = list(self.guilds_info[guild_id]['channels'].values())
-            logger.debug(f"獲取頻道列表，共 {len(channels)} 個頻道")
+            logger.debug("獲取頻道列表，共 %s 個頻道", len(channels))
             return channels
         except Exception as e:
-            logger.error(f"獲取頻道列表時發生錯誤: {e}")
+            logger.error("獲取頻道列表時發生錯誤: %s", e)
             return []
 
     async def start_bot(self) -> None:
         """
         啟動 Discord 機器人
         """
+        self.writer.start()
+        self.loop_monitor.start()
+        if not self.history_current:
+            self._history_task = asyncio.get_running_loop().create_task(self.load_history())
         await self.bot.start(self.token)
 
     async def close_bot(self) -> None:
         """
         關閉 Discord 機器人
         """
+        await self.loop_monitor.close()
+        await self.dispatcher.close()
+        await self.exporter.close()
         await self.bot.close()
+        await self.router.close()
+        self.hub.close()
+        # 寫入佇列中剩餘的訊息
+        if self._history_task is not None:
+            await self._history_task
+        await self.writer.close()
+        self.journal.close()
+        self.archive.close()
+        # 日誌已寫完，快照的歷史記錄與日誌一致
+        self.save_snapshot()
 
     def get_bot(self) -> commands.Bot:
         """
@@ -249,14 +406,17 @@ class DiscordBot:
         """
         return self.bot
 
-    def send_message(self, guild_id: str, channel_id: str, content: str) -> None:
+    def send_message(self, guild_id: str, channel_id: str, content: str) -> str:
         """
-        發送訊息到指定的頻道
+        將訊息放入發送佇列，依速率限制發送到指定的頻道
 
         Args:
             guild_id (str): 伺服器 ID
             channel_id (str): 頻道 ID
             content (str): 訊息內容
+
+        Returns:
+            str: 發送工作 ID，可透過 get_send_status 查詢狀態
         """
         try:
             # 獲取頻道
@@ -264,9 +424,22 @@ class DiscordBot:
             if not channel:
                 raise ValueError(f"找不到頻道: {channel_id}")
 
-            # 發送訊息
-            self.bot.loop.create_task(channel.send(content))
-            logger.info(f"已發送訊息到頻道 {channel.name} ({channel_id}): {content}")
+            # 放入發送佇列
+            job_id = self.dispatcher.submit(channel_id, content)
+            logger.info("已排入發送佇列 %s: 頻道 %s (%s)", job_id, channel.name, channel_id)
+            return job_id
         except Exception as e:
-            logger.error(f"發送訊息時發生錯誤: {e}")
+            logger.error("發送訊息時發生錯誤: %s", e)
             raise
+
+    def get_send_status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        查詢發送工作的狀態
+
+        Args:
+            job_id (str): 發送工作 ID
+
+        Returns:
+            Optional[Dict[str, Any]]: 工作狀態與延遲，找不到時返回 None
+        """
+        return self.dispatcher.get_job(job_id)
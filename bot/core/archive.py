@@ -0,0 +1,414 @@
+"""
+訊息封存模組
+
+此模組以 SQLite 保存所有收到的訊息，不受歷史緩衝區容量的限制：
+- 以 snowflake ID 作為主鍵，並依伺服器、頻道、作者建立索引
+- 使用 WAL 模式，寫入時讀取不會被阻擋
+- 由訊息寫入器批次寫入，一批訊息一個交易；訊息的編輯與刪除也經由寫入器同步
+- 以 FTS5 全文索引搜尋訊息內容
+- 分頁一律使用 ID 游標（keyset），不使用 OFFSET
+"""
+
+import json
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .logger import logger
+
+# 讀取連線池的最大連線數
+_MAX_READERS = 8
+# trigram 斷詞器最短可搜尋的字元數，較短的關鍵字改用 LIKE
+_TRIGRAM_MIN_LENGTH = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    guild_id INTEGER,
+    channel_id INTEGER NOT NULL,
+    author_id INTEGER,
+    author TEXT,
+    content TEXT NOT NULL DEFAULT '',
+    timestamp TEXT,
+    attachments TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_messages_channel ON messages (channel_id, id);
+CREATE INDEX IF NOT EXISTS idx_messages_guild ON messages (guild_id, id);
+CREATE INDEX IF NOT EXISTS idx_messages_author ON messages (author_id, id);
+"""
+
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    content, content='messages', content_rowid='id', tokenize='{tokenizer}'
+);
+CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_au AFTER UPDATE OF content ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+END;
+"""
+
+_COLUMNS = 'id, guild_id, channel_id, author_id, author, content, timestamp, attachments'
+
+
+def _to_int(value) -> Optional[int]:
+    if value is None or value == '':
+        return None
+    return int(value)
+
+
+def _row_to_message(row: Tuple) -> Dict:
+    """
+    將資料列轉換為訊息資料，ID 以字串表示避免 JavaScript 的精度問題
+
+    Args:
+        row (Tuple): 資料列
+
+    Returns:
+        Dict: 訊息資料
+    """
+    message_id, guild_id, channel_id, author_id, author, content, timestamp, attachments = row
+    return {
+        'id': str(message_id),
+        'guild_id': str(guild_id) if guild_id is not None else None,
+        'channel_id': str(channel_id),
+        'author_id': str(author_id) if author_id is not None else None,
+        'author': author,
+        'content': content,
+        'timestamp': timestamp,
+        'attachments': json.loads(attachments) if attachments else [],
+    }
+
+
+class MessageArchive:
+    """
+    SQLite 訊息封存
+
+    此類別負責：
+    - 建立資料表、索引與全文索引
+    - 在單一寫入執行緒中批次寫入訊息
+    - 以連線池提供多個執行緒同時查詢
+    """
+
+    def __init__(self, path: str, readonly: bool = False) -> None:
+        """
+        初始化訊息封存
+
+        Args:
+            path (str): 資料庫檔案路徑
+            readonly (bool): 以唯讀方式開啟，供其他程序（例如控制面板工作程序）查詢
+        """
+        self.path = path
+        self.readonly = readonly
+        self._write_lock = threading.Lock()
+        self._readers: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(_MAX_READERS)
+        if readonly:
+            self._writer = None
+            self.tokenizer = self._detect_tokenizer()
+        else:
+            self._writer = self._connect()
+            self._writer.execute('PRAGMA journal_mode=WAL')
+            self.tokenizer = self._create_schema()
+        logger.debug("訊息封存已開啟: %s (斷詞器 %s)", path, self.tokenizer)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.readonly:
+            connection = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True,
+                                         check_same_thread=False, isolation_level=None)
+        else:
+            connection = sqlite3.connect(self.path, check_same_thread=False,
+                                         isolation_level=None)
+        # WAL 模式下 NORMAL 只在檢查點時 fsync，仍可保證資料庫一致
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.execute('PRAGMA busy_timeout=5000')
+        return connection
+
+    def _create_schema(self) -> str:
+        """
+        建立資料表與全文索引
+
+        Returns:
+            str: 全文索引使用的斷詞器
+        """
+        self._writer.executescript(_SCHEMA)
+        row = self._writer.execute(
+            "SELECT sql FROM sqlite_master WHERE name = 'messages_fts'").fetchone()
+        if row is not None:
+            return 'trigram' if 'trigram' in row[0] else 'unicode61'
+
+        # trigram 可以搜尋中文等不以空白分詞的文字，舊版 SQLite 沒有時退回 unicode61
+        for tokenizer in ('trigram', 'unicode61'):
+            try:
+                self._writer.executescript(_FTS_SCHEMA.format(tokenizer=tokenizer))
+                return tokenizer
+            except sqlite3.OperationalError as e:
+                logger.warning("無法使用 %s 斷詞器建立全文索引: %s", tokenizer, e)
+        raise RuntimeError('SQLite 不支援 FTS5 全文索引')
+
+    def _detect_tokenizer(self) -> str:
+        """
+        讀取既有全文索引使用的斷詞器
+
+        Returns:
+            str: 斷詞器名稱
+        """
+        with self._reader() as connection:
+            row = connection.execute(
+                "SELECT sql FROM sqlite_master WHERE name = 'messages_fts'").fetchone()
+        if row is None:
+            raise RuntimeError(f'訊息封存尚未建立: {self.path}')
+        return 'trigram' if 'trigram' in row[0] else 'unicode61'
+
+    @contextmanager
+    def _reader(self) -> Iterator[sqlite3.Connection]:
+        """
+        從連線池取得讀取連線，用完後放回
+        """
+        try:
+            connection = self._readers.get_nowait()
+        except queue.Empty:
+            connection = self._connect()
+        try:
+            yield connection
+        finally:
+            try:
+                self._readers.put_nowait(connection)
+            except queue.Full:
+                connection.close()
+
+    def insert_many(self, messages: Iterable[Dict]) -> int:
+        """
+        在同一個交易中寫入多條訊息，已存在的訊息會被略過
+
+        Args:
+            messages (Iterable[Dict]): 訊息資料
+
+        Returns:
+            int: 寫入的訊息數量
+        """
+        if self.readonly:
+            raise RuntimeError('訊息封存以唯讀方式開啟')
+        rows = []
+        for message in messages:
+            try:
+                rows.append((
+                    int(message['id']),
+                    _to_int(message.get('guild_id')),
+                    int(message['channel_id']),
+                    _to_int(message.get('author_id')),
+                    message.get('author'),
+                    message.get('content') or '',
+                    message.get('timestamp'),
+                    json.dumps(message['attachments'], ensure_ascii=False)
+                    if message.get('attachments') else None,
+                ))
+            except (KeyError, TypeError, ValueError):
+                # 缺少 ID 或頻道的舊資料無法封存
+                continue
+        if not rows:
+            return 0
+
+        with self._write_lock:
+            self._writer.execute('BEGIN')
+            try:
+                cursor = self._writer.executemany(
+                    f'INSERT OR IGNORE INTO messages ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    rows)
+                self._writer.execute('COMMIT')
+            except Exception:
+                self._writer.execute('ROLLBACK')
+                raise
+        # rowcount 只計算直接寫入的列，不包含觸發器寫入全文索引的列
+        return cursor.rowcount
+
+    def update(self, message_id: int, fields: Dict) -> bool:
+        """
+        更新已編輯訊息的內容與附件，全文索引由觸發器同步更新
+
+        Args:
+            message_id (int): 訊息 ID
+            fields (Dict): 要更新的欄位（content、attachments）
+
+        Returns:
+            bool: 是否找到並更新訊息
+        """
+        if self.readonly:
+            raise RuntimeError('訊息封存以唯讀方式開啟')
+        assignments, params = [], []
+        if 'content' in fields:
+            assignments.append('content = ?')
+            params.append(fields['content'] or '')
+        if 'attachments' in fields:
+            assignments.append('attachments = ?')
+            params.append(json.dumps(fields['attachments'], ensure_ascii=False)
+                          if fields['attachments'] else None)
+        if not assignments:
+            return False
+
+        with self._write_lock:
+            cursor = self._writer.execute(
+                f"UPDATE messages SET {', '.join(assignments)} WHERE id = ?",
+                (*params, message_id))
+        return cursor.rowcount > 0
+
+    def delete_many(self, message_ids: Iterable[int]) -> int:
+        """
+        在同一個交易中刪除多條訊息，全文索引由觸發器同步刪除
+
+        Args:
+            message_ids (Iterable[int]): 訊息 ID
+
+        Returns:
+            int: 刪除的訊息數量
+        """
+        if self.readonly:
+            raise RuntimeError('訊息封存以唯讀方式開啟')
+        rows = [(message_id,) for message_id in message_ids]
+        if not rows:
+            return 0
+
+        with self._write_lock:
+            self._writer.execute('BEGIN')
+            try:
+                cursor = self._writer.executemany('DELETE FROM messages WHERE id = ?', rows)
+                self._writer.execute('COMMIT')
+            except Exception:
+                self._writer.execute('ROLLBACK')
+                raise
+        return cursor.rowcount
+
+    def _fts_query(self, text: str) -> Optional[str]:
+        """
+        將使用者輸入轉換為 FTS5 片語查詢，避免特殊字元造成語法錯誤
+
+        Args:
+            text (str): 搜尋文字
+
+        Returns:
+            Optional[str]: FTS5 查詢，太短而無法使用全文索引時返回 None
+        """
+        if self.tokenizer == 'trigram' and len(text) < _TRIGRAM_MIN_LENGTH:
+            return None
+        return '"' + text.replace('"', '""') + '"'
+
+    def search(self, text: str, guild_id: Optional[int] = None,
+               channel_id: Optional[int] = None, author_id: Optional[int] = None,
+               before_id: Optional[int] = None, limit: int = 50) -> Tuple[List[Dict], bool]:
+        """
+        搜尋訊息內容，由新到舊返回
+
+        Args:
+            text (str): 搜尋文字
+            guild_id (Optional[int]): 只搜尋此伺服器
+            channel_id (Optional[int]): 只搜尋此頻道
+            author_id (Optional[int]): 只搜尋此作者
+            before_id (Optional[int]): 分頁游標，只返回 ID 小於此值的訊息
+            limit (int): 最多返回的訊息數量
+
+        Returns:
+            Tuple[List[Dict], bool]: 訊息列表，以及是否還有更多結果
+        """
+        conditions = []
+        params: List = []
+        fts_query = self._fts_query(text)
+        if fts_query is not None:
+            # 以全文索引的 rowid 排序與分頁，FTS5 可以直接由新到舊輸出並在達到上限時停止
+            source = 'messages_fts f JOIN messages m ON m.id = f.rowid'
+            order = 'f.rowid'
+            conditions.append('messages_fts MATCH ?')
+            params.append(fts_query)
+        else:
+            source = 'messages m'
+            order = 'm.id'
+            conditions.append("m.content LIKE ? ESCAPE '\\'")
+            escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            params.append(f'%{escaped}%')
+
+        for column, value in (('guild_id', guild_id), ('channel_id', channel_id),
+                              ('author_id', author_id)):
+            if value is not None:
+                conditions.append(f'm.{column} = ?')
+                params.append(value)
+        if before_id is not None:
+            conditions.append(f'{order} < ?')
+            params.append(before_id)
+
+        columns = ', '.join(f'm.{column.strip()}' for column in _COLUMNS.split(','))
+        sql = (f'SELECT {columns} FROM {source} WHERE {" AND ".join(conditions)} '
+               f'ORDER BY {order} DESC LIMIT ?')
+        params.append(limit + 1)
+        with self._reader() as connection:
+            rows = connection.execute(sql, params).fetchall()
+        return [_row_to_message(row) for row in rows[:limit]], len(rows) > limit
+
+    def range(self, channel_id: int, after_id: Optional[int] = None,
+              before_id: Optional[int] = None, limit: int = 100,
+              forward: Optional[bool] = None) -> Tuple[List[Dict], bool]:
+        """
+        依 ID 範圍讀取頻道訊息，結果由舊到新排列
+
+        預設只指定 after_id 時從 after_id 之後往新的方向讀取；
+        其他情況從 before_id（未指定時為最新）往舊的方向讀取。
+
+        Args:
+            channel_id (int): 頻道 ID
+            after_id (Optional[int]): 只返回 ID 大於此值的訊息
+            before_id (Optional[int]): 只返回 ID 小於此值的訊息
+            limit (int): 最多返回的訊息數量
+            forward (Optional[bool]): 指定讀取方向，True 為由舊到新
+
+        Returns:
+            Tuple[List[Dict], bool]: 訊息列表，以及讀取方向上是否還有更多訊息
+        """
+        conditions = ['channel_id = ?']
+        params: List = [channel_id]
+        if after_id is not None:
+            conditions.append('id > ?')
+            params.append(after_id)
+        if before_id is not None:
+            conditions.append('id < ?')
+            params.append(before_id)
+        if forward is None:
+            forward = after_id is not None and before_id is None
+
+        sql = (f'SELECT {_COLUMNS} FROM messages WHERE {" AND ".join(conditions)} '
+               f'ORDER BY id {"ASC" if forward else "DESC"} LIMIT ?')
+        params.append(limit + 1)
+        with self._reader() as connection:
+            rows = connection.execute(sql, params).fetchall()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if not forward:
+            rows.reverse()
+        return [_row_to_message(row) for row in rows], has_more
+
+    def count(self) -> int:
+        """
+        獲取封存的訊息總數
+
+        Returns:
+            int: 訊息數量
+        """
+        with self._reader() as connection:
+            return connection.execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+
+    def close(self) -> None:
+        """
+        關閉所有連線
+        """
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
@@ -0,0 +1,344 @@
+"""
+頻道訊息快取模組
+
+此模組提供由 Gateway 事件直接更新的頻道訊息快取：
+- 每個頻道保存固定數量的最新訊息，依整數訊息 ID 排序，範圍查詢以二分搜尋
+- 頻道數量超過上限時淘汰最久未使用的頻道（LRU）
+- 新增、編輯、刪除訊息的事件直接寫入快取
+- 只有冷啟動或偵測到缺漏時才需要透過 REST 補齊
+"""
+
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .logger import logger
+from .serializer import MessageRecord
+
+
+class _ChannelMessages:
+    """
+    單一頻道的快取訊息，以兩個平行的列表保存整數 ID 與訊息紀錄，依 ID 排序
+    """
+
+    __slots__ = ('ids', 'messages', 'covered')
+
+    def __init__(self) -> None:
+        self.ids: List[int] = []
+        self.messages: List[MessageRecord] = []
+        # 快取已涵蓋到的最大訊息 ID，包含之後被刪除的訊息
+        self.covered = 0
+
+    def put(self, message_id: int, message: MessageRecord) -> None:
+        """
+        依 ID 插入訊息，已存在的訊息會被取代
+
+        Args:
+            message_id (int): 訊息 ID
+            message (MessageRecord): 訊息紀錄
+        """
+        if message_id > self.covered:
+            self.covered = message_id
+        if not self.ids or message_id > self.ids[-1]:
+            self.ids.append(message_id)
+            self.messages.append(message)
+            return
+        position = bisect_left(self.ids, message_id)
+        if position < len(self.ids) and self.ids[position] == message_id:
+            self.messages[position] = message
+        else:
+            self.ids.insert(position, message_id)
+            self.messages.insert(position, message)
+
+    def trim(self, capacity: int) -> None:
+        """
+        只保留最新的 capacity 條訊息
+
+        Args:
+            capacity (int): 保留的訊息數量
+        """
+        excess = len(self.ids) - capacity
+        if excess > 0:
+            del self.ids[:excess]
+            del self.messages[:excess]
+
+    def find(self, message_id: int) -> int:
+        """
+        找出訊息的位置
+
+        Args:
+            message_id (int): 訊息 ID
+
+        Returns:
+            int: 訊息在列表中的位置，找不到時返回 -1
+        """
+        position = bisect_left(self.ids, message_id)
+        if position < len(self.ids) and self.ids[position] == message_id:
+            return position
+        return -1
+
+
+class ChannelMessageCache:
+    """
+    頻道訊息快取
+
+    此類別負責：
+    - 依整數 ID 排序保存每個頻道最新的訊息，ID 範圍查詢為二分搜尋
+    - 以 LRU 策略限制快取的頻道數量
+    - 提供執行緒安全的讀寫操作，供機器人與網頁執行緒共用
+    """
+
+    def __init__(self, per_channel: int = 100, max_channels: int = 256) -> None:
+        """
+        初始化頻道訊息快取
+
+        Args:
+            per_channel (int): 每個頻道保存的訊息數量
+            max_channels (int): 最多快取的頻道數量
+        """
+        self.per_channel = per_channel
+        self.max_channels = max_channels
+        self._channels: "OrderedDict[str, _ChannelMessages]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def is_warm(self, channel_id: str) -> bool:
+        """
+        檢查頻道是否已經載入過歷史訊息
+
+        Args:
+            channel_id (str): 頻道 ID
+
+        Returns:
+            bool: 頻道是否在快取中
+        """
+        return channel_id in self._channels
+
+    def get(self, channel_id: str, after_id: Optional[int] = None,
+            before_id: Optional[int] = None,
+            limit: Optional[int] = None) -> Optional[List[MessageRecord]]:
+        """
+        取得頻道的快取訊息，並標記為最近使用
+
+        有 before_id 時返回 before_id 之前最新的 limit 條（往回翻頁）；
+        否則返回 after_id 之後最舊的 limit 條。結果一律由舊到新排列。
+
+        Args:
+            channel_id (str): 頻道 ID
+            after_id (Optional[int]): 只返回 ID 大於此值的訊息
+            before_id (Optional[int]): 只返回 ID 小於此值的訊息
+            limit (Optional[int]): 最多返回的訊息數量，None 表示不限制
+
+        Returns:
+            Optional[List[MessageRecord]]: 訊息列表，頻道不在快取中時返回 None
+        """
+        with self._lock:
+            channel = self._channels.get(channel_id)
+            if channel is None:
+                return None
+            self._channels.move_to_end(channel_id)
+
+            begin = 0 if after_id is None else bisect_right(channel.ids, after_id)
+            end = len(channel.ids) if before_id is None else bisect_left(channel.ids, before_id)
+            if limit is not None and end - begin > limit:
+                if before_id is not None:
+                    begin = end - limit
+                else:
+                    end = begin + limit
+            return channel.messages[begin:end]
+
+    def newest_id(self, channel_id: str) -> Optional[int]:
+        """
+        取得頻道快取中最新訊息的 ID
+
+        Args:
+            channel_id (str): 頻道 ID
+
+        Returns:
+            Optional[int]: 最新訊息的 ID，沒有訊息時返回 None
+        """
+        with self._lock:
+            channel = self._channels.get(channel_id)
+            if not channel or not channel.ids:
+                return None
+            return channel.ids[-1]
+
+    def oldest_id(self, channel_id: str) -> Optional[int]:
+        """
+        取得頻道快取中最舊訊息的 ID
+
+        Args:
+            channel_id (str): 頻道 ID
+
+        Returns:
+            Optional[int]: 最舊訊息的 ID，沒有訊息時返回 None
+        """
+        with self._lock:
+            channel = self._channels.get(channel_id)
+            if not channel or not channel.ids:
+                return None
+            return channel.ids[0]
+
+    def covered_id(self, channel_id: str) -> Optional[int]:
+        """
+        取得頻道快取已涵蓋到的最大訊息 ID
+
+        與 newest_id 不同，最新的訊息被刪除後仍維持原值，
+        不會因為 discord.py 的 last_message_id 沒有倒退而被視為缺漏。
+
+        Args:
+            channel_id (str): 頻道 ID
+
+        Returns:
+            Optional[int]: 已涵蓋的最大訊息 ID，頻道不在快取中或沒有訊息時返回 None
+        """
+        with self._lock:
+            channel = self._channels.get(channel_id)
+            if not channel or not channel.covered:
+                return None
+            return channel.covered
+
+    def cover(self, channel_id: str, message_id: Optional[int]) -> None:
+        """
+        標記頻道快取已涵蓋到指定的訊息 ID，例如 REST 補齊確認之後沒有其他訊息時
+
+        Args:
+            channel_id (str): 頻道 ID
+            message_id (Optional[int]): 訊息 ID
+        """
+        if not message_id:
+            return
+        with self._lock:
+            channel = self._channels.get(channel_id)
+            if channel is not None and message_id > channel.covered:
+                channel.covered = message_id
+
+    def fill(self, channel_id: str, messages: Iterable[MessageRecord]) -> None:
+        """
+        以 REST 取得的訊息填入頻道快取，並與現有訊息合併
+
+        Args:
+            channel_id (str): 頻道 ID
+            messages (Iterable[MessageRecord]): 訊息列表
+        """
+        with self._lock:
+            channel = self._channels.get(channel_id)
+            if channel is None:
+                channel = self._channels[channel_id] = _ChannelMessages()
+            for message in messages:
+                channel.put(message.id, message)
+            channel.trim(self.per_channel)
+            self._channels.move_to_end(channel_id)
+            self._evict()
+
+    def replace(self, channel_id: str, messages: Iterable[MessageRecord]) -> None:
+        """
+        捨棄頻道快取中的訊息，改為只保存指定的訊息
+
+        缺漏大到無法以一次 REST 請求補齊時使用，避免快取中留下中間的空洞。
+
+        Args:
+            channel_id (str): 頻道 ID
+            messages (Iterable[MessageRecord]): 訊息列表
+        """
+        with self._lock:
+            self._channels.pop(channel_id, None)
+        self.fill(channel_id, messages)
+
+    def export(self) -> List[Tuple[str, List[MessageRecord]]]:
+        """
+        匯出所有頻道的快取訊息，依最久未使用到最近使用排列，供寫入啟動快照
+
+        Returns:
+            List[Tuple[str, List[MessageRecord]]]: (頻道 ID, 訊息列表) 的列表
+        """
+        with self._lock:
+            return [(channel_id, list(channel.messages))
+                    for channel_id, channel in self._channels.items()]
+
+    def _evict(self) -> None:
+        """
+        淘汰最久未使用的頻道，呼叫前需持有鎖
+        """
+        while len(self._channels) > self.max_channels:
+            channel_id, _ = self._channels.popitem(last=False)
+            logger.debug("已從快取淘汰頻道 %s", channel_id)
+
+    def add(self, channel_id: str, message: MessageRecord) -> bool:
+        """
+        將 Gateway 收到的新訊息加入快取
+
+        只更新已在快取中的頻道，未載入的頻道會在第一次讀取時再補齊。
+        亂序或重複的訊息以二分搜尋插入或取代。
+
+        Args:
+            channel_id (str): 頻道 ID
+            message (MessageRecord): 訊息紀錄
+
+        Returns:
+            bool: 是否已加入快取
+        """
+        with self._lock:
+            channel = self._channels.get(channel_id)
+            if channel is None:
+                return False
+            channel.put(message.id, message)
+            channel.trim(self.per_channel)
+            return True
+
+    def update(self, channel_id: str, message_id: str, fields: Dict) -> bool:
+        """
+        更新快取中已編輯的訊息
+
+        Args:
+            channel_id (str): 頻道 ID
+            message_id (str): 訊息 ID
+            fields (Dict): 要更新的欄位
+
+        Returns:
+            bool: 是否找到並更新訊息
+        """
+        with self._lock:
+            channel = self._channels.get(channel_id)
+            if channel is None:
+                return False
+            position = channel.find(int(message_id))
+            if position < 0:
+                return False
+            channel.messages[position].apply_edit(fields)
+            return True
+
+    def remove(self, channel_id: str, message_ids: Iterable[str]) -> int:
+        """
+        從快取中移除已刪除的訊息
+
+        Args:
+            channel_id (str): 頻道 ID
+            message_ids (Iterable[str]): 訊息 ID
+
+        Returns:
+            int: 移除的訊息數量
+        """
+        removed = 0
+        with self._lock:
+            channel = self._channels.get(channel_id)
+            if not channel:
+                return 0
+            for message_id in message_ids:
+                message_id = int(message_id)
+                # 刪除的訊息已不存在，不需要再補齊
+                if message_id > channel.covered:
+                    channel.covered = message_id
+                position = channel.find(message_id)
+                if position >= 0:
+                    del channel.ids[position]
+                    del channel.messages[position]
+                    removed += 1
+            return removed
+
+    def clear(self) -> None:
+        """
+        清空所有頻道的快取
+        """
+        with self._lock:
+            self._channels.clear()
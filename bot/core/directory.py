@@ -0,0 +1,338 @@
+"""
+伺服器與頻道目錄模組
+
+此模組維護機器人所在伺服器與文字頻道的索引：
+- 啟動時建立一次，之後由伺服器與頻道事件逐筆更新
+- 預先序列化 JSON 並計算 ETag，資料變更時才重新產生
+- 列出伺服器或頻道、檢查頻道是否存在時不需要走訪所有伺服器
+- 資料變更時通知訂閱者，例如推送給控制面板工作程序
+"""
+
+import hashlib
+import json
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import discord
+
+from .logger import logger
+
+
+def _encode(payload: List[Dict]) -> Tuple[bytes, str]:
+    """
+    序列化資料並計算 ETag
+
+    Args:
+        payload (List[Dict]): 要序列化的資料
+
+    Returns:
+        Tuple[bytes, str]: JSON 位元組與 ETag
+    """
+    body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return body, hashlib.blake2b(body, digest_size=12).hexdigest()
+
+
+class GuildDirectory:
+    """
+    伺服器與頻道目錄
+
+    此類別負責：
+    - 保存伺服器與文字頻道的基本資訊
+    - 依事件逐筆新增、更新、移除
+    - 快取序列化後的 JSON 與 ETag
+    - 每次變更後通知訂閱者
+    """
+
+    def __init__(self) -> None:
+        """
+        初始化目錄
+        """
+        self._guilds: Dict[str, Dict] = {}
+        self._channels: Dict[str, Dict[str, Dict]] = {}
+        # 頻道 ID 對應伺服器 ID，隨 _channels 一起更新
+        self._channel_guilds: Dict[str, str] = {}
+        self._guilds_encoded: Optional[Tuple[bytes, str]] = None
+        self._channels_encoded: Dict[str, Tuple[bytes, str]] = {}
+        self._lock = threading.Lock()
+        # 每次變更都遞增，避免把過期的序列化結果寫回快取
+        self._version = 0
+        self._listeners: List[Callable[[], None]] = []
+        self.built = False
+
+    @staticmethod
+    def _guild_info(guild: discord.Guild) -> Dict:
+        return {
+            'id': str(guild.id),
+            'name': guild.name,
+            'icon': str(guild.icon.url) if guild.icon else None
+        }
+
+    @staticmethod
+    def _channel_info(channel: discord.TextChannel) -> Dict:
+        return {
+            'id': str(channel.id),
+            'name': channel.name,
+            'type': 'text',
+            'position': channel.position
+        }
+
+    @staticmethod
+    def _index(channels: Dict[str, Dict[str, Dict]]) -> Dict[str, str]:
+        return {channel_id: guild_id
+                for guild_id, guild_channels in channels.items()
+                for channel_id in guild_channels}
+
+    def rebuild(self, guilds: Iterable[discord.Guild]) -> None:
+        """
+        以目前所有伺服器重建整個目錄
+
+        Args:
+            guilds (Iterable[discord.Guild]): 伺服器列表
+        """
+        new_guilds: Dict[str, Dict] = {}
+        new_channels: Dict[str, Dict[str, Dict]] = {}
+        for guild in guilds:
+            guild_id = str(guild.id)
+            new_guilds[guild_id] = self._guild_info(guild)
+            new_channels[guild_id] = {
+                str(channel.id): self._channel_info(channel)
+                for channel in guild.text_channels
+            }
+        channel_guilds = self._index(new_channels)
+
+        with self._lock:
+            self._guilds = new_guilds
+            self._channels = new_channels
+            self._channel_guilds = channel_guilds
+            self._guilds_encoded = None
+            self._channels_encoded.clear()
+            self._version += 1
+            self.built = True
+        self._changed()
+        logger.debug("已重建伺服器目錄，共 %s 個伺服器", len(new_guilds))
+
+    def subscribe(self, listener: Callable[[], None]) -> None:
+        """
+        訂閱目錄變更
+
+        Args:
+            listener (Callable[[], None]): 每次變更後在更新目錄的執行緒上呼叫，不持有鎖
+        """
+        self._listeners.append(listener)
+
+    def unsubscribe(self, listener: Callable[[], None]) -> None:
+        """
+        取消訂閱目錄變更
+
+        Args:
+            listener (Callable[[], None]): 訂閱時傳入的函式
+        """
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _changed(self) -> None:
+        # 在鎖外通知，訂閱者可以直接讀取目錄
+        for listener in list(self._listeners):
+            try:
+                listener()
+            except Exception as e:
+                logger.error("通知目錄變更時發生錯誤: %s", e, exc_info=True)
+
+    @property
+    def version(self) -> int:
+        # 每次變更都會遞增的版本號，供複本判斷是否需要同步
+        return self._version
+
+    def export(self) -> Dict:
+        """
+        匯出整個目錄，供其他程序建立唯讀複本
+
+        Returns:
+            Dict: 伺服器列表與每個伺服器的頻道列表
+        """
+        with self._lock:
+            return {
+                'guilds': list(self._guilds.values()),
+                'channels': {guild_id: list(channels.values())
+                             for guild_id, channels in self._channels.items()},
+            }
+
+    def load(self, data: Dict) -> None:
+        """
+        以 export 匯出的資料取代整個目錄
+
+        Args:
+            data (Dict): export 匯出的資料
+        """
+        new_guilds = {guild['id']: guild for guild in data['guilds']}
+        new_channels = {guild_id: {channel['id']: channel for channel in channels}
+                        for guild_id, channels in data['channels'].items()}
+        channel_guilds = self._index(new_channels)
+        with self._lock:
+            self._guilds = new_guilds
+            self._channels = new_channels
+            self._channel_guilds = channel_guilds
+            self._guilds_encoded = None
+            self._channels_encoded.clear()
+            self._version += 1
+            self.built = True
+        self._changed()
+        logger.debug("已載入伺服器目錄複本，共 %s 個伺服器", len(new_guilds))
+
+    def has_channel(self, channel_id: str) -> bool:
+        """
+        檢查文字頻道是否在目錄中
+
+        Args:
+            channel_id (str): 頻道 ID
+
+        Returns:
+            bool: 頻道是否存在
+        """
+        with self._lock:
+            return channel_id in self._channel_guilds
+
+    def upsert_guild(self, guild: discord.Guild) -> None:
+        """
+        新增或更新伺服器，並同步其文字頻道
+
+        Args:
+            guild (discord.Guild): 伺服器
+        """
+        guild_id = str(guild.id)
+        channels = {str(channel.id): self._channel_info(channel)
+                    for channel in guild.text_channels}
+        with self._lock:
+            self._guilds[guild_id] = self._guild_info(guild)
+            for channel_id in self._channels.get(guild_id, ()):
+                self._channel_guilds.pop(channel_id, None)
+            self._channels[guild_id] = channels
+            self._channel_guilds.update(dict.fromkeys(channels, guild_id))
+            self._guilds_encoded = None
+            self._channels_encoded.pop(guild_id, None)
+            self._version += 1
+        self._changed()
+        logger.debug("已更新伺服器目錄: %s (%s)", guild.name, guild.id)
+
+    def remove_guild(self, guild_id: int) -> None:
+        """
+        移除伺服器
+
+        Args:
+            guild_id (int): 伺服器 ID
+        """
+        key = str(guild_id)
+        with self._lock:
+            self._guilds.pop(key, None)
+            for channel_id in self._channels.pop(key, {}):
+                self._channel_guilds.pop(channel_id, None)
+            self._guilds_encoded = None
+            self._channels_encoded.pop(key, None)
+            self._version += 1
+        self._changed()
+        logger.debug("已從目錄移除伺服器 %s", guild_id)
+
+    def upsert_channel(self, channel: discord.abc.GuildChannel) -> None:
+        """
+        新增或更新頻道，非文字頻道會被移除
+
+        Args:
+            channel (discord.abc.GuildChannel): 頻道
+        """
+        if not isinstance(channel, discord.TextChannel):
+            self.remove_channel(channel)
+            return
+
+        guild_id = str(channel.guild.id)
+        with self._lock:
+            if guild_id not in self._channels:
+                return
+            self._channels[guild_id][str(channel.id)] = self._channel_info(channel)
+            self._channel_guilds[str(channel.id)] = guild_id
+            self._channels_encoded.pop(guild_id, None)
+            self._version += 1
+        self._changed()
+
+    def remove_channel(self, channel: discord.abc.GuildChannel) -> None:
+        """
+        移除頻道
+
+        Args:
+            channel (discord.abc.GuildChannel): 頻道
+        """
+        guild_id = str(channel.guild.id)
+        with self._lock:
+            channels = self._channels.get(guild_id)
+            if channels is None or channels.pop(str(channel.id), None) is None:
+                return
+            self._channel_guilds.pop(str(channel.id), None)
+            self._channels_encoded.pop(guild_id, None)
+            self._version += 1
+        self._changed()
+
+    def guilds(self) -> List[Dict]:
+        """
+        取得伺服器列表
+
+        Returns:
+            List[Dict]: 伺服器列表
+        """
+        with self._lock:
+            return list(self._guilds.values())
+
+    def channels(self, guild_id: str) -> Optional[List[Dict]]:
+        """
+        取得伺服器的文字頻道列表，依頻道位置排序
+
+        Args:
+            guild_id (str): 伺服器 ID
+
+        Returns:
+            Optional[List[Dict]]: 頻道列表，找不到伺服器時返回 None
+        """
+        with self._lock:
+            channels = self._channels.get(guild_id)
+            if channels is None:
+                return None
+            return sorted(channels.values(), key=lambda channel: channel['position'])
+
+    def guilds_json(self) -> Tuple[bytes, str]:
+        """
+        取得序列化後的伺服器列表與 ETag
+
+        Returns:
+            Tuple[bytes, str]: JSON 位元組與 ETag
+        """
+        encoded = self._guilds_encoded
+        if encoded is None:
+            with self._lock:
+                version = self._version
+                guilds = list(self._guilds.values())
+            encoded = _encode(guilds)
+            with self._lock:
+                if self._version == version:
+                    self._guilds_encoded = encoded
+        return encoded
+
+    def channels_json(self, guild_id: str) -> Optional[Tuple[bytes, str]]:
+        """
+        取得序列化後的頻道列表與 ETag
+
+        Args:
+            guild_id (str): 伺服器 ID
+
+        Returns:
+            Optional[Tuple[bytes, str]]: JSON 位元組與 ETag，找不到伺服器時返回 None
+        """
+        encoded = self._channels_encoded.get(guild_id)
+        if encoded is None:
+            with self._lock:
+                version = self._version
+            channels = self.channels(guild_id)
+            if channels is None:
+                return None
+            encoded = _encode(channels)
+            with self._lock:
+                if self._version == version:
+                    self._channels_encoded[guild_id] = encoded
+        return encoded
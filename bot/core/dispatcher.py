@@ -0,0 +1,496 @@
+"""
+訊息發送模組
+
+此模組提供具備速率限制的訊息發送佇列，取代直接建立 channel.send 任務：
+- 每個頻道一個佇列與一個發送任務
+- 以令牌桶控制每個頻道與全域的發送速率（對應 Discord 的路由限制）
+- 佇列中相鄰的短訊息會合併成一則，不超過 2000 字元
+- 每個發送請求都有工作 ID，可查詢發送狀態與延遲
+- 收到速率限制回應時依 retry_after 等待後重新發送，並可通知呼叫端每次狀態變更
+"""
+
+import asyncio
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional
+
+import discord
+from discord.ext import commands
+
+from .logger import logger, message_logger
+from .metrics import REST_RATE_LIMITED, REST_REQUESTS
+
+# 發送訊息的 REST 請求計數
+_REST_SEND = REST_REQUESTS.labels('send')
+
+# Discord 單則訊息的字元上限
+MAX_MESSAGE_LENGTH = 2000
+
+
+class TokenBucket:
+    """
+    令牌桶速率限制器
+
+    此類別負責：
+    - 以固定速率補充令牌
+    - 沒有令牌時等待到下一個令牌產生
+    """
+
+    def __init__(self, capacity: int, period: float) -> None:
+        """
+        初始化令牌桶
+
+        Args:
+            capacity (int): 令牌桶容量（一個週期內允許的請求數）
+            period (float): 週期秒數
+        """
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self) -> None:
+        """
+        取得一個令牌，沒有令牌時等待
+        """
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def penalize(self, retry_after: float) -> None:
+        """
+        收到速率限制回應時，清空令牌直到 retry_after 秒後
+
+        Args:
+            retry_after (float): Discord 要求等待的秒數
+        """
+        self._refill()
+        self.tokens = -retry_after * self.rate
+
+    def time_to_full(self) -> float:
+        """
+        計算令牌補滿還需要的秒數
+
+        Returns:
+            float: 秒數，已補滿時為 0
+        """
+        self._refill()
+        return max(0.0, (self.capacity - self.tokens) / self.rate)
+
+
+class SendJob:
+    """
+    發送工作
+    """
+
+    __slots__ = ('id', 'channel_id', 'content', 'status', 'created', 'finished',
+                 'error', 'message_id', 'coalesced', 'attempts', 'retry_after', 'listener')
+
+    def __init__(self, channel_id: str, content: str,
+                 listener: Optional[Callable[['SendJob'], None]] = None) -> None:
+        self.id = uuid.uuid4().hex
+        self.channel_id = channel_id
+        self.content = content
+        self.status = 'queued'
+        self.created = time.monotonic()
+        self.finished: Optional[float] = None
+        self.error: Optional[str] = None
+        self.message_id: Optional[str] = None
+        self.coalesced = 1
+        self.attempts = 0
+        self.retry_after: Optional[float] = None
+        # 狀態變為 retrying、sent 或 failed 時在事件迴圈上呼叫
+        self.listener = listener
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        轉換為可回傳給控制面板的字典
+
+        Returns:
+            Dict[str, Any]: 工作狀態
+        """
+        end = self.finished if self.finished is not None else time.monotonic()
+        return {
+            'id': self.id,
+            'channel_id': self.channel_id,
+            'status': self.status,
+            'latency_ms': round((end - self.created) * 1000, 1),
+            'error': self.error,
+            'message_id': self.message_id,
+            'coalesced': self.coalesced,
+            'attempts': self.attempts,
+            'retry_after': self.retry_after
+        }
+
+
+class OutboundDispatcher:
+    """
+    訊息發送佇列
+
+    此類別負責：
+    - 接收任何執行緒送來的發送請求
+    - 依頻道排隊並依速率限制發送
+    - 合併相鄰的短訊息
+    - 記錄每個工作的狀態與延遲
+    """
+
+    def __init__(self, bot: commands.Bot, channel_rate: int = 5, channel_period: float = 5.0,
+                 global_rate: int = 50, global_period: float = 1.0,
+                 max_in_flight: int = 10, max_jobs: int = 10000, max_attempts: int = 3) -> None:
+        """
+        初始化訊息發送佇列
+
+        Args:
+            bot (commands.Bot): Discord 機器人實例
+            channel_rate (int): 每個頻道每個週期允許發送的訊息數
+            channel_period (float): 頻道速率限制的週期秒數
+            global_rate (int): 全域每個週期允許的請求數
+            global_period (float): 全域速率限制的週期秒數
+            max_in_flight (int): 同時進行中的發送請求上限
+            max_jobs (int): 保留查詢紀錄的工作數量上限
+            max_attempts (int): 收到速率限制回應時，每個工作最多嘗試發送的次數
+        """
+        self.bot = bot
+        self.channel_rate = channel_rate
+        self.channel_period = channel_period
+        self.max_jobs = max_jobs
+        self.max_attempts = max_attempts
+
+        self.global_bucket = TokenBucket(global_rate, global_period)
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        self._queues: Dict[str, Deque[SendJob]] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._workers: Dict[str, asyncio.Task] = {}
+        self._jobs: "OrderedDict[str, SendJob]" = OrderedDict()
+        self._jobs_lock = threading.Lock()
+
+        self.stats: Dict[str, int] = {
+            'submitted': 0,
+            'sent': 0,
+            'failed': 0,
+            'requests': 0,
+            'coalesced': 0,
+            'rate_limited': 0,
+            'retried': 0,
+        }
+
+    def submit(self, channel_id: str, content: str,
+               listener: Optional[Callable[[SendJob], None]] = None) -> str:
+        """
+        提交發送請求，可從任何執行緒呼叫
+
+        Args:
+            channel_id (str): 頻道 ID
+            content (str): 訊息內容
+            listener (Optional[Callable[[SendJob], None]]): 狀態變更時在事件迴圈上呼叫
+
+        Returns:
+            str: 工作 ID
+
+        Raises:
+            ValueError: 訊息內容超過 MAX_MESSAGE_LENGTH
+        """
+        return self.submit_many((channel_id,), content, listener)[0]
+
+    def submit_many(self, channel_ids: Iterable[str], content: str,
+                    listener: Optional[Callable[[SendJob], None]] = None) -> List[str]:
+        """
+        提交同一則訊息到多個頻道，可從任何執行緒呼叫
+
+        所有工作以一次跨執行緒呼叫放入各頻道的佇列，並發數量與速率仍由
+        max_in_flight、頻道與全域的令牌桶限制。
+
+        Args:
+            channel_ids (Iterable[str]): 頻道 ID
+            content (str): 訊息內容
+            listener (Optional[Callable[[SendJob], None]]): 狀態變更時在事件迴圈上呼叫
+
+        Returns:
+            List[str]: 依頻道順序排列的工作 ID
+
+        Raises:
+            ValueError: 訊息內容超過 MAX_MESSAGE_LENGTH
+        """
+        if len(content) > MAX_MESSAGE_LENGTH:
+            raise ValueError(f'訊息內容超過 {MAX_MESSAGE_LENGTH} 字元')
+        jobs = [SendJob(str(channel_id), content, listener) for channel_id in channel_ids]
+        with self._jobs_lock:
+            for job in jobs:
+                self._jobs[job.id] = job
+            self.stats['submitted'] += len(jobs)
+            self._trim_jobs()
+        self.bot.loop.call_soon_threadsafe(self._enqueue_all, jobs)
+        return [job.id for job in jobs]
+
+    def _trim_jobs(self) -> None:
+        """
+        移除最舊的工作紀錄，呼叫前需持有鎖
+        """
+        while len(self._jobs) > self.max_jobs:
+            self._jobs.popitem(last=False)
+
+    def _enqueue(self, job: SendJob) -> None:
+        """
+        在事件迴圈中把工作放入頻道佇列，並確保該頻道有發送任務
+
+        Args:
+            job (SendJob): 發送工作
+        """
+        self._queues.setdefault(job.channel_id, deque()).append(job)
+        worker = self._workers.get(job.channel_id)
+        if worker is None or worker.done():
+            self._workers[job.channel_id] = asyncio.get_running_loop().create_task(
+                self._channel_worker(job.channel_id))
+
+    def _enqueue_all(self, jobs: List[SendJob]) -> None:
+        for job in jobs:
+            self._enqueue(job)
+
+    @staticmethod
+    def _notify(job: SendJob) -> None:
+        # 呼叫端的通知失敗不應中斷頻道的發送任務
+        if job.listener is None:
+            return
+        try:
+            job.listener(job)
+        except Exception as e:
+            logger.error("通知發送工作 %s 的狀態時發生錯誤: %s", job.id, e, exc_info=True)
+
+    def _bucket(self, channel_id: str) -> TokenBucket:
+        bucket = self._buckets.get(channel_id)
+        if bucket is None:
+            bucket = self._buckets[channel_id] = TokenBucket(
+                self.channel_rate, self.channel_period)
+        return bucket
+
+    @staticmethod
+    def _coalesce(queue: Deque[SendJob]) -> List[SendJob]:
+        """
+        從佇列取出一則訊息，並合併之後不超過長度上限的相鄰訊息
+
+        Args:
+            queue (Deque[SendJob]): 頻道佇列
+
+        Returns:
+            List[SendJob]: 合併成同一則訊息的工作
+        """
+        batch = [queue.popleft()]
+        length = len(batch[0].content)
+        while queue and length + 1 + len(queue[0].content) <= MAX_MESSAGE_LENGTH:
+            job = queue.popleft()
+            length += 1 + len(job.content)
+            batch.append(job)
+        return batch
+
+    async def _channel_worker(self, channel_id: str) -> None:
+        """
+        依速率限制依序發送頻道佇列中的訊息，佇列清空後結束
+
+        Args:
+            channel_id (str): 頻道 ID
+        """
+        queue = self._queues[channel_id]
+        bucket = self._bucket(channel_id)
+        while queue:
+            await bucket.acquire()
+            await self.global_bucket.acquire()
+            # 取得發送名額後才從佇列取出，關閉時等待中的工作仍留在佇列裡
+            async with self._in_flight:
+                if not queue:
+                    break
+                batch = self._coalesce(queue)
+                await self._send(channel_id, batch, bucket, queue)
+
+        self._queues.pop(channel_id, None)
+        self._workers.pop(channel_id, None)
+        self._release_bucket(channel_id)
+
+    def _release_bucket(self, channel_id: str) -> None:
+        """
+        移除閒置頻道的令牌桶；令牌補滿的令牌桶與新建立的相同，未補滿時等補滿後再移除
+
+        Args:
+            channel_id (str): 頻道 ID
+        """
+        bucket = self._buckets.get(channel_id)
+        if bucket is None or channel_id in self._queues:
+            return
+        refill = bucket.time_to_full()
+        if refill > 0:
+            asyncio.get_running_loop().call_later(refill, self._release_bucket, channel_id)
+        else:
+            del self._buckets[channel_id]
+
+    async def _send(self, channel_id: str, batch: List[SendJob], bucket: TokenBucket,
+                    queue: Deque[SendJob]) -> None:
+        """
+        發送一批合併後的訊息並更新工作狀態
+
+        Args:
+            channel_id (str): 頻道 ID
+            batch (List[SendJob]): 合併成同一則訊息的工作
+            bucket (TokenBucket): 頻道的令牌桶
+            queue (Deque[SendJob]): 頻道佇列，速率限制時工作會放回佇列前端
+        """
+        for job in batch:
+            job.status = 'sending'
+            job.coalesced = len(batch)
+            job.attempts += 1
+
+        content = '\n'.join(job.content for job in batch)
+        error: Optional[str] = None
+        message_id: Optional[str] = None
+        self.stats['requests'] += 1
+        _REST_SEND.inc()
+        try:
+            channel = self.bot.get_channel(int(channel_id))
+            if channel is None:
+                raise ValueError(f"找不到頻道: {channel_id}")
+            message = await channel.send(content)
+            message_id = str(message.id) if message is not None else None
+        except asyncio.CancelledError:
+            # 關閉時中斷了發送，無法確定訊息是否已送出，標記為失敗而不是停在 sending
+            finished = time.monotonic()
+            for job in batch:
+                job.finished = finished
+                job.error = '機器人已關閉'
+                job.status = 'failed'
+                self._notify(job)
+            self.stats['failed'] += len(batch)
+            raise
+        except discord.RateLimited as e:
+            # 需要等待的時間超過 max_ratelimit_timeout，discord.py 不會自行等待
+            error = f"429: 需等待 {e.retry_after:.1f} 秒"
+            if self._rate_limited(channel_id, batch, bucket, queue, e.retry_after):
+                return
+        except discord.HTTPException as e:
+            # discord.py 自行重試後仍收到 429，沒有 retry_after 時以頻道的週期等待
+            error = f"{e.status}: {e.text}"
+            if e.status == 429 and self._rate_limited(channel_id, batch, bucket, queue,
+                                                      self.channel_period):
+                return
+        except Exception as e:
+            error = str(e)
+
+        finished = time.monotonic()
+        for job in batch:
+            job.finished = finished
+            job.message_id = message_id
+            job.error = error
+            job.status = 'failed' if error else 'sent'
+            self._notify(job)
+
+        if error:
+            self.stats['failed'] += len(batch)
+            logger.error("發送訊息到頻道 %s 時發生錯誤: %s", channel_id, error)
+        else:
+            self.stats['sent'] += len(batch)
+            self.stats['coalesced'] += len(batch) - 1
+            message_logger.debug("已發送訊息到頻道 %s，合併 %s 則", channel_id, len(batch))
+
+    def _rate_limited(self, channel_id: str, batch: List[SendJob], bucket: TokenBucket,
+                      queue: Deque[SendJob], retry_after: float) -> bool:
+        """
+        處理速率限制：清空頻道的令牌桶，工作還能重試時放回佇列
+
+        Args:
+            channel_id (str): 頻道 ID
+            batch (List[SendJob]): 合併成同一則訊息的工作
+            bucket (TokenBucket): 頻道的令牌桶
+            queue (Deque[SendJob]): 頻道佇列
+            retry_after (float): 需要等待的秒數
+
+        Returns:
+            bool: 是否已放回佇列重試
+        """
+        self.stats['rate_limited'] += 1
+        REST_RATE_LIMITED.inc()
+        bucket.penalize(retry_after)
+        if all(job.attempts < self.max_attempts for job in batch):
+            self._retry(channel_id, batch, queue, retry_after)
+            return True
+        for job in batch:
+            job.retry_after = retry_after
+        return False
+
+    def _retry(self, channel_id: str, batch: List[SendJob], queue: Deque[SendJob],
+               retry_after: float) -> None:
+        """
+        把被速率限制的工作放回佇列前端，頻道的令牌桶已清空到 retry_after 秒後
+
+        Args:
+            channel_id (str): 頻道 ID
+            batch (List[SendJob]): 合併成同一則訊息的工作
+            queue (Deque[SendJob]): 頻道佇列
+            retry_after (float): Discord 要求等待的秒數
+        """
+        for job in batch:
+            job.status = 'retrying'
+            job.retry_after = retry_after
+            self._notify(job)
+        queue.extendleft(reversed(batch))
+        self.stats['retried'] += len(batch)
+        logger.warning("發送訊息到頻道 %s 時被速率限制，%.2f 秒後重試", channel_id, retry_after)
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        查詢工作狀態
+
+        Args:
+            job_id (str): 工作 ID
+
+        Returns:
+            Optional[Dict[str, Any]]: 工作狀態，找不到時返回 None
+        """
+        with self._jobs_lock:
+            job = self._jobs.get(job_id)
+        return job.to_dict() if job else None
+
+    def queue_depth(self) -> int:
+        """
+        獲取所有頻道佇列中等待發送的工作總數
+
+        Returns:
+            int: 等待發送的工作數
+        """
+        return sum(len(queue) for queue in list(self._queues.values()))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        獲取發送佇列的統計資料
+
+        Returns:
+            Dict[str, Any]: 統計資料，包含每個頻道的佇列長度
+        """
+        stats: Dict[str, Any] = dict(self.stats)
+        stats['queued'] = {channel_id: len(queue)
+                           for channel_id, queue in list(self._queues.items())}
+        return stats
+
+    async def close(self) -> None:
+        """
+        停止所有發送任務，尚未發送的工作標記為失敗
+        """
+        workers = list(self._workers.values())
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+        for queue in self._queues.values():
+            for job in queue:
+                job.status = 'failed'
+                job.error = '機器人已關閉'
+                job.finished = time.monotonic()
+                self._notify(job)
+        self._queues.clear()
+        self._workers.clear()
@@ -0,0 +1,516 @@
+"""
+歷史訊息匯出模組
+
+此模組在背景完整讀取頻道的歷史訊息，寫成 gzip 壓縮的 NDJSON（每行一則訊息）：
+- 多個頻道同時讀取，同時進行的 REST 請求數有上限，各頻道輪流取得請求名額
+- 每個頻道（Discord 讀取訊息的路由以頻道區分）各有一個令牌桶，並與發送佇列共用全域令牌桶；
+  收到 429 時清空該頻道的令牌桶，依 retry_after 等待後重試同一頁
+- 由舊到新逐頁讀取，每頁壓縮成一個 gzip 成員附加到檔案，寫入後更新該頻道的檢查點
+  （最後的 snowflake、訊息數與檔案長度）。記憶體中只保留目前這一頁
+- 程序重新啟動後從檢查點繼續；檔案中超過檢查點的部分是中斷時寫到一半的資料，繼續前會截掉
+
+檔案配置（EXPORT_DIR/<工作 ID>/）：
+- job.json：工作的頻道列表與狀態
+- <頻道 ID>.ndjson.gz：匯出的訊息，可直接以 gzip 讀取
+- <頻道 ID>.checkpoint.json：頻道的檢查點
+"""
+
+import asyncio
+import gzip
+import json
+import os
+import re
+import time
+import uuid
+from functools import partial
+from typing import Any, Dict, Iterable, List, Optional
+
+import discord
+from discord.ext import commands
+
+from .dispatcher import TokenBucket
+from .logger import logger
+from .metrics import REST_RATE_LIMITED, REST_REQUESTS
+from .serializer import serialize_message
+
+# 匯出讀取歷史訊息的 REST 請求計數
+_REST_EXPORT = REST_REQUESTS.labels('export')
+
+# Discord 每次讀取歷史訊息的上限
+PAGE_SIZE = 100
+
+# 工作 ID 與頻道 ID 的格式，用來組成檔案路徑前先檢查
+_JOB_ID = re.compile(r'^[0-9a-f]{32}$')
+_CHANNEL_ID = re.compile(r'^[0-9]{1,20}$')
+
+# 工作狀態
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+
+def output_path(directory: str, job_id: str, channel_id: str) -> str:
+    """
+    取得頻道匯出檔案的路徑
+
+    Args:
+        directory (str): 匯出目錄
+        job_id (str): 工作 ID
+        channel_id (str): 頻道 ID
+
+    Returns:
+        str: 檔案路徑
+
+    Raises:
+        ValueError: 工作 ID 或頻道 ID 的格式不正確
+    """
+    if not _JOB_ID.match(job_id) or not _CHANNEL_ID.match(channel_id):
+        raise ValueError('工作 ID 或頻道 ID 的格式不正確')
+    return os.path.join(directory, job_id, f'{channel_id}.ndjson.gz')
+
+
+def _write_json(path: str, payload: Dict[str, Any]) -> None:
+    # 以暫存檔加 os.replace 寫入，中斷的寫入不會留下損毀的檔案
+    temporary = path + '.tmp'
+    with open(temporary, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False)
+    os.replace(temporary, path)
+
+
+def _read_json(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning("無法讀取匯出檔案 %s: %s", path, e)
+        return None
+
+
+class ChannelProgress:
+    """
+    單一頻道的匯出進度，也就是該頻道的檢查點
+    """
+
+    __slots__ = ('channel_id', 'after', 'messages', 'offset', 'done', 'error')
+
+    def __init__(self, channel_id: str, after: int = 0, messages: int = 0, offset: int = 0,
+                 done: bool = False, error: Optional[str] = None) -> None:
+        self.channel_id = channel_id
+        # 已匯出的最後一則訊息 ID，下一頁從此之後讀取
+        self.after = after
+        self.messages = messages
+        # 檢查點涵蓋的檔案長度
+        self.offset = offset
+        self.done = done
+        self.error = error
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'channel_id': self.channel_id,
+            'after': str(self.after),
+            'messages': self.messages,
+            'bytes': self.offset,
+            'done': self.done,
+            'error': self.error
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ChannelProgress':
+        return cls(data['channel_id'], int(data['after']), data['messages'], data['bytes'],
+                   data['done'], data.get('error'))
+
+
+class ExportJob:
+    """
+    匯出工作
+
+    此類別負責：
+    - 保存工作的頻道、狀態與各頻道的進度
+    - 計算本次執行的匯出速率（每秒訊息數）
+    """
+
+    def __init__(self, job_id: str, directory: str, channel_ids: List[str],
+                 status: str = RUNNING, created: Optional[float] = None) -> None:
+        """
+        初始化匯出工作
+
+        Args:
+            job_id (str): 工作 ID
+            directory (str): 此工作的輸出目錄
+            channel_ids (List[str]): 要匯出的頻道 ID
+            status (str): 工作狀態
+            created (Optional[float]): 建立時間（UNIX 時間），None 表示現在
+        """
+        self.id = job_id
+        self.directory = directory
+        self.channel_ids = channel_ids
+        self.status = status
+        self.created = created if created is not None else time.time()
+        self.channels: Dict[str, ChannelProgress] = {
+            channel_id: ChannelProgress(channel_id) for channel_id in channel_ids}
+        self.task: Optional[asyncio.Task] = None
+        # 本次執行的開始時間與匯出的訊息數，用來計算速率
+        self.run_started: Optional[float] = None
+        self.run_finished: Optional[float] = None
+        self.run_messages = 0
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def save(self) -> None:
+        """
+        寫入工作的頻道列表與狀態
+        """
+        _write_json(self.path('job.json'), {
+            'id': self.id,
+            'channel_ids': self.channel_ids,
+            'status': self.status,
+            'created': self.created
+        })
+
+    def save_channel(self, progress: ChannelProgress) -> None:
+        """
+        寫入頻道的檢查點
+
+        Args:
+            progress (ChannelProgress): 頻道進度
+        """
+        _write_json(self.path(f'{progress.channel_id}.checkpoint.json'), progress.to_dict())
+
+    @classmethod
+    def load(cls, directory: str) -> Optional['ExportJob']:
+        """
+        從輸出目錄載入工作與各頻道的檢查點
+
+        Args:
+            directory (str): 此工作的輸出目錄
+
+        Returns:
+            Optional[ExportJob]: 匯出工作，job.json 不存在或損毀時返回 None
+        """
+        data = _read_json(os.path.join(directory, 'job.json'))
+        if data is None:
+            return None
+        job = cls(data['id'], directory, data['channel_ids'], data['status'], data['created'])
+        for channel_id in job.channel_ids:
+            checkpoint = _read_json(job.path(f'{channel_id}.checkpoint.json'))
+            if checkpoint is not None:
+                job.channels[channel_id] = ChannelProgress.from_dict(checkpoint)
+        return job
+
+    @property
+    def messages(self) -> int:
+        return sum(progress.messages for progress in self.channels.values())
+
+    def messages_per_second(self) -> float:
+        if self.run_started is None:
+            return 0.0
+        end = self.run_finished if self.run_finished is not None else time.monotonic()
+        elapsed = end - self.run_started
+        return round(self.run_messages / elapsed, 1) if elapsed > 0 else 0.0
+
+    def to_dict(self, detail: bool = False) -> Dict[str, Any]:
+        """
+        轉換為可回傳給控制面板的字典
+
+        Args:
+            detail (bool): 是否包含每個頻道的進度
+
+        Returns:
+            Dict[str, Any]: 工作狀態
+        """
+        channels = list(self.channels.values())
+        result: Dict[str, Any] = {
+            'id': self.id,
+            'status': self.status,
+            'created': self.created,
+            'channels': len(channels),
+            'channels_done': sum(1 for progress in channels if progress.done),
+            'channels_failed': sum(1 for progress in channels if progress.error),
+            'messages': self.messages,
+            'bytes': sum(progress.offset for progress in channels),
+            'messages_per_second': self.messages_per_second()
+        }
+        if detail:
+            result['channel_progress'] = [progress.to_dict() for progress in channels]
+        return result
+
+
+class HistoryExporter:
+    """
+    歷史訊息匯出
+
+    此類別負責：
+    - 建立、取消與列出匯出工作
+    - 在事件迴圈上同時讀取多個頻道，限制同時進行的請求數與每個頻道的速率
+    - 逐頁寫入壓縮檔案並更新檢查點，重新啟動後繼續未完成的工作
+    """
+
+    def __init__(self, bot: commands.Bot, directory: str, concurrency: int = 4,
+                 global_bucket: Optional[TokenBucket] = None, channel_rate: int = 5,
+                 channel_period: float = 5.0) -> None:
+        """
+        初始化歷史訊息匯出
+
+        Args:
+            bot (commands.Bot): Discord 機器人實例
+            directory (str): 匯出目錄
+            concurrency (int): 所有工作合計同時進行的 REST 請求上限
+            global_bucket (Optional[TokenBucket]): 與其他 REST 請求共用的全域令牌桶
+            channel_rate (int): 每個頻道每個週期允許的請求數
+            channel_period (float): 頻道速率限制的週期秒數
+        """
+        self.bot = bot
+        self.directory = directory
+        self.concurrency = concurrency
+        self.global_bucket = global_bucket
+        self.channel_rate = channel_rate
+        self.channel_period = channel_period
+        self._slots = asyncio.Semaphore(concurrency)
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._jobs: Dict[str, ExportJob] = {}
+        self.load()
+
+    def load(self) -> None:
+        """
+        載入匯出目錄中的工作，未完成的工作在 resume 時繼續
+        """
+        if not os.path.isdir(self.directory):
+            return
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if not _JOB_ID.match(name) or not os.path.isdir(path):
+                continue
+            job = ExportJob.load(path)
+            if job is not None:
+                self._jobs[job.id] = job
+        unfinished = sum(1 for job in self._jobs.values() if job.status == RUNNING)
+        if self._jobs:
+            logger.info("已載入 %s 個匯出工作，%s 個尚未完成", len(self._jobs), unfinished)
+
+    def resume(self) -> None:
+        """
+        繼續未完成的工作，必須在事件迴圈上呼叫；已在執行中的工作不受影響
+        """
+        for job in self._jobs.values():
+            if job.status == RUNNING and (job.task is None or job.task.done()):
+                logger.info("繼續匯出工作 %s（已匯出 %s 則訊息）", job.id, job.messages)
+                self._start(job)
+
+    async def start(self, channel_ids: Iterable[str]) -> ExportJob:
+        """
+        建立並開始匯出工作
+
+        Args:
+            channel_ids (Iterable[str]): 要匯出的頻道 ID
+
+        Returns:
+            ExportJob: 匯出工作
+        """
+        job_id = uuid.uuid4().hex
+        channel_ids = [str(channel_id) for channel_id in channel_ids]
+        for channel_id in channel_ids:
+            if not _CHANNEL_ID.match(channel_id):
+                raise ValueError(f"頻道 ID 的格式不正確: {channel_id}")
+        job = ExportJob(job_id, os.path.join(self.directory, job_id), channel_ids)
+        os.makedirs(job.directory, exist_ok=True)
+        job.save()
+        self._jobs[job.id] = job
+        logger.info("建立匯出工作 %s，共 %s 個頻道", job.id, len(channel_ids))
+        self._start(job)
+        return job
+
+    def _start(self, job: ExportJob) -> None:
+        job.run_started = time.monotonic()
+        job.run_finished = None
+        job.run_messages = 0
+        job.task = asyncio.get_running_loop().create_task(self._run(job))
+
+    async def cancel(self, job_id: str) -> Optional[ExportJob]:
+        """
+        取消匯出工作，已寫入的檔案與檢查點保留
+
+        Args:
+            job_id (str): 工作 ID
+
+        Returns:
+            Optional[ExportJob]: 匯出工作，找不到時返回 None
+        """
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        if job.status == RUNNING:
+            job.status = CANCELLED
+            if job.task is not None:
+                job.task.cancel()
+                await asyncio.gather(job.task, return_exceptions=True)
+            job.save()
+            logger.info("已取消匯出工作 %s", job.id)
+        return job
+
+    def get(self, job_id: str) -> Optional[ExportJob]:
+        return self._jobs.get(job_id)
+
+    def jobs(self) -> List[ExportJob]:
+        # 最新的工作在前
+        return sorted(self._jobs.values(), key=lambda job: job.created, reverse=True)
+
+    async def close(self) -> None:
+        """
+        停止所有匯出任務；未完成的工作保持 running，下次啟動時從檢查點繼續
+        """
+        tasks = [job.task for job in self._jobs.values()
+                 if job.task is not None and not job.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, job: ExportJob) -> None:
+        pending = [progress for progress in job.channels.values() if not progress.done]
+        try:
+            await self._export_channels(job, pending)
+            job.status = DONE
+            logger.info("匯出工作 %s 已完成，共 %s 則訊息（%s 則/秒）",
+                        job.id, job.messages, job.messages_per_second())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # 例如磁碟空間不足；檢查點保留，修正後可重新建立工作
+            job.status = FAILED
+            logger.error("匯出工作 %s 發生錯誤: %s", job.id, e, exc_info=True)
+        finally:
+            job.run_finished = time.monotonic()
+        await asyncio.get_running_loop().run_in_executor(None, job.save)
+
+    async def _export_channels(self, job: ExportJob, pending: List[ChannelProgress]) -> None:
+        """
+        同時匯出多個頻道；任一頻道發生錯誤或工作被取消時，先停止並等待其他頻道
+
+        Args:
+            job (ExportJob): 匯出工作
+            pending (List[ChannelProgress]): 尚未完成的頻道進度
+        """
+        if not pending:
+            return
+        tasks = [asyncio.ensure_future(self._export_channel(job, progress))
+                 for progress in pending]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        for task in done:
+            if not task.cancelled() and task.exception() is not None:
+                raise task.exception()
+
+    def _bucket(self, channel_id: str) -> TokenBucket:
+        bucket = self._buckets.get(channel_id)
+        if bucket is None:
+            bucket = self._buckets[channel_id] = TokenBucket(
+                self.channel_rate, self.channel_period)
+        return bucket
+
+    async def _export_channel(self, job: ExportJob, progress: ChannelProgress) -> None:
+        """
+        逐頁匯出一個頻道，直到讀完最新的訊息
+
+        Args:
+            job (ExportJob): 匯出工作
+            progress (ChannelProgress): 頻道進度
+        """
+        loop = asyncio.get_running_loop()
+        channel = self.bot.get_channel(int(progress.channel_id))
+        if channel is None:
+            progress.error = '找不到頻道'
+            progress.done = True
+            await loop.run_in_executor(None, job.save_channel, progress)
+            return
+
+        path = job.path(f'{progress.channel_id}.ndjson.gz')
+        output = await loop.run_in_executor(None, self._open_output, path, progress.offset)
+        write = None
+        try:
+            while not progress.done:
+                try:
+                    page = await self._fetch_page(channel, progress.after)
+                except discord.HTTPException as e:
+                    # 例如沒有讀取訊息記錄的權限
+                    progress.error = f"{e.status}: {e.text}"
+                    progress.done = True
+                    logger.warning("匯出頻道 %s 時發生錯誤: %s", progress.channel_id, progress.error)
+                else:
+                    if page:
+                        # 取消任務時執行緒中的寫入不會中斷，保留 future 以便寫完才關閉檔案
+                        write = loop.run_in_executor(None, self._append, output, page)
+                        await asyncio.shield(write)
+                        progress.after = page[-1].id
+                        progress.messages += len(page)
+                        progress.offset = output.tell()
+                        job.run_messages += len(page)
+                    progress.done = len(page) < PAGE_SIZE
+                await loop.run_in_executor(None, job.save_channel, progress)
+        finally:
+            if write is not None and not write.done():
+                write.add_done_callback(partial(self._close_output, output))
+            else:
+                output.close()
+
+    @staticmethod
+    def _close_output(output, write: asyncio.Future) -> None:
+        if not write.cancelled() and write.exception() is not None:
+            logger.warning("匯出檔案 %s 在取消時寫入失敗: %s", output.name, write.exception())
+        output.close()
+
+    @staticmethod
+    def _open_output(path: str, offset: int):
+        # 截掉檢查點之後的資料，從檢查點的位置繼續附加
+        output = open(path, 'r+b' if os.path.exists(path) else 'wb')
+        output.truncate(offset)
+        output.seek(offset)
+        return output
+
+    @staticmethod
+    def _append(output, page: List) -> None:
+        # 每頁是一個獨立的 gzip 成員，寫入並同步到磁碟後才更新檢查點
+        lines = ''.join(json.dumps(record.to_dict(), ensure_ascii=False) + '\n'
+                        for record in page)
+        output.write(gzip.compress(lines.encode('utf-8'), compresslevel=6))
+        output.flush()
+        os.fsync(output.fileno())
+
+    async def _fetch_page(self, channel: Any, after: int) -> List:
+        """
+        讀取 after 之後最舊的一頁訊息，被速率限制時等待後重試
+
+        Args:
+            channel (Any): 頻道
+            after (int): 從此訊息 ID 之後開始讀取
+
+        Returns:
+            List: 由舊到新的 MessageRecord
+        """
+        bucket = self._bucket(str(channel.id))
+        while True:
+            await bucket.acquire()
+            if self.global_bucket is not None:
+                await self.global_bucket.acquire()
+            async with self._slots:
+                _REST_EXPORT.inc()
+                try:
+                    return [serialize_message(message) async for message in channel.history(
+                        limit=PAGE_SIZE, after=discord.Object(id=after), oldest_first=True)]
+                except discord.RateLimited as e:
+                    # 需要等待的時間超過 max_ratelimit_timeout，discord.py 不會自行等待
+                    retry_after = e.retry_after
+                except discord.HTTPException as e:
+                    # discord.py 自行重試後仍收到 429，以頻道的週期等待
+                    if e.status != 429:
+                        raise
+                    retry_after = self.channel_period
+            REST_RATE_LIMITED.inc()
+            bucket.penalize(retry_after)
+            logger.warning("匯出頻道 %s 時被速率限制，%.2f 秒後重試", channel.id, retry_after)
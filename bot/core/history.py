@@ -0,0 +1,242 @@
+"""
+訊息歷史模組
+
+此模組提供固定容量、依訊息 ID 排序的環形緩衝區，用於保存最新的訊息：
+- 以 Discord snowflake ID（整數）作為排序鍵，ID 本身即包含建立時間
+- 「某 ID 之後／之前」的查詢為二分搜尋加切片，不需要解析時間
+- 超過容量時覆蓋最舊的訊息，記憶體用量固定
+"""
+
+import threading
+from datetime import datetime
+from typing import Any, Iterable, List, Optional
+
+import discord
+
+
+def timestamp_to_snowflake(timestamp: Optional[str], high: bool = True) -> Optional[int]:
+    """
+    將 ISO 格式的時間戳記轉換為 snowflake ID，供舊版以時間查詢的介面使用
+
+    Args:
+        timestamp (Optional[str]): ISO 格式的時間戳記
+        high (bool): True 時返回該毫秒內最大的 ID，用於「之後」的查詢
+
+    Returns:
+        Optional[int]: snowflake ID，格式錯誤時返回 None
+    """
+    if not timestamp:
+        return None
+    try:
+        # 清理時間戳記格式（URL 中的 '+' 可能被轉成空白）
+        timestamp = timestamp.strip().replace(' ', '+').replace('Z', '+00:00')
+        return discord.utils.time_snowflake(datetime.fromisoformat(timestamp), high=high)
+    except ValueError:
+        return None
+
+
+class MessageRing:
+    """
+    固定容量的訊息環形緩衝區
+
+    此類別負責：
+    - 依排序鍵（訊息 ID）保存訊息
+    - 超過容量時捨棄最舊的訊息
+    - 以二分搜尋查詢某個鍵之後或之前的訊息
+    """
+
+    def __init__(self, capacity: int) -> None:
+        """
+        初始化環形緩衝區
+
+        Args:
+            capacity (int): 最大訊息數量
+        """
+        self.capacity = capacity
+        self._keys: List[int] = [0] * capacity
+        self._items: List[Any] = [None] * capacity
+        self._start = 0
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _key_at(self, index: int) -> int:
+        return self._keys[(self._start + index) % self.capacity]
+
+    def _bisect_right(self, key: int) -> int:
+        """
+        找出第一個排序鍵大於 key 的邏輯位置
+
+        Args:
+            key (int): 排序鍵
+
+        Returns:
+            int: 邏輯位置
+        """
+        low, high = 0, self._size
+        while low < high:
+            middle = (low + high) // 2
+            if key < self._key_at(middle):
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+    def _bisect_left(self, key: int) -> int:
+        """
+        找出第一個排序鍵大於或等於 key 的邏輯位置
+
+        Args:
+            key (int): 排序鍵
+
+        Returns:
+            int: 邏輯位置
+        """
+        low, high = 0, self._size
+        while low < high:
+            middle = (low + high) // 2
+            if self._key_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _slice(self, begin: int, end: int) -> List[Any]:
+        """
+        取出邏輯位置 begin 到 end 之間的訊息
+
+        Args:
+            begin (int): 起始邏輯位置
+            end (int): 結束邏輯位置（不包含）
+
+        Returns:
+            List[Any]: 訊息列表
+        """
+        if begin >= end:
+            return []
+        first = (self._start + begin) % self.capacity
+        last = first + (end - begin)
+        if last <= self.capacity:
+            return self._items[first:last]
+        return self._items[first:] + self._items[:last - self.capacity]
+
+    def append(self, key: int, item: Any) -> None:
+        """
+        加入一條訊息
+
+        Args:
+            key (int): 排序鍵
+            item (Any): 訊息資料
+        """
+        if self.capacity <= 0:
+            return
+
+        with self._lock:
+            if self._size and key < self._key_at(self._size - 1):
+                # 亂序到達的訊息，插入到正確的位置
+                self._insert_sorted(key, item)
+                return
+
+            if self._size < self.capacity:
+                index = (self._start + self._size) % self.capacity
+                self._size += 1
+            else:
+                # 覆蓋最舊的訊息
+                index = self._start
+                self._start = (self._start + 1) % self.capacity
+
+            self._keys[index] = key
+            self._items[index] = item
+
+    def _insert_sorted(self, key: int, item: Any) -> None:
+        """
+        將亂序的訊息插入到排序後的位置，呼叫前需持有鎖
+
+        Args:
+            key (int): 排序鍵
+            item (Any): 訊息資料
+        """
+        position = self._bisect_right(key)
+        if self._size == self.capacity:
+            if position == 0:
+                # 比緩衝區中所有訊息都舊，直接捨棄
+                return
+            self._start = (self._start + 1) % self.capacity
+            self._size -= 1
+            position -= 1
+
+        # 將 position 之後的訊息往後移一格
+        for index in range(self._size, position, -1):
+            target = (self._start + index) % self.capacity
+            source = (self._start + index - 1) % self.capacity
+            self._keys[target] = self._keys[source]
+            self._items[target] = self._items[source]
+
+        target = (self._start + position) % self.capacity
+        self._keys[target] = key
+        self._items[target] = item
+        self._size += 1
+
+    def extend(self, entries: Iterable[tuple]) -> None:
+        """
+        加入多條訊息
+
+        Args:
+            entries (Iterable[tuple]): (排序鍵, 訊息資料) 的序列
+        """
+        for key, item in entries:
+            self.append(key, item)
+
+    def after(self, key: int, limit: Optional[int] = None) -> List[Any]:
+        """
+        取得排序鍵大於 key 的訊息，由舊到新取前 limit 條
+
+        Args:
+            key (int): 排序鍵
+            limit (Optional[int]): 最多返回的訊息數量，None 表示不限制
+
+        Returns:
+            List[Any]: 訊息列表，依排序鍵排列
+        """
+        with self._lock:
+            begin = self._bisect_right(key)
+            end = self._size if limit is None else min(self._size, begin + limit)
+            return self._slice(begin, end)
+
+    def before(self, key: int, limit: Optional[int] = None) -> List[Any]:
+        """
+        取得排序鍵小於 key 的訊息，由新到舊取前 limit 條，用於往回翻頁
+
+        Args:
+            key (int): 排序鍵
+            limit (Optional[int]): 最多返回的訊息數量，None 表示不限制
+
+        Returns:
+            List[Any]: 訊息列表，依排序鍵排列
+        """
+        with self._lock:
+            end = self._bisect_left(key)
+            begin = 0 if limit is None else max(0, end - limit)
+            return self._slice(begin, end)
+
+    def items(self) -> List[Any]:
+        """
+        取得所有訊息
+
+        Returns:
+            List[Any]: 訊息列表，依排序鍵排列
+        """
+        with self._lock:
+            return self._slice(0, self._size)
+
+    def clear(self) -> None:
+        """
+        清空緩衝區
+        """
+        with self._lock:
+            self._keys = [0] * self.capacity
+            self._items = [None] * self.capacity
+            self._start = 0
+            self._size = 0
@@ -0,0 +1,158 @@
+"""
+訊息推送模組
+
+此模組提供依頻道分組的訊息推送中心（fan-out hub）：
+- on_message 事件直接把新訊息發布到對應頻道
+- 每個訂閱者（例如網頁的 SSE 連線）擁有自己的有界佇列
+- 訂閱者處理太慢時丟棄其佇列內容，並通知它重新同步
+"""
+
+import asyncio
+import queue
+import threading
+from typing import Any, Dict, Optional, Set, Union
+
+from .logger import logger
+
+# 通知訂閱者需要重新同步的哨兵值
+RESYNC = object()
+# 通知訂閱者推送中心已關閉的哨兵值
+CLOSED = object()
+
+
+class MessageHub:
+    """
+    訊息推送中心
+
+    此類別負責：
+    - 管理每個頻道的訂閱者佇列
+    - 將新訊息發布給該頻道的所有訂閱者
+    - 發布時不等待，可從任何執行緒呼叫
+
+    訂閱者可以是 queue.Queue（供執行緒使用）或 asyncio.Queue（供事件迴圈上的
+    協程使用，此時必須在事件迴圈的執行緒上發布）。
+    """
+
+    def __init__(self, max_queue: int = 256) -> None:
+        """
+        初始化訊息推送中心
+
+        Args:
+            max_queue (int): 每個訂閱者佇列的最大長度
+        """
+        self.max_queue = max_queue
+        self._subscribers: Dict[str, Set[Union[queue.Queue, asyncio.Queue]]] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel_id: str,
+                  subscriber: Optional[Union[queue.Queue, asyncio.Queue]] = None
+                  ) -> Union[queue.Queue, asyncio.Queue]:
+        """
+        訂閱指定頻道的新訊息
+
+        Args:
+            channel_id (str): 頻道 ID
+            subscriber (Optional[Union[queue.Queue, asyncio.Queue]]): 自訂的接收佇列，
+                未指定時建立 queue.Queue
+
+        Returns:
+            Union[queue.Queue, asyncio.Queue]: 接收新訊息的佇列
+        """
+        if subscriber is None:
+            subscriber = queue.Queue(maxsize=self.max_queue)
+        with self._lock:
+            self._subscribers.setdefault(channel_id, set()).add(subscriber)
+        logger.debug("新增頻道 %s 的訂閱者", channel_id)
+        return subscriber
+
+    def unsubscribe(self, channel_id: str,
+                    subscriber: Union[queue.Queue, asyncio.Queue]) -> None:
+        """
+        取消訂閱
+
+        Args:
+            channel_id (str): 頻道 ID
+            subscriber (Union[queue.Queue, asyncio.Queue]): 訂閱時取得的佇列
+        """
+        with self._lock:
+            subscribers = self._subscribers.get(channel_id)
+            if subscribers is None:
+                return
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[channel_id]
+        logger.debug("移除頻道 %s 的訂閱者", channel_id)
+
+    def has_subscribers(self, channel_id: str) -> bool:
+        """
+        檢查頻道是否有訂閱者
+
+        Args:
+            channel_id (str): 頻道 ID
+
+        Returns:
+            bool: 是否有訂閱者
+        """
+        return channel_id in self._subscribers
+
+    def publish(self, channel_id: str, payload: Any) -> int:
+        """
+        發布訊息給頻道的所有訂閱者
+
+        Args:
+            channel_id (str): 頻道 ID
+            payload (Any): 要發布的資料
+
+        Returns:
+            int: 收到訊息的訂閱者數量
+        """
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel_id, ()))
+
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(payload)
+            except (queue.Full, asyncio.QueueFull):
+                # 訂閱者跟不上，清空佇列並要求重新同步
+                self._reset(subscriber, RESYNC)
+                logger.warning("頻道 %s 的訂閱者佇列已滿，要求重新同步", channel_id)
+        return len(subscribers)
+
+    @staticmethod
+    def _reset(subscriber: Union[queue.Queue, asyncio.Queue], marker: Any) -> None:
+        """
+        清空訂閱者佇列並放入標記
+
+        Args:
+            subscriber (Union[queue.Queue, asyncio.Queue]): 訂閱者佇列
+            marker (Any): 要放入的標記
+        """
+        try:
+            while True:
+                subscriber.get_nowait()
+        except (queue.Empty, asyncio.QueueEmpty):
+            pass
+        subscriber.put_nowait(marker)
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        獲取每個頻道的訂閱者數量
+
+        Returns:
+            Dict[str, int]: 頻道 ID 對應的訂閱者數量
+        """
+        with self._lock:
+            return {channel_id: len(subscribers)
+                    for channel_id, subscribers in self._subscribers.items()}
+
+    def close(self) -> None:
+        """
+        通知所有訂閱者推送中心已關閉
+        """
+        with self._lock:
+            subscribers = [subscriber
+                           for channel_subscribers in self._subscribers.values()
+                           for subscriber in channel_subscribers]
+            self._subscribers.clear()
+        for subscriber in subscribers:
+            self._reset(subscriber, CLOSED)
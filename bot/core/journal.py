@@ -0,0 +1,250 @@
+"""
+訊息日誌模組
+
+此模組提供一個只追加（append-only）的訊息日誌，用於取代每次都重寫整個
+JSON 檔案的儲存方式：
+- 每條訊息以一行 JSON 追加到檔案尾端
+- 群組提交：一批訊息只做一次 fsync
+- 檔案過大時於背景執行緒壓縮，只保留最新的訊息
+- 啟動時從檔案尾端反向讀取，不需解析整個檔案
+"""
+
+import json
+import os
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from .logger import logger
+
+# 反向讀取檔案時每次讀取的區塊大小
+_READ_BLOCK_SIZE = 64 * 1024
+# 檔案小於此大小時不進行壓縮
+_MIN_COMPACT_BYTES = 256 * 1024
+
+
+class MessageJournal:
+    """
+    只追加的訊息日誌
+
+    此類別負責：
+    - 以 JSON Lines 格式追加訊息
+    - 群組提交（每批訊息一次 fsync）
+    - 背景壓縮，只保留最新的 keep 條訊息
+    - 從檔案尾端讀取最新的訊息
+    """
+
+    def __init__(self, path: str, keep: int, compact_ratio: int = 10) -> None:
+        """
+        初始化訊息日誌
+
+        Args:
+            path (str): 日誌檔案路徑
+            keep (int): 壓縮後保留的訊息數量
+            compact_ratio (int): 檔案大小超過保留資料的幾倍時觸發壓縮
+        """
+        self.path = path
+        self.keep = keep
+        self.compact_ratio = compact_ratio
+
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._compact_thread: Optional[threading.Thread] = None
+        self._fh = None
+        self._size = 0
+        # 最近一次讀取尾端或壓縮時，保留資料所佔的位元組數
+        self._live_bytes = 0
+
+        self._open()
+
+    def _open(self) -> None:
+        """
+        開啟日誌檔案以供追加，並修復上次未寫完的最後一行
+        """
+        self._fh = open(self.path, 'ab')
+        self._size = self._fh.tell()
+        if self._size > 0:
+            with open(self.path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                last_byte = f.read(1)
+            if last_byte != b'\n':
+                # 上次寫入被中斷，補上換行讓下一筆從新的一行開始
+                self._fh.write(b'\n')
+                self._fh.flush()
+                self._size += 1
+
+    @property
+    def size(self) -> int:
+        # 目前日誌檔案的位元組數，快照以此判斷是否與日誌一致
+        with self._lock:
+            return self._size
+
+    def append_many(self, messages: Iterable[Dict]) -> int:
+        """
+        追加一批訊息並執行一次 fsync（群組提交）
+
+        Args:
+            messages (Iterable[Dict]): 要追加的訊息
+
+        Returns:
+            int: 實際寫入的訊息數量
+        """
+        lines = [
+            json.dumps(message, ensure_ascii=False, separators=(',', ':')) + '\n'
+            for message in messages
+        ]
+        if not lines:
+            return 0
+
+        data = ''.join(lines).encode('utf-8')
+        with self._lock:
+            self._fh.write(data)
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+            self._size += len(data)
+            should_compact = self._should_compact()
+
+        if should_compact:
+            self.compact_in_background()
+        return len(lines)
+
+    def _should_compact(self) -> bool:
+        """
+        判斷是否需要壓縮日誌檔案
+
+        Returns:
+            bool: 是否需要壓縮
+        """
+        threshold = max(_MIN_COMPACT_BYTES, self._live_bytes * self.compact_ratio)
+        return self._size > threshold
+
+    def _read_tail_lines(self, count: int, end: int) -> List[bytes]:
+        """
+        從指定位置往前讀取最後幾行
+
+        Args:
+            count (int): 要讀取的行數
+            end (int): 讀取的結束位置
+
+        Returns:
+            List[bytes]: 原始行資料（包含換行符號）
+        """
+        if count <= 0 or end <= 0:
+            return []
+
+        chunks: List[bytes] = []
+        newlines = 0
+        position = end
+        with open(self.path, 'rb') as f:
+            # 多讀一行，確保第一行是完整的
+            while position > 0 and newlines <= count:
+                read_size = min(_READ_BLOCK_SIZE, position)
+                position -= read_size
+                f.seek(position)
+                chunk = f.read(read_size)
+                newlines += chunk.count(b'\n')
+                chunks.append(chunk)
+
+        data = b''.join(reversed(chunks))
+        lines = data.splitlines(keepends=True)
+        if position > 0:
+            # 第一行可能只讀到一半，捨棄
+            lines = lines[1:]
+        return [line for line in lines[-count:] if line.strip()]
+
+    def read_tail(self, count: int) -> List[Dict]:
+        """
+        讀取最新的幾條訊息
+
+        Args:
+            count (int): 要讀取的訊息數量
+
+        Returns:
+            List[Dict]: 訊息列表，依寫入順序排列
+        """
+        with self._lock:
+            end = self._size
+
+        lines = self._read_tail_lines(count, end)
+        self._live_bytes = sum(len(line) for line in lines)
+
+        messages: List[Dict] = []
+        for line in lines:
+            try:
+                messages.append(json.loads(line))
+            except ValueError as e:
+                logger.warning("略過損毀的日誌行: %s", e)
+        return messages
+
+    def compact_in_background(self) -> None:
+        """
+        在背景執行緒壓縮日誌檔案
+        """
+        if self._compact_thread and self._compact_thread.is_alive():
+            return
+        self._compact_thread = threading.Thread(
+            target=self.compact,
+            name="MessageJournalCompactor",
+            daemon=True
+        )
+        self._compact_thread.start()
+
+    def compact(self) -> None:
+        """
+        壓縮日誌檔案，只保留最新的 keep 條訊息
+
+        壓縮期間仍可繼續追加，新追加的資料會在替換檔案前一併複製。
+        """
+        with self._compact_lock:
+            self._compact()
+
+    def _compact(self) -> None:
+        """
+        實際執行壓縮，呼叫前需持有壓縮鎖
+        """
+        tmp_path = self.path + '.compact'
+        try:
+            with self._lock:
+                end = self._size
+            lines = self._read_tail_lines(self.keep, end)
+
+            with open(tmp_path, 'wb') as out:
+                out.writelines(lines)
+                out.flush()
+                os.fsync(out.fileno())
+
+                with self._lock:
+                    # 複製壓縮期間追加的資料
+                    with open(self.path, 'rb') as src:
+                        src.seek(end)
+                        appended = src.read()
+                    out.write(appended)
+                    out.flush()
+                    os.fsync(out.fileno())
+
+                    self._fh.close()
+                    os.replace(tmp_path, self.path)
+                    self._fh = open(self.path, 'ab')
+                    self._size = self._fh.tell()
+                    self._live_bytes = sum(len(line) for line in lines) + len(appended)
+
+            logger.debug("已壓縮訊息日誌，保留 %s 條訊息", len(lines))
+        except Exception as e:
+            logger.error("壓縮訊息日誌時發生錯誤: %s", e)
+            with self._lock:
+                if self._fh.closed:
+                    self._fh = open(self.path, 'ab')
+                    self._size = self._fh.tell()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def close(self) -> None:
+        """
+        關閉日誌檔案
+        """
+        if self._compact_thread and self._compact_thread.is_alive():
+            self._compact_thread.join()
+        with self._lock:
+            if self._fh and not self._fh.closed:
+                self._fh.flush()
+                os.fsync(self._fh.fileno())
+                self._fh.close()
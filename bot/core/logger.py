@@ -1,10 +1,188 @@
 """
 日誌工具模組
 
-此模組提供了一個統一的日誌記錄系統，用於整個應用程式。
+此模組提供了一個統一的日誌記錄系統，用於整個應用程式：
+- 呼叫端只把日誌紀錄放入佇列，格式化與輸出在背景執行緒進行
+- 日誌級別由 LOG_LEVEL 設定，並可在執行時從控制面板調整
+- 每則訊息都會產生的除錯日誌使用 message_logger，並依比例取樣
+- 日誌一律使用 % 格式的延遲格式化，級別未啟用時不會組出字串
 """
 
+import atexit
+import itertools
 import logging
+import logging.handlers
+import queue
+from typing import Dict, Optional
 
 # 獲取日誌記錄器
 logger = logging.getLogger(__name__)
+
+# 每則訊息都會產生的除錯日誌（收到訊息、推送、快取更新等）
+message_logger = logging.getLogger('bot.messages')
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+LOG_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# 第三方套件的日誌級別，避免連線細節淹沒應用程式的日誌
+QUIET_LOGGERS = {
+    'discord.gateway': logging.WARNING,
+    'discord.client': logging.WARNING,
+    'discord.http': logging.WARNING,
+    'werkzeug': logging.WARNING,
+}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class SamplingFilter(logging.Filter):
+    """
+    日誌取樣過濾器
+
+    每 every 筆紀錄只保留一筆。過濾器在級別檢查之後才執行，
+    級別未啟用時不會有任何成本。
+    """
+
+    def __init__(self, every: int = 1) -> None:
+        """
+        初始化取樣過濾器
+
+        Args:
+            every (int): 每幾筆保留一筆，1 表示全部保留
+        """
+        super().__init__()
+        self.every = max(1, every)
+        self._counter = itertools.count()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.every == 1:
+            return True
+        # itertools.count 的 next 在 GIL 下是原子操作
+        return next(self._counter) % self.every == 0
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    把日誌紀錄原樣放入佇列的處理器
+
+    標準的 QueueHandler 會在呼叫端的執行緒格式化訊息；這裡的佇列只在同一個
+    程序中使用，紀錄不需要序列化，因此把格式化留給背景執行緒。
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+message_sampler = SamplingFilter()
+message_logger.addFilter(message_sampler)
+
+# 程式結束前輸出佇列中剩餘的日誌
+atexit.register(lambda: stop_logging())
+
+
+def _parse_level(level) -> int:
+    """
+    將級別名稱或數值轉換為 logging 的級別
+
+    Args:
+        level: 級別名稱（例如 'DEBUG'）或數值
+
+    Returns:
+        int: logging 級別
+
+    Raises:
+        ValueError: 無效的級別
+    """
+    if isinstance(level, int):
+        return level
+    value = logging.getLevelName(str(level).strip().upper())
+    if not isinstance(value, int):
+        raise ValueError(f"無效的日誌級別: {level}")
+    return value
+
+
+def setup_logging(level='INFO', sample_every: int = 1) -> None:
+    """
+    設置根日誌記錄器：呼叫端寫入佇列，由背景執行緒輸出到控制台
+
+    Args:
+        level: 根日誌記錄器的級別
+        sample_every (int): 每則訊息的除錯日誌每幾筆保留一筆
+    """
+    global _listener
+    stop_logging()
+
+    # 移除所有現有的處理器
+    root_logger = logging.getLogger()
+    for handler in root_logger.handlers[:]:
+        root_logger.removeHandler(handler)
+    root_logger.setLevel(_parse_level(level))
+
+    # 創建控制台處理器，在背景執行緒中格式化與輸出
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter(LOG_FORMAT, datefmt=LOG_DATE_FORMAT))
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    root_logger.addHandler(_DeferredQueueHandler(log_queue))
+    _listener = logging.handlers.QueueListener(
+        log_queue, console_handler, respect_handler_level=True)
+    _listener.start()
+
+    for name, quiet_level in QUIET_LOGGERS.items():
+        logging.getLogger(name).setLevel(quiet_level)
+    message_sampler.every = max(1, sample_every)
+
+
+def stop_logging() -> None:
+    """
+    輸出佇列中剩餘的日誌並停止背景執行緒
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def get_log_level() -> Dict:
+    """
+    獲取目前的日誌設定
+
+    Returns:
+        Dict: 根日誌記錄器級別、個別日誌記錄器級別與取樣比例
+    """
+    loggers = {
+        name: logging.getLevelName(instance.level)
+        for name, instance in sorted(logging.root.manager.loggerDict.items())
+        if isinstance(instance, logging.Logger) and instance.level != logging.NOTSET
+    }
+    return {
+        'level': logging.getLevelName(logging.getLogger().level),
+        'loggers': loggers,
+        'sample_every': message_sampler.every,
+    }
+
+
+def set_log_level(level, name: Optional[str] = None,
+                  sample_every: Optional[int] = None) -> Dict:
+    """
+    在執行時調整日誌級別
+
+    Args:
+        level: 新的級別名稱或數值
+        name (Optional[str]): 日誌記錄器名稱，未指定時調整根日誌記錄器
+        sample_every (Optional[int]): 每則訊息的除錯日誌每幾筆保留一筆
+
+    Returns:
+        Dict: 調整後的日誌設定
+
+    Raises:
+        ValueError: 無效的級別或取樣比例
+    """
+    parsed = _parse_level(level)
+    if sample_every is not None:
+        if int(sample_every) < 1:
+            raise ValueError(f"無效的取樣比例: {sample_every}")
+        message_sampler.every = int(sample_every)
+    logging.getLogger(name or None).setLevel(parsed)
+    logger.info("日誌級別已調整為 %s (%s)", logging.getLevelName(parsed), name or 'root')
+    return get_log_level()
@@ -0,0 +1,423 @@
+"""
+效能指標模組
+
+此模組提供輕量的計數器、量表與直方圖，並以 Prometheus 文字格式輸出：
+- 以 METRICS_ENABLED 環境變數啟用，未啟用時所有指標都是空操作
+- timed 裝飾器在未啟用時直接返回原函式，熱路徑沒有額外的呼叫
+- 佇列深度等數值以回呼函式在讀取指標時才計算，不佔用熱路徑
+- 事件迴圈延遲由背景任務定期量測
+"""
+
+import asyncio
+import contextlib
+import functools
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from utils.config import METRICS_ENABLED
+from .logger import logger
+
+# 預設的直方圖區間（秒）
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str],
+                   extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _NoopMetric:
+    """
+    未啟用指標時使用的空操作指標
+    """
+
+    _timer = contextlib.nullcontext()
+
+    def labels(self, *values: str) -> '_NoopMetric':
+        return self
+
+    def inc(self, amount: float = 1) -> None:
+        pass
+
+    def set(self, value: float) -> None:
+        pass
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        pass
+
+    def observe(self, value: float) -> None:
+        pass
+
+    def time(self) -> contextlib.nullcontext:
+        return self._timer
+
+
+NOOP = _NoopMetric()
+
+
+class _Metric:
+    """
+    指標基底類別，管理標籤與子指標
+    """
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], '_Metric'] = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self) -> '_Metric':
+        raise NotImplementedError
+
+    def labels(self, *values: str) -> '_Metric':
+        """
+        取得指定標籤值的子指標，熱路徑上應預先取得並重複使用
+
+        Args:
+            *values (str): 依 labelnames 順序的標籤值
+
+        Returns:
+            _Metric: 子指標
+        """
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _samples(self) -> Iterable[Tuple[Tuple[str, ...], '_Metric']]:
+        if not self.labelnames:
+            return [((), self)]
+        return sorted(self._children.items())
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {_escape(self.documentation)}',
+                 f'# TYPE {self.name} {self.kind}']
+        for values, child in self._samples():
+            lines.extend(child._render_sample(self.name, self.labelnames, values))
+        return lines
+
+    def _render_sample(self, name: str, labelnames: Sequence[str],
+                       values: Sequence[str]) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """
+    只會遞增的計數器
+    """
+
+    kind = 'counter'
+
+    def __init__(self, name: str = '', documentation: str = '',
+                 labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.value = 0.0
+
+    def _new_child(self) -> 'Counter':
+        return Counter()
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def _render_sample(self, name, labelnames, values):
+        return [f'{name}{_format_labels(labelnames, values)} {_format_value(self.value)}']
+
+
+class Gauge(_Metric):
+    """
+    可增可減的量表，也可以設定在讀取時才計算的回呼函式
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name: str = '', documentation: str = '',
+                 labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.value = 0.0
+        self._function: Optional[Callable[[], float]] = None
+
+    def _new_child(self) -> 'Gauge':
+        return Gauge()
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self._function = function
+
+    def get(self) -> float:
+        if self._function is None:
+            return self.value
+        try:
+            return self._function()
+        except Exception as e:
+            logger.error("讀取指標時發生錯誤: %s", e)
+            return float('nan')
+
+    def _render_sample(self, name, labelnames, values):
+        return [f'{name}{_format_labels(labelnames, values)} {_format_value(self.get())}']
+
+
+class Histogram(_Metric):
+    """
+    依固定區間統計數值分布的直方圖
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name: str = '', documentation: str = '',
+                 labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 最後一格是 +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def _new_child(self) -> 'Histogram':
+        return Histogram(buckets=self.buckets)
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @contextlib.contextmanager
+    def time(self):
+        """
+        量測 with 區塊執行的秒數
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def _render_sample(self, name, labelnames, values):
+        with self._lock:
+            counts = list(self.counts)
+            total = self.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            labels = _format_labels(labelnames, values, ('le', _format_value(float(bound))))
+            lines.append(f'{name}_bucket{labels} {cumulative}')
+        labels = _format_labels(labelnames, values)
+        lines.append(f'{name}_sum{labels} {_format_value(total)}')
+        lines.append(f'{name}_count{labels} {cumulative}')
+        return lines
+
+
+class MetricsRegistry:
+    """
+    指標登錄表
+
+    此類別負責：
+    - 建立並保存所有指標
+    - 未啟用時返回空操作指標
+    - 以 Prometheus 文字格式輸出所有指標
+    """
+
+    def __init__(self, enabled: bool) -> None:
+        """
+        初始化指標登錄表
+
+        Args:
+            enabled (bool): 是否啟用指標
+        """
+        self.enabled = enabled
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric):
+        if not self.enabled:
+            return NOOP
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self, prefixes: Optional[Tuple[str, ...]] = None) -> str:
+        """
+        輸出 Prometheus 文字格式
+
+        Args:
+            prefixes (Optional[Tuple[str, ...]]): 只輸出名稱以這些前綴開頭的指標
+
+        Returns:
+            str: 所有指標的文字內容
+        """
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            if prefixes is None or metric.name.startswith(prefixes):
+                lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry(METRICS_ENABLED)
+
+
+def timed(histogram) -> Callable:
+    """
+    量測函式執行時間的裝飾器，支援一般函式與協程函式
+
+    未啟用指標時直接返回原函式。
+
+    Args:
+        histogram: 記錄執行時間的直方圖
+
+    Returns:
+        Callable: 裝飾器
+    """
+    def decorator(function: Callable) -> Callable:
+        if histogram is NOOP:
+            return function
+
+        if asyncio.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - started)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started)
+        return wrapper
+
+    return decorator
+
+
+# 機器人
+EVENT_SECONDS = registry.histogram(
+    'discord_bot_event_seconds', 'Gateway 事件處理器的執行時間', ['event'])
+ADD_MESSAGE_SECONDS = registry.histogram(
+    'discord_bot_add_message_seconds', '新增訊息到歷史記錄與寫入佇列的時間')
+HISTORY_QUERY_SECONDS = registry.histogram(
+    'discord_bot_history_query_seconds', '查詢訊息歷史的時間')
+JOURNAL_FLUSH_SECONDS = registry.histogram(
+    'discord_bot_journal_flush_seconds', '批次寫入訊息日誌的時間')
+REST_REQUESTS = registry.counter(
+    'discord_rest_requests_total', '發送到 Discord REST API 的請求數', ['route'])
+REST_RATE_LIMITED = registry.counter(
+    'discord_rest_rate_limited_total', '收到 429 速率限制回應的次數')
+QUEUE_DEPTH = registry.gauge(
+    'discord_bot_queue_depth', '佇列中等待處理的項目數', ['queue'])
+LOOP_LAG_SECONDS = registry.histogram(
+    'discord_bot_event_loop_lag_seconds', '事件迴圈排程延遲',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+LOOP_LAG_LAST_SECONDS = registry.gauge(
+    'discord_bot_event_loop_lag_last_seconds', '最近一次量測的事件迴圈延遲')
+SHARD_EVENTS = registry.counter(
+    'discord_shard_events_total', '各分片處理的 Gateway 事件數', ['shard'])
+SHARD_LATENCY_SECONDS = registry.gauge(
+    'discord_shard_latency_seconds', '各分片的 Gateway 心跳延遲', ['shard'])
+COMMAND_REQUESTS = registry.counter(
+    'discord_bot_commands_total', '命令的分派結果', ['command', 'result'])
+COMMAND_SECONDS = registry.histogram(
+    'discord_bot_command_seconds', '命令的執行時間', ['command'])
+STARTUP_SECONDS = registry.gauge(
+    'discord_bot_startup_seconds', '程式啟動後到各階段完成的秒數', ['phase'])
+
+# 控制面板
+PANEL_REQUEST_SECONDS = registry.histogram(
+    'panel_request_seconds', '控制面板請求的處理時間', ['endpoint'])
+BRIDGE_SECONDS = registry.histogram(
+    'panel_bridge_seconds', '控制面板執行緒等待機器人事件迴圈的時間', ['operation'])
+MESSAGE_CACHE_REQUESTS = registry.counter(
+    'panel_message_cache_requests_total', '頻道訊息快取的讀取結果', ['result'])
+SINGLE_FLIGHT = registry.counter(
+    'panel_single_flight_total', '讀取訊息的 REST 請求合併結果', ['result'])
+MEDIA_REQUESTS = registry.counter(
+    'panel_media_requests_total', '媒體代理的請求結果', ['result'])
+
+# 熱路徑上使用的子指標
+ON_MESSAGE_SECONDS = EVENT_SECONDS.labels('on_message')
+CACHE_HIT = MESSAGE_CACHE_REQUESTS.labels('hit')
+CACHE_MISS = MESSAGE_CACHE_REQUESTS.labels('miss')
+CACHE_GAP = MESSAGE_CACHE_REQUESTS.labels('gap')
+
+
+class LoopLagMonitor:
+    """
+    事件迴圈延遲監測器
+
+    定期睡眠固定時間，以實際醒來的時間與預期的差距作為事件迴圈的延遲。
+    """
+
+    def __init__(self, interval: float = 0.5) -> None:
+        """
+        初始化監測器
+
+        Args:
+            interval (float): 量測間隔秒數
+        """
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """
+        在目前的事件迴圈中啟動監測任務，未啟用指標時不啟動
+        """
+        if registry.enabled and (self._task is None or self._task.done()):
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - started - self.interval)
+            LOOP_LAG_SECONDS.observe(lag)
+            LOOP_LAG_LAST_SECONDS.set(lag)
+
+    async def close(self) -> None:
+        """
+        停止監測任務
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
@@ -0,0 +1,312 @@
+"""
+訊息持久化模組
+
+此模組將訊息寫入磁碟的工作移出 discord.py 的事件處理流程：
+- on_message 只負責把訊息放入佇列，訊息的編輯與刪除也放入同一個佇列，依序套用到封存
+- 背景的 asyncio 寫入任務批次取出訊息，交給專用執行緒寫入日誌與封存
+- 提供佇列深度、丟棄數、寫入批次數等背壓統計
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+from .archive import MessageArchive
+from .journal import MessageJournal
+from .logger import logger
+from .metrics import JOURNAL_FLUSH_SECONDS
+from .serializer import MessageRecord
+
+# 通知寫入任務結束的哨兵值
+_STOP = object()
+
+
+class ArchiveChange(NamedTuple):
+    """
+    封存中既有訊息的變更
+
+    此類別負責：
+    - 保存要編輯或刪除的訊息 ID
+    - fields 為編輯的欄位，None 表示刪除
+    """
+
+    message_ids: Tuple[int, ...]
+    fields: Optional[Dict]
+
+
+_Item = Union[MessageRecord, ArchiveChange]
+
+
+class MessageWriter:
+    """
+    訊息寫入器
+
+    此類別負責：
+    - 以有界佇列接收訊息，佇列滿時丟棄並計數
+    - 在背景任務中批次寫入日誌
+    - 依佇列順序把訊息的編輯與刪除套用到封存
+    - 關閉時寫入佇列中剩餘的所有訊息
+    """
+
+    def __init__(self, journal: MessageJournal, archive: Optional[MessageArchive] = None,
+                 batch_size: int = 100, flush_interval: float = 0.5,
+                 max_queue: int = 10000) -> None:
+        """
+        初始化訊息寫入器
+
+        Args:
+            journal (MessageJournal): 訊息日誌
+            archive (Optional[MessageArchive]): 訊息封存，未指定時只寫入日誌
+            batch_size (int): 每批最多寫入的訊息數量
+            flush_interval (float): 收集一批訊息最多等待的秒數
+            max_queue (int): 佇列的最大長度
+        """
+        self.journal = journal
+        self.archive = archive
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        # 單一執行緒確保寫入順序
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="MessageWriter")
+        self._task: Optional[asyncio.Task] = None
+
+        self.stats: Dict[str, Any] = {
+            'enqueued': 0,
+            'dropped': 0,
+            'flushed_messages': 0,
+            'flushed_batches': 0,
+            'flush_errors': 0,
+            'last_flush_seconds': 0.0,
+            'max_queue_depth': 0,
+        }
+
+    def start(self) -> None:
+        """
+        在目前的事件迴圈中啟動寫入任務
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+            logger.debug("訊息寫入任務已啟動")
+
+    def enqueue(self, record: MessageRecord) -> bool:
+        """
+        將訊息放入寫入佇列，不會等待
+
+        Args:
+            record (MessageRecord): 訊息紀錄
+
+        Returns:
+            bool: 是否成功放入佇列
+        """
+        try:
+            self.queue.put_nowait(record)
+        except asyncio.QueueFull:
+            self.stats['dropped'] += 1
+            logger.warning("寫入佇列已滿，丟棄訊息 %s", record.id)
+            return False
+        self._enqueued()
+        return True
+
+    def enqueue_edit(self, message_id: int, fields: Dict) -> bool:
+        """
+        將訊息編輯放入寫入佇列，排在同一則訊息的寫入之後
+
+        Args:
+            message_id (int): 訊息 ID
+            fields (Dict): serialize_edit 取出的欄位
+
+        Returns:
+            bool: 是否成功放入佇列
+        """
+        return self._enqueue_change(ArchiveChange((message_id,), fields))
+
+    def enqueue_delete(self, message_ids: Iterable[int]) -> bool:
+        """
+        將訊息刪除放入寫入佇列
+
+        Args:
+            message_ids (Iterable[int]): 訊息 ID
+
+        Returns:
+            bool: 是否成功放入佇列
+        """
+        return self._enqueue_change(ArchiveChange(tuple(message_ids), None))
+
+    def _enqueue_change(self, change: ArchiveChange) -> bool:
+        """
+        將封存的變更放入寫入佇列；沒有封存時日誌只會附加，不需要處理編輯與刪除
+
+        Args:
+            change (ArchiveChange): 訊息的編輯或刪除
+
+        Returns:
+            bool: 是否成功放入佇列
+        """
+        if self.archive is None:
+            return True
+        try:
+            self.queue.put_nowait(change)
+        except asyncio.QueueFull:
+            self.stats['dropped'] += 1
+            logger.warning("寫入佇列已滿，丟棄訊息 %s 的變更", change.message_ids[0])
+            return False
+        self._enqueued()
+        return True
+
+    def _enqueued(self) -> None:
+        """
+        更新放入佇列的計數與最大佇列深度
+        """
+        self.stats['enqueued'] += 1
+        depth = self.queue.qsize()
+        if depth > self.stats['max_queue_depth']:
+            self.stats['max_queue_depth'] = depth
+
+    async def _run(self) -> None:
+        """
+        寫入任務主迴圈：收集一批訊息後寫入日誌
+        """
+        while True:
+            item = await self.queue.get()
+            if item is _STOP:
+                return
+
+            if self.queue.qsize() < self.batch_size:
+                # 等待更多訊息累積成同一批，減少 fsync 次數
+                await asyncio.sleep(self.flush_interval)
+
+            batch: List[_Item] = [item]
+            stop = False
+            while len(batch) < self.batch_size and not self.queue.empty():
+                item = self.queue.get_nowait()
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+
+            await self._write(batch)
+            if stop:
+                return
+
+    def _persist(self, batch: List[_Item]) -> int:
+        """
+        寫入一批訊息到日誌與封存，並依佇列順序套用編輯與刪除，在寫入執行緒中執行
+
+        Args:
+            batch (List[_Item]): 要寫入的訊息與變更
+
+        Returns:
+            int: 寫入的訊息數量
+        """
+        written = 0
+        records: List[MessageRecord] = []
+        for item in batch:
+            if isinstance(item, ArchiveChange):
+                # 先寫入之前的訊息，編輯才找得到同一批中剛收到的訊息
+                written += self._persist_records(records)
+                records = []
+                self._apply_change(item)
+            else:
+                records.append(item)
+        return written + self._persist_records(records)
+
+    def _persist_records(self, records: List[MessageRecord]) -> int:
+        """
+        寫入連續的一段訊息到日誌與封存，在寫入執行緒中執行
+
+        Args:
+            records (List[MessageRecord]): 要寫入的訊息
+
+        Returns:
+            int: 寫入的訊息數量
+        """
+        if not records:
+            return 0
+        # 轉換為字典的成本由寫入執行緒負擔，不佔用事件迴圈
+        messages = [record.to_dict() for record in records]
+        self.journal.append_many(messages)
+        if self.archive is not None:
+            self.archive.insert_many(messages)
+        return len(messages)
+
+    def _apply_change(self, change: ArchiveChange) -> None:
+        """
+        把訊息的編輯或刪除套用到封存，在寫入執行緒中執行
+
+        Args:
+            change (ArchiveChange): 訊息的編輯或刪除
+        """
+        if change.fields is None:
+            self.archive.delete_many(change.message_ids)
+            return
+        fields = dict(change.fields)
+        if 'attachments' in fields:
+            fields['attachments'] = [attachment._asdict() for attachment in fields['attachments']]
+        for message_id in change.message_ids:
+            self.archive.update(message_id, fields)
+
+    async def _write(self, batch: List[_Item]) -> None:
+        """
+        在寫入執行緒中寫入一批訊息
+
+        Args:
+            batch (List[_Item]): 要寫入的訊息與變更
+        """
+        started = time.perf_counter()
+        try:
+            written = await asyncio.get_running_loop().run_in_executor(
+                self._executor, self._persist, batch)
+            self.stats['flushed_messages'] += written
+            self.stats['flushed_batches'] += 1
+        except Exception as e:
+            self.stats['flush_errors'] += 1
+            logger.error("寫入訊息日誌時發生錯誤: %s", e)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.stats['last_flush_seconds'] = elapsed
+            JOURNAL_FLUSH_SECONDS.observe(elapsed)
+
+    def _drain(self) -> List[_Item]:
+        """
+        取出佇列中剩餘的所有訊息
+
+        Returns:
+            List[_Item]: 剩餘的訊息與變更
+        """
+        remaining = []
+        while not self.queue.empty():
+            item = self.queue.get_nowait()
+            if item is not _STOP:
+                remaining.append(item)
+        return remaining
+
+    async def close(self) -> None:
+        """
+        寫入佇列中剩餘的訊息並停止寫入任務
+        """
+        if self._task is not None and not self._task.done():
+            await self.queue.put(_STOP)
+            await self._task
+
+        # 寫入任務未啟動或已結束時，直接寫入剩餘的訊息
+        remaining = self._drain()
+        if remaining:
+            await self._write(remaining)
+
+        self._executor.shutdown(wait=True)
+        logger.debug("訊息寫入器已關閉，共寫入 %s 條訊息", self.stats['flushed_messages'])
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        獲取背壓統計資料
+
+        Returns:
+            Dict[str, Any]: 統計資料，包含目前的佇列深度
+        """
+        stats = dict(self.stats)
+        stats['queue_depth'] = self.queue.qsize()
+        stats['running'] = self._task is not None and not self._task.done()
+        return stats
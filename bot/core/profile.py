@@ -0,0 +1,122 @@
+"""
+執行設定檔模組
+
+此模組集中設定機器人保存多少資料，而不是由各個容器各自決定大小：
+- default：與 discord.py 的預設相同，discord.py 保留最近 1000 則 discord.Message
+- lean：關閉 discord.py 的訊息快取，不分塊載入成員、不快取成員，只訂閱需要的 Gateway 事件；
+  訊息只以 MessageRecord 保存一份，由訊息歷史與控制面板的頻道快取共用
+"""
+
+from typing import Any, Dict, Optional
+
+import discord
+
+# 非全域速率限制需要等待超過此秒數時，discord.py 不自行等待而是拋出 discord.RateLimited，
+# 由發送佇列與匯出依 retry_after 重新排程（discord.py 允許的最小值為 30 秒）
+MAX_RATELIMIT_TIMEOUT = 30.0
+
+
+class RuntimeProfile:
+    """
+    執行設定檔
+
+    此類別負責：
+    - 保存 discord.py 的快取設定與訊息歷史、頻道快取的大小
+    - 產生建立 commands.Bot 所需的 intents 與參數
+    """
+
+    __slots__ = ('name', 'max_messages', 'chunk_guilds_at_startup', 'cache_members',
+                 'minimal_intents', 'history_size', 'cache_per_channel', 'cache_max_channels')
+
+    def __init__(self, name: str, max_messages: Optional[int], chunk_guilds_at_startup: bool,
+                 cache_members: bool, minimal_intents: bool, history_size: int,
+                 cache_per_channel: int, cache_max_channels: int) -> None:
+        """
+        初始化執行設定檔
+
+        Args:
+            name (str): 設定檔名稱
+            max_messages (Optional[int]): discord.py 保留的訊息數量，None 表示不保留
+            chunk_guilds_at_startup (bool): 連線時是否分塊載入所有成員
+            cache_members (bool): 是否依 intents 快取成員
+            minimal_intents (bool): 是否只訂閱機器人與控制面板需要的事件
+            history_size (int): 訊息歷史保存的訊息數量
+            cache_per_channel (int): 控制面板每個頻道快取的訊息數量
+            cache_max_channels (int): 控制面板最多快取的頻道數量
+        """
+        self.name = name
+        self.max_messages = max_messages
+        self.chunk_guilds_at_startup = chunk_guilds_at_startup
+        self.cache_members = cache_members
+        self.minimal_intents = minimal_intents
+        self.history_size = history_size
+        self.cache_per_channel = cache_per_channel
+        self.cache_max_channels = cache_max_channels
+
+    def intents(self) -> discord.Intents:
+        """
+        建立 Gateway intents
+
+        Returns:
+            discord.Intents: intents
+        """
+        if self.minimal_intents:
+            # 伺服器與頻道目錄、訊息與命令需要的事件
+            intents = discord.Intents.none()
+            intents.guilds = True
+            intents.guild_messages = True
+            intents.dm_messages = True
+        else:
+            intents = discord.Intents.default()
+            intents.presences = False  # 禁用狀態權限
+        intents.message_content = True  # 啟用訊息內容權限
+        intents.members = False  # 禁用成員權限
+        return intents
+
+    def bot_options(self, intents: discord.Intents) -> Dict[str, Any]:
+        """
+        產生建立 commands.Bot 的參數
+
+        Args:
+            intents (discord.Intents): intents
+
+        Returns:
+            Dict[str, Any]: commands.Bot 的關鍵字參數
+        """
+        return {
+            'intents': intents,
+            'max_messages': self.max_messages,
+            'chunk_guilds_at_startup': self.chunk_guilds_at_startup,
+            'member_cache_flags': (discord.MemberCacheFlags.from_intents(intents)
+                                   if self.cache_members else discord.MemberCacheFlags.none()),
+            'max_ratelimit_timeout': MAX_RATELIMIT_TIMEOUT,
+        }
+
+
+PROFILES = {
+    'default': RuntimeProfile('default', max_messages=1000, chunk_guilds_at_startup=False,
+                              cache_members=True, minimal_intents=False, history_size=100,
+                              cache_per_channel=100, cache_max_channels=256),
+    'lean': RuntimeProfile('lean', max_messages=None, chunk_guilds_at_startup=False,
+                           cache_members=False, minimal_intents=True, history_size=100,
+                           cache_per_channel=100, cache_max_channels=64),
+}
+
+
+def get_profile(name: str) -> RuntimeProfile:
+    """
+    取得執行設定檔
+
+    Args:
+        name (str): 設定檔名稱
+
+    Returns:
+        RuntimeProfile: 執行設定檔
+
+    Raises:
+        ValueError: 未知的設定檔名稱
+    """
+    profile = PROFILES.get(name.strip().lower() or 'default')
+    if profile is None:
+        raise ValueError(f"未知的執行設定檔: {name}（可用: {', '.join(PROFILES)}）")
+    return profile
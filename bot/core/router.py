@@ -0,0 +1,350 @@
+"""
+命令路由模組
+
+此模組取代 discord.py 的 process_commands，在 on_message 中以最少的工作分派命令：
+- 前綴與名稱（包含別名）以字典查詢，不是命令的訊息在一次字串比較後返回
+- 冷卻以 GCRA（通用信元速率演算法）計算，每個使用者、伺服器或頻道只保存一個浮點數
+- 每個命令限制同時執行的數量，超過時直接略過，避免單一伺服器的大量命令佔用事件迴圈
+- 會阻塞的處理函式可以交給執行緒池執行
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import discord
+
+from .logger import logger, message_logger
+from .metrics import COMMAND_REQUESTS, COMMAND_SECONDS
+
+# 冷卻紀錄超過此數量時清除已恢復的項目
+_COOLDOWN_SWEEP_SIZE = 4096
+
+# 冷卻的計算單位
+BUCKET_TYPES = ('user', 'guild', 'channel')
+
+
+class CooldownBuckets:
+    """
+    命令冷卻
+
+    此類別負責：
+    - 以 GCRA 限制每個單位在 per 秒內最多使用 rate 次，允許連續使用 rate 次
+    - 每個單位只保存下一次理論上可使用的時間
+    """
+
+    __slots__ = ('rate', 'per', 'bucket', 'interval', 'tolerance', 'clock', '_next')
+
+    def __init__(self, rate: int, per: float, bucket: str = 'user',
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        """
+        初始化命令冷卻
+
+        Args:
+            rate (int): 每個週期允許的次數
+            per (float): 週期秒數
+            bucket (str): 計算單位，user、guild 或 channel
+            clock (Callable[[], float]): 時間來源
+        """
+        if bucket not in BUCKET_TYPES:
+            raise ValueError(f"未知的冷卻單位: {bucket}")
+        self.rate = rate
+        self.per = per
+        self.bucket = bucket
+        self.interval = per / rate
+        self.tolerance = per - self.interval
+        self.clock = clock
+        self._next: Dict[int, float] = {}
+
+    def key(self, message: discord.Message) -> int:
+        """
+        取得訊息所屬的冷卻單位 ID
+
+        Args:
+            message (discord.Message): 訊息
+
+        Returns:
+            int: 使用者、伺服器或頻道 ID；私訊以使用者計算
+        """
+        if self.bucket == 'guild' and message.guild is not None:
+            return message.guild.id
+        if self.bucket == 'channel':
+            return message.channel.id
+        return message.author.id
+
+    def hit(self, key: int) -> float:
+        """
+        使用一次命令
+
+        Args:
+            key (int): 冷卻單位 ID
+
+        Returns:
+            float: 需要再等待的秒數，0 表示允許使用
+        """
+        now = self.clock()
+        arrival = max(self._next.get(key, now), now)
+        wait = arrival - now - self.tolerance
+        if wait > 0:
+            return wait
+        if len(self._next) >= _COOLDOWN_SWEEP_SIZE:
+            self._sweep(now)
+        self._next[key] = arrival + self.interval
+        return 0.0
+
+    def _sweep(self, now: float) -> None:
+        # 已恢復的單位與不存在紀錄的單位等價
+        for key in [key for key, arrival in self._next.items() if arrival <= now]:
+            del self._next[key]
+
+    def __len__(self) -> int:
+        return len(self._next)
+
+
+class Command:
+    """
+    已註冊的命令
+
+    此類別負責：
+    - 保存處理函式、別名、說明與限制
+    - 記錄目前同時執行的數量與各結果的指標
+    """
+
+    __slots__ = ('name', 'handler', 'aliases', 'description', 'cooldown', 'max_concurrency',
+                 'blocking', 'running', 'seconds', 'results')
+
+    def __init__(self, name: str, handler: Callable, aliases: Iterable[str] = (),
+                 description: str = '', cooldown: Optional[CooldownBuckets] = None,
+                 max_concurrency: int = 0, blocking: bool = False) -> None:
+        """
+        初始化命令
+
+        Args:
+            name (str): 命令名稱
+            handler (Callable): 處理函式，接收 CommandContext
+            aliases (Iterable[str]): 別名
+            description (str): 顯示在說明中的描述
+            cooldown (Optional[CooldownBuckets]): 冷卻設定，None 表示不限制
+            max_concurrency (int): 最多同時執行的數量，0 表示不限制
+            blocking (bool): 是否在執行緒池中執行
+        """
+        self.name = name
+        self.handler = handler
+        self.aliases = tuple(aliases)
+        self.description = description
+        self.cooldown = cooldown
+        self.max_concurrency = max_concurrency
+        self.blocking = blocking
+        self.running = 0
+        self.seconds = COMMAND_SECONDS.labels(name)
+        self.results = {result: COMMAND_REQUESTS.labels(name, result)
+                        for result in ('ok', 'cooldown', 'busy', 'error')}
+
+
+class CommandContext:
+    """
+    命令的執行環境
+
+    此類別負責：
+    - 提供觸發命令的訊息、命令名稱與參數
+    - 回覆到觸發命令的頻道
+    """
+
+    __slots__ = ('message', 'command', 'args', 'router')
+
+    def __init__(self, message: discord.Message, command: Command, args: str,
+                 router: 'CommandRouter') -> None:
+        self.message = message
+        self.command = command
+        self.args = args
+        self.router = router
+
+    @property
+    def author(self) -> Any:
+        return self.message.author
+
+    @property
+    def channel(self) -> Any:
+        return self.message.channel
+
+    @property
+    def guild(self) -> Optional[discord.Guild]:
+        return self.message.guild
+
+    async def send(self, content: str) -> Any:
+        """
+        回覆到觸發命令的頻道
+
+        Args:
+            content (str): 訊息內容
+
+        Returns:
+            Any: 發送的訊息
+        """
+        return await self.message.channel.send(content)
+
+
+class CommandRouter:
+    """
+    命令路由
+
+    此類別負責：
+    - 維護命令名稱與別名的查詢表
+    - 在分派前檢查冷卻與同時執行的數量
+    - 執行協程處理函式，或在執行緒池中執行會阻塞的處理函式
+    """
+
+    def __init__(self, prefix: str, threads: int = 4) -> None:
+        """
+        初始化命令路由
+
+        Args:
+            prefix (str): 命令前綴
+            threads (int): 執行緒池的執行緒數量
+        """
+        self.prefix = prefix
+        self.threads = threads
+        self._table: Dict[str, Command] = {}
+        self._commands: List[Command] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def add(self, command: Command) -> Command:
+        """
+        註冊命令
+
+        Args:
+            command (Command): 命令
+
+        Returns:
+            Command: 已註冊的命令
+        """
+        for name in (command.name, *command.aliases):
+            if name in self._table:
+                raise ValueError(f"命令名稱重複: {name}")
+        for name in (command.name, *command.aliases):
+            self._table[name] = command
+        self._commands.append(command)
+        return command
+
+    def command(self, name: str, aliases: Iterable[str] = (), description: str = '',
+                cooldown: Optional[Tuple[int, float]] = None, bucket: str = 'user',
+                max_concurrency: int = 0, blocking: bool = False) -> Callable:
+        """
+        以裝飾器註冊命令
+
+        協程處理函式以 ctx.send 回覆；blocking 的處理函式是一般函式，
+        在執行緒池中執行，返回的字串會回覆到頻道。
+
+        Args:
+            name (str): 命令名稱
+            aliases (Iterable[str]): 別名
+            description (str): 顯示在說明中的描述
+            cooldown (Optional[Tuple[int, float]]): (次數, 秒數)，None 表示不限制
+            bucket (str): 冷卻的計算單位，user、guild 或 channel
+            max_concurrency (int): 最多同時執行的數量，0 表示不限制
+            blocking (bool): 是否在執行緒池中執行
+
+        Returns:
+            Callable: 裝飾器
+        """
+        def decorator(handler: Callable) -> Callable:
+            limiter = CooldownBuckets(cooldown[0], cooldown[1], bucket) if cooldown else None
+            self.add(Command(name, handler, aliases, description, limiter,
+                             max_concurrency, blocking))
+            return handler
+        return decorator
+
+    def get(self, name: str) -> Optional[Command]:
+        return self._table.get(name)
+
+    @property
+    def commands(self) -> List[Command]:
+        return list(self._commands)
+
+    def parse(self, content: str) -> Optional[Tuple[Command, str]]:
+        """
+        解析訊息內容
+
+        Args:
+            content (str): 訊息內容
+
+        Returns:
+            Optional[Tuple[Command, str]]: 命令與參數，不是命令時返回 None
+        """
+        if not content.startswith(self.prefix):
+            return None
+        parts = content[len(self.prefix):].split(None, 1)
+        if not parts:
+            return None
+        command = self._table.get(parts[0])
+        if command is None:
+            return None
+        return command, parts[1] if len(parts) > 1 else ''
+
+    async def dispatch(self, message: discord.Message) -> bool:
+        """
+        分派訊息中的命令
+
+        Args:
+            message (discord.Message): 訊息
+
+        Returns:
+            bool: 是否執行了命令
+        """
+        parsed = self.parse(message.content)
+        if parsed is None or message.author.bot:
+            return False
+        command, args = parsed
+
+        # 先檢查同時執行的數量，被略過的命令不消耗冷卻次數
+        if command.max_concurrency and command.running >= command.max_concurrency:
+            command.results['busy'].inc()
+            message_logger.debug("命令 %s 同時執行的數量已達上限 %s，略過",
+                                 command.name, command.max_concurrency)
+            return False
+        if command.cooldown is not None:
+            wait = command.cooldown.hit(command.cooldown.key(message))
+            if wait:
+                command.results['cooldown'].inc()
+                message_logger.debug("命令 %s 冷卻中，%s 需再等待 %.1f 秒",
+                                     command.name, message.author, wait)
+                return False
+
+        ctx = CommandContext(message, command, args, self)
+        command.running += 1
+        try:
+            with command.seconds.time():
+                if command.blocking:
+                    reply = await asyncio.get_running_loop().run_in_executor(
+                        self.executor, command.handler, ctx)
+                    if reply:
+                        await ctx.send(reply)
+                else:
+                    await command.handler(ctx)
+            command.results['ok'].inc()
+        except Exception as e:
+            command.results['error'].inc()
+            logger.error("執行命令 %s 時發生錯誤: %s", command.name, e, exc_info=True)
+        finally:
+            command.running -= 1
+        return True
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        # 第一次需要時才建立執行緒池
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.threads,
+                                                thread_name_prefix="Command")
+        return self._executor
+
+    async def close(self) -> None:
+        """
+        關閉執行緒池：取消尚未開始的處理函式，在其他執行緒等待執行中的處理函式結束，
+        不阻塞事件迴圈
+        """
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.get_running_loop().run_in_executor(
+                None, partial(executor.shutdown, wait=True, cancel_futures=True))
@@ -0,0 +1,305 @@
+"""
+訊息序列化模組
+
+此模組負責將 discord.Message 轉換為精簡的訊息紀錄，供整個應用程式共用：
+- 訊息紀錄使用 __slots__，ID 以整數保存，作者、頻道與伺服器名稱經過 intern 共用同一個字串
+- 時間戳記由 snowflake ID 換算，不另外保存
+- 控制面板的 JSON 編碼在第一次使用時產生並快取，之後每次回應直接重用
+- 訊息歷史、頻道快取、訊息推送與日誌檔案都使用同一個紀錄
+"""
+
+import json
+import sys
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+import discord
+
+
+class Attachment(NamedTuple):
+    # 訊息附件，以 tuple 保存
+    url: str
+    filename: str
+    content_type: Optional[str]
+    size: Optional[int]
+
+    @property
+    def is_image(self) -> bool:
+        return bool(self.content_type) and self.content_type.startswith('image/')
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    """
+    intern 重複出現的字串（作者、頻道與伺服器名稱等），讓所有紀錄共用同一個物件
+
+    Args:
+        value (Optional[str]): 字串
+
+    Returns:
+        Optional[str]: intern 後的字串
+    """
+    return sys.intern(value) if value else value
+
+
+def _to_int(value) -> Optional[int]:
+    if value is None or value == '':
+        return None
+    return int(value)
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+class MessageRecord:
+    """
+    精簡的訊息紀錄
+
+    此類別負責：
+    - 以 __slots__ 保存訊息欄位，不為每則訊息建立巢狀字典
+    - 輸出控制面板格式並快取其 JSON 編碼
+    - 輸出與讀取日誌檔案使用的字典格式
+    """
+
+    __slots__ = ('id', 'channel_id', 'guild_id', 'author_id', 'author', 'author_name',
+                 'avatar', 'channel_name', 'guild_name', 'content', 'attachments',
+                 '_timestamp', '_json')
+
+    def __init__(self, id: int, channel_id: int, guild_id: Optional[int], author_id: Optional[int],
+                 author: Optional[str], author_name: Optional[str], avatar: Optional[str],
+                 channel_name: Optional[str], guild_name: Optional[str], content: str,
+                 attachments: Tuple[Attachment, ...] = (),
+                 timestamp: Optional[str] = None) -> None:
+        self.id = id
+        self.channel_id = channel_id
+        self.guild_id = guild_id
+        self.author_id = author_id
+        self.author = _intern(author)
+        self.author_name = _intern(author_name)
+        self.avatar = _intern(avatar)
+        self.channel_name = _intern(channel_name)
+        self.guild_name = _intern(guild_name)
+        self.content = content
+        self.attachments = attachments
+        # 只有無法由 ID 換算時間的舊資料才保存時間戳記
+        self._timestamp = timestamp
+        self._json: Optional[str] = None
+
+    def __repr__(self) -> str:
+        return f'<MessageRecord id={self.id} channel_id={self.channel_id}>'
+
+    @property
+    def timestamp(self) -> str:
+        if self._timestamp is not None:
+            return self._timestamp
+        return discord.utils.snowflake_time(self.id).isoformat()
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'MessageRecord':
+        """
+        從日誌檔案的字典格式建立紀錄
+
+        Args:
+            data (Dict): 訊息資料
+
+        Returns:
+            MessageRecord: 訊息紀錄
+        """
+        attachments = tuple(
+            Attachment(attachment.get('url'), attachment.get('filename'),
+                       attachment.get('content_type'), attachment.get('size'))
+            for attachment in data.get('attachments') or ())
+        message_id = _to_int(data.get('id'))
+        return cls(
+            id=message_id or 0,
+            channel_id=_to_int(data.get('channel_id')),
+            guild_id=_to_int(data.get('guild_id')),
+            author_id=_to_int(data.get('author_id')),
+            author=data.get('author'),
+            author_name=data.get('author'),
+            avatar=None,
+            channel_name=data.get('channel_name'),
+            guild_name=data.get('guild_name'),
+            content=data.get('content') or '',
+            attachments=attachments,
+            timestamp=None if message_id else data.get('timestamp'),
+        )
+
+    def to_wire(self) -> List:
+        """
+        轉換為程序間傳輸使用的精簡列表，保留所有欄位
+
+        Returns:
+            List: 訊息欄位
+        """
+        return [self.id, self.channel_id, self.guild_id, self.author_id, self.author,
+                self.author_name, self.avatar, self.channel_name, self.guild_name,
+                self.content, [list(attachment) for attachment in self.attachments],
+                self._timestamp]
+
+    @classmethod
+    def from_wire(cls, data: List) -> 'MessageRecord':
+        """
+        從 to_wire 的列表建立紀錄
+
+        Args:
+            data (List): 訊息欄位
+
+        Returns:
+            MessageRecord: 訊息紀錄
+        """
+        (message_id, channel_id, guild_id, author_id, author, author_name, avatar,
+         channel_name, guild_name, content, attachments, timestamp) = data
+        return cls(message_id, channel_id, guild_id, author_id, author, author_name, avatar,
+                   channel_name, guild_name, content,
+                   tuple(Attachment(*attachment) for attachment in attachments), timestamp)
+
+    def to_dict(self) -> Dict:
+        """
+        轉換為日誌檔案與訊息封存使用的字典格式
+
+        Returns:
+            Dict: 訊息資料
+        """
+        return {
+            'id': str(self.id),
+            'author': self.author,
+            'author_id': str(self.author_id) if self.author_id is not None else None,
+            'content': self.content,
+            'timestamp': self.timestamp,
+            'channel_id': str(self.channel_id) if self.channel_id is not None else None,
+            'channel_name': self.channel_name,
+            'guild_id': str(self.guild_id) if self.guild_id is not None else None,
+            'guild_name': self.guild_name,
+            'attachments': [attachment._asdict() for attachment in self.attachments],
+        }
+
+    def to_panel(self) -> Dict:
+        """
+        轉換為控制面板使用的字典格式，ID 以字串表示避免 JavaScript 的精度問題
+
+        Returns:
+            Dict: 訊息資料
+        """
+        return {
+            'id': str(self.id),
+            'channel_id': str(self.channel_id),
+            'content': self.content,
+            'author': {
+                'id': str(self.author_id) if self.author_id is not None else None,
+                'name': self.author_name,
+                'avatar': self.avatar,
+            },
+            'timestamp': self.timestamp,
+            'attachments': [
+                {
+                    'url': attachment.url,
+                    'filename': attachment.filename,
+                    'content_type': attachment.content_type,
+                }
+                for attachment in self.attachments if attachment.is_image
+            ],
+        }
+
+    def panel_json(self) -> str:
+        """
+        獲取控制面板格式的 JSON，只在第一次呼叫或訊息被編輯後編碼
+
+        Returns:
+            str: JSON 字串
+        """
+        encoded = self._json
+        if encoded is None:
+            encoded = self._json = _dumps(self.to_panel())
+        return encoded
+
+    def apply_edit(self, fields: Dict) -> None:
+        """
+        套用訊息編輯，並清除快取的 JSON
+
+        Args:
+            fields (Dict): serialize_edit 取出的欄位
+        """
+        if 'content' in fields:
+            self.content = fields['content']
+        if 'attachments' in fields:
+            self.attachments = fields['attachments']
+        self._json = None
+
+
+def _attachments(attachments: Iterable) -> Tuple[Attachment, ...]:
+    return tuple(
+        Attachment(attachment.url, attachment.filename, attachment.content_type, attachment.size)
+        for attachment in attachments)
+
+
+def serialize_message(message: discord.Message) -> MessageRecord:
+    """
+    將 discord.Message 轉換為訊息紀錄
+
+    Args:
+        message (discord.Message): Discord 訊息
+
+    Returns:
+        MessageRecord: 訊息紀錄
+    """
+    author = message.author
+    guild = message.guild
+    return MessageRecord(
+        id=message.id,
+        channel_id=message.channel.id,
+        guild_id=guild.id if guild else None,
+        author_id=author.id,
+        author=str(author),
+        author_name=author.name,
+        avatar=str(author.avatar.url) if author.avatar else None,
+        channel_name=getattr(message.channel, 'name', None),
+        guild_name=guild.name if guild else None,
+        content=message.content,
+        attachments=_attachments(message.attachments),
+    )
+
+
+def serialize_edit(data: Dict) -> Dict:
+    """
+    從 MESSAGE_UPDATE 的原始資料取出控制面板需要更新的欄位
+
+    Args:
+        data (Dict): Gateway 事件的原始訊息資料
+
+    Returns:
+        Dict: 需要更新的欄位，可能為空
+    """
+    fields: Dict = {}
+    if 'content' in data:
+        fields['content'] = data['content']
+    if 'attachments' in data:
+        fields['attachments'] = tuple(
+            Attachment(attachment['url'], attachment['filename'],
+                       attachment.get('content_type'), attachment.get('size'))
+            for attachment in data['attachments'])
+    return fields
+
+
+def as_dict(message) -> Dict:
+    """
+    將訊息紀錄轉換為字典，已經是字典的舊資料原樣返回
+
+    Args:
+        message: MessageRecord 或字典
+
+    Returns:
+        Dict: 訊息資料
+    """
+    return message.to_dict() if isinstance(message, MessageRecord) else message
+
+
+def encode_messages(messages: List[MessageRecord]) -> str:
+    """
+    將多個訊息紀錄編碼為 JSON 陣列，重用每個紀錄快取的編碼
+
+    Args:
+        messages (List[MessageRecord]): 訊息紀錄
+
+    Returns:
+        str: JSON 陣列
+    """
+    return '[' + ','.join(message.panel_json() for message in messages) + ']'
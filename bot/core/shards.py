@@ -0,0 +1,228 @@
+"""
+分片監測模組
+
+此模組記錄每個 Gateway 分片的狀態，供控制面板的分片頁面與效能指標使用：
+- 事件數以每秒一格的環形計數器保存，記錄為 O(1)，讀取時才計算速率
+- 分片 ID 由伺服器 ID 換算（(guild_id >> 22) % shard_count），不需要查詢快取
+- 延遲與連線狀態在讀取時直接從 discord.py 取得
+"""
+
+import math
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from discord.ext import commands
+
+from .logger import logger
+from .metrics import SHARD_EVENTS, SHARD_LATENCY_SECONDS
+
+# 事件速率的統計視窗（秒）
+RATE_WINDOW_SECONDS = 60
+
+
+def parse_shard_config(shard_count: Optional[str],
+                       shard_ids: Optional[str]) -> Tuple[bool, Optional[int], Optional[List[int]]]:
+    """
+    解析分片設定
+
+    Args:
+        shard_count (Optional[str]): 空字串表示不分片，'auto' 表示由 Discord 建議分片數，
+            或指定分片總數
+        shard_ids (Optional[str]): 此程序負責的分片 ID，以逗號分隔；未指定時負責全部
+
+    Returns:
+        Tuple[bool, Optional[int], Optional[List[int]]]: 是否分片、分片總數與此程序的分片 ID
+
+    Raises:
+        ValueError: 無效的設定
+    """
+    count_text = (shard_count or '').strip().lower()
+    ids_text = (shard_ids or '').strip()
+    if not count_text and not ids_text:
+        return False, None, None
+
+    count = None if count_text in ('', 'auto') else int(count_text)
+    if count is not None and count < 1:
+        raise ValueError(f"無效的分片數: {shard_count}")
+
+    ids = None
+    if ids_text:
+        if count is None:
+            raise ValueError('指定 SHARD_IDS 時必須同時指定 SHARD_COUNT')
+        ids = sorted({int(value) for value in ids_text.split(',') if value.strip()})
+        invalid = [shard_id for shard_id in ids if not 0 <= shard_id < count]
+        if invalid:
+            raise ValueError(f"分片 ID 超出範圍: {invalid}")
+    return True, count, ids
+
+
+class _RateCounter:
+    """
+    以每秒一格的環形計數器統計最近一段時間的事件數
+    """
+
+    __slots__ = ('total', 'first', '_buckets', '_seconds')
+
+    def __init__(self, window: int) -> None:
+        # 多保留一格給目前這一秒
+        self.total = 0
+        self.first: Optional[int] = None
+        self._buckets = [0] * (window + 1)
+        self._seconds = [0] * (window + 1)
+
+    def add(self, now: int) -> None:
+        index = now % len(self._buckets)
+        if self._seconds[index] != now:
+            self._seconds[index] = now
+            self._buckets[index] = 0
+        self._buckets[index] += 1
+        self.total += 1
+        if self.first is None:
+            self.first = now
+
+    def rate(self, now: int, window: int) -> float:
+        # 不包含目前這一秒，避免尚未結束的一秒拉低速率；剛開始統計時以實際經過的秒數計算
+        if self.first is None or now <= self.first:
+            return 0.0
+        window = min(window, now - self.first)
+        oldest = now - window
+        count = sum(bucket for bucket, second in zip(self._buckets, self._seconds)
+                    if oldest <= second < now)
+        return count / window
+
+
+class ShardMonitor:
+    """
+    分片監測器
+
+    此類別負責：
+    - 記錄每個分片處理的事件數
+    - 記錄分片的連線、斷線與恢復
+    - 彙整每個分片的延遲、伺服器數與事件速率
+    """
+
+    def __init__(self, bot: commands.Bot, window: int = RATE_WINDOW_SECONDS) -> None:
+        """
+        初始化分片監測器
+
+        Args:
+            bot (commands.Bot): Discord 機器人實例（可為 AutoShardedBot）
+            window (int): 事件速率的統計視窗（秒）
+        """
+        self.bot = bot
+        self.window = window
+        self._counters: Dict[int, _RateCounter] = {}
+        self._status: Dict[int, Dict] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def shard_count(self) -> int:
+        return self.bot.shard_count or 1
+
+    def shard_of(self, guild_id: Optional[int]) -> int:
+        """
+        計算伺服器所在的分片
+
+        Args:
+            guild_id (Optional[int]): 伺服器 ID，私人訊息為 None
+
+        Returns:
+            int: 分片 ID，私人訊息一律由分片 0 接收
+        """
+        if not guild_id:
+            return 0
+        return (int(guild_id) >> 22) % self.shard_count
+
+    def record(self, guild_id: Optional[int]) -> None:
+        """
+        記錄一個 Gateway 事件
+
+        Args:
+            guild_id (Optional[int]): 事件所屬的伺服器 ID
+        """
+        shard_id = self.shard_of(guild_id)
+        counter = self._counters.get(shard_id)
+        if counter is None:
+            with self._lock:
+                counter = self._counters.setdefault(shard_id, _RateCounter(self.window))
+        counter.add(int(time.time()))
+        SHARD_EVENTS.labels(str(shard_id)).inc()
+
+    def mark(self, shard_id: int, state: str) -> None:
+        """
+        記錄分片的連線狀態變化
+
+        Args:
+            shard_id (int): 分片 ID
+            state (str): connected、ready、resumed 或 disconnected
+        """
+        with self._lock:
+            status = self._status.setdefault(shard_id, {'reconnects': 0})
+            if state == 'disconnected':
+                status['reconnects'] += 1
+            status['state'] = state
+            status['since'] = time.time()
+        SHARD_LATENCY_SECONDS.labels(str(shard_id)).set_function(
+            lambda: self.latency_of(shard_id))
+        logger.info("分片 %s 狀態: %s", shard_id, state)
+
+    def _latencies(self) -> List[Tuple[int, float]]:
+        latencies = getattr(self.bot, 'latencies', None)
+        if latencies is None:
+            return [(self.bot.shard_id or 0, self.bot.latency)]
+        if latencies:
+            return list(latencies)
+        # 分片尚未連線時，依設定列出此程序負責的分片
+        shard_ids = self.bot.shard_ids or range(self.bot.shard_count or 0)
+        return [(shard_id, float('inf')) for shard_id in shard_ids]
+
+    def latency_of(self, shard_id: int) -> float:
+        """
+        獲取分片的心跳延遲
+
+        Args:
+            shard_id (int): 分片 ID
+
+        Returns:
+            float: 延遲秒數，尚未收到心跳回應時為 NaN
+        """
+        for current, latency in self._latencies():
+            if current == shard_id and math.isfinite(latency):
+                return latency
+        return float('nan')
+
+    def snapshot(self) -> Dict:
+        """
+        彙整所有分片的狀態
+
+        Returns:
+            Dict: 分片總數、本程序的分片與每個分片的延遲、伺服器數、事件數與速率
+        """
+        now = int(time.time())
+        guild_counts: Dict[int, int] = {}
+        for guild in self.bot.guilds:
+            shard_id = self.shard_of(guild.id)
+            guild_counts[shard_id] = guild_counts.get(shard_id, 0) + 1
+
+        shards = []
+        for shard_id, latency in sorted(self._latencies()):
+            counter = self._counters.get(shard_id)
+            status = self._status.get(shard_id, {})
+            shards.append({
+                'id': shard_id,
+                'state': status.get('state', 'unknown'),
+                'since': status.get('since'),
+                'reconnects': status.get('reconnects', 0),
+                # 尚未收到心跳回應時延遲為 inf，無法以 JSON 表示
+                'latency_ms': round(latency * 1000, 1) if math.isfinite(latency) else None,
+                'guilds': guild_counts.get(shard_id, 0),
+                'events': counter.total if counter else 0,
+                'events_per_second': round(counter.rate(now, self.window), 2) if counter else 0.0,
+            })
+        return {
+            'shard_count': self.shard_count,
+            'shard_ids': getattr(self.bot, 'shard_ids', None),
+            'window_seconds': self.window,
+            'shards': shards,
+        }
@@ -0,0 +1,124 @@
+"""
+請求合併模組
+
+控制面板讀取訊息時，多個使用者可能同時觸發相同的 Discord REST 請求：
+- 以鍵（例如頻道與游標）合併同時進行的相同請求，只送出一次並共用結果
+- 空結果保留一小段時間，期間內相同的請求直接返回，閒置頻道的輪詢不會送出 REST 請求
+- 所有請求都在機器人的事件迴圈上執行，其他執行緒只讀取空結果的快取
+"""
+
+import asyncio
+import threading
+import time
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from .logger import logger
+from .metrics import SINGLE_FLIGHT
+
+# 空結果快取的項目數超過此數量時清除已過期的項目
+_NEGATIVE_SWEEP_SIZE = 1024
+
+_LEADER = SINGLE_FLIGHT.labels('leader')
+_SHARED = SINGLE_FLIGHT.labels('shared')
+_NEGATIVE = SINGLE_FLIGHT.labels('negative')
+
+
+def _is_empty(result: Any) -> bool:
+    return not result
+
+
+class SingleFlight:
+    """
+    請求合併器
+
+    此類別負責：
+    - 記錄進行中的請求，相同鍵的呼叫者等待同一個結果
+    - 保存空結果直到過期
+    """
+
+    def __init__(self, negative_ttl: float = 2.0,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        """
+        初始化請求合併器
+
+        Args:
+            negative_ttl (float): 空結果保留的秒數，0 表示不保留
+            clock (Callable[[], float]): 時間來源
+        """
+        self.negative_ttl = negative_ttl
+        self.clock = clock
+        self._flights: Dict[Hashable, asyncio.Future] = {}
+        self._negative: Dict[Hashable, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+
+    def cached(self, key: Hashable) -> Tuple[bool, Any]:
+        """
+        查詢尚未過期的空結果，可從任何執行緒呼叫
+
+        Args:
+            key (Hashable): 請求的鍵
+
+        Returns:
+            Tuple[bool, Any]: 是否命中與快取的結果
+        """
+        entry = self._negative.get(key)
+        if entry is None:
+            return False, None
+        expires, result = entry
+        if self.clock() >= expires:
+            with self._lock:
+                if self._negative.get(key) is entry:
+                    del self._negative[key]
+            return False, None
+        _NEGATIVE.inc()
+        return True, result
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]],
+                 is_empty: Callable[[Any], bool] = _is_empty) -> Any:
+        """
+        執行請求，相同鍵的請求進行中時等待其結果
+
+        必須在事件迴圈上呼叫。個別呼叫者被取消不會取消共用的請求。
+
+        Args:
+            key (Hashable): 請求的鍵
+            factory (Callable[[], Awaitable[Any]]): 建立請求協程的函式
+            is_empty (Callable[[Any], bool]): 判斷結果是否為空
+
+        Returns:
+            Any: 請求的結果
+        """
+        hit, result = self.cached(key)
+        if hit:
+            return result
+
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = asyncio.ensure_future(factory())
+            self._flights[key] = flight
+            flight.add_done_callback(partial(self._finish, key, is_empty))
+            _LEADER.inc()
+        else:
+            _SHARED.inc()
+            logger.debug("合併相同的請求: %s", key)
+        return await asyncio.shield(flight)
+
+    def _finish(self, key: Hashable, is_empty: Callable[[Any], bool],
+                flight: asyncio.Future) -> None:
+        self._flights.pop(key, None)
+        if flight.cancelled() or flight.exception() is not None or self.negative_ttl <= 0:
+            return
+        result = flight.result()
+        if not is_empty(result):
+            return
+        now = self.clock()
+        with self._lock:
+            if len(self._negative) >= _NEGATIVE_SWEEP_SIZE:
+                for expired in [k for k, (expires, _) in self._negative.items() if expires <= now]:
+                    del self._negative[expired]
+            self._negative[key] = (now + self.negative_ttl, result)
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._flights)
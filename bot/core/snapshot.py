@@ -0,0 +1,80 @@
+"""
+啟動快照模組
+
+此模組在關閉時把記憶體中的狀態寫成精簡的二進位快照，下次啟動時直接還原：
+- 內容為訊息歷史、各頻道的訊息快取與伺服器目錄，訊息以 MessageRecord.to_wire 的列表保存
+- 以 marshal 序列化並以 zlib 壓縮，讀取時不需要逐筆解析 JSON
+- 檔頭包含識別碼、格式版本與 CRC32，版本不符或檔案損毀時略過快照
+- 以暫存檔加 os.replace 寫入，中斷的寫入不會留下損毀的快照
+"""
+
+import marshal
+import os
+import struct
+import time
+import zlib
+from typing import Any, Dict, Optional
+
+from .logger import logger
+
+# 識別碼、格式版本、內容的 CRC32
+_HEADER = struct.Struct('>4sHI')
+_MAGIC = b'DBSN'
+SNAPSHOT_VERSION = 1
+
+
+def write_snapshot(path: str, payload: Dict[str, Any]) -> int:
+    """
+    寫入快照
+
+    Args:
+        path (str): 快照檔案路徑
+        payload (Dict[str, Any]): 只包含 marshal 支援型別的資料
+
+    Returns:
+        int: 寫入的位元組數
+    """
+    payload = dict(payload, created=time.time())
+    body = zlib.compress(marshal.dumps(payload), 1)
+    data = _HEADER.pack(_MAGIC, SNAPSHOT_VERSION, zlib.crc32(body)) + body
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+    return len(data)
+
+
+def read_snapshot(path: str) -> Optional[Dict[str, Any]]:
+    """
+    讀取快照
+
+    Args:
+        path (str): 快照檔案路徑
+
+    Returns:
+        Optional[Dict[str, Any]]: 快照資料，檔案不存在、版本不符或損毀時返回 None
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+
+    if len(data) < _HEADER.size:
+        logger.warning("快照檔案不完整，略過: %s", path)
+        return None
+    magic, version, checksum = _HEADER.unpack_from(data)
+    body = data[_HEADER.size:]
+    if magic != _MAGIC or version != SNAPSHOT_VERSION:
+        logger.warning("快照格式不符 (版本 %s)，略過: %s", version, path)
+        return None
+    if zlib.crc32(body) != checksum:
+        logger.warning("快照檔案已損毀，略過: %s", path)
+        return None
+    try:
+        return marshal.loads(zlib.decompress(body))
+    except (ValueError, EOFError, TypeError, zlib.error) as e:
+        logger.warning("無法解析快照 %s: %s", path, e)
+        return None
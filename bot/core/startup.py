@@ -0,0 +1,81 @@
+"""
+啟動時間量測模組
+
+此模組記錄程式啟動後各階段完成的時間：
+- 各階段的秒數寫入 discord_bot_startup_seconds 指標
+- 連線就緒時記錄整體的啟動時間；STARTUP_PROFILE 啟用時列出每個階段
+"""
+
+import time
+from typing import Dict, Optional
+
+from utils.config import STARTUP_PROFILE
+from .logger import logger
+from .metrics import STARTUP_SECONDS
+
+
+class StartupProfile:
+    """
+    啟動時間紀錄
+
+    此類別負責：
+    - 以程式開始執行的時間為起點，記錄各階段完成的時間
+    - 在啟動完成時輸出各階段的耗時
+    """
+
+    def __init__(self, enabled: bool = False) -> None:
+        """
+        初始化啟動時間紀錄
+
+        Args:
+            enabled (bool): 是否在啟動完成時列出每個階段
+        """
+        self.enabled = enabled
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.reported = False
+
+    def begin(self, started: Optional[float] = None) -> None:
+        """
+        設定量測的起點，例如主程式在匯入其他模組前記錄的時間
+
+        Args:
+            started (Optional[float]): time.perf_counter 的值，None 表示現在
+        """
+        self.started = time.perf_counter() if started is None else started
+
+    def mark(self, phase: str) -> float:
+        """
+        記錄階段完成的時間
+
+        Args:
+            phase (str): 階段名稱
+
+        Returns:
+            float: 從起點到現在的秒數
+        """
+        elapsed = time.perf_counter() - self.started
+        self.phases[phase] = elapsed
+        STARTUP_SECONDS.labels(phase).set(elapsed)
+        if self.enabled:
+            logger.info("啟動階段 %s 完成: %.3f 秒", phase, elapsed)
+        return elapsed
+
+    def report(self) -> None:
+        """
+        啟動完成時輸出整體耗時，之後重新連線不再輸出
+        """
+        if self.reported:
+            return
+        self.reported = True
+        elapsed = self.mark('ready')
+        logger.info("啟動完成，共 %.3f 秒", elapsed)
+        if self.enabled:
+            previous = 0.0
+            for phase, at in sorted(self.phases.items(), key=lambda item: item[1]):
+                logger.info("  %-20s %8.3f 秒 (+%.3f)", phase, at, at - previous)
+                previous = at
+
+
+# 全域的啟動時間紀錄
+startup = StartupProfile(STARTUP_PROFILE)
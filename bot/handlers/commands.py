@@ -4,41 +4,39 @@
 此模組包含所有 Discord 機器人的自定義命令。
 """
 
-from typing import Optional
-import discord
-from discord.ext import commands
 from ..core.logger import logger
+from ..core.router import CommandContext, CommandRouter
 
 
-def setup_commands(bot: commands.Bot) -> None:
+def setup_commands(router: CommandRouter) -> None:
     """
     設置所有自定義命令
 
     Args:
-        bot (commands.Bot): Discord 機器人實例
+        router (CommandRouter): 命令路由
     """
-    @bot.command(name='ping')
-    async def ping(ctx: commands.Context) -> None:
+    @router.command('ping', description='測試機器人是否在線', cooldown=(3, 10))
+    async def ping(ctx: CommandContext) -> None:
         """
         回應 ping 命令，用於測試機器人是否在線
 
         Args:
-            ctx (commands.Context): 命令上下文
+            ctx (CommandContext): 命令上下文
         """
-        logger.debug(f"收到 ping 命令，來自 {ctx.author}")
+        logger.debug("收到 ping 命令，來自 %s", ctx.author)
         await ctx.send('Pong!')
 
-    @bot.command(name='help')
-    async def help(ctx: commands.Context) -> None:
+    @router.command('help', description='顯示此幫助訊息', cooldown=(1, 30), bucket='channel')
+    async def help(ctx: CommandContext) -> None:
         """
-        顯示幫助訊息
+        顯示幫助訊息，由已註冊的命令產生
 
         Args:
-            ctx (commands.Context): 命令上下文
+            ctx (CommandContext): 命令上下文
         """
-        help_message = """
-        可用的命令：
-        !ping - 測試機器人是否在線
-        !help - 顯示此幫助訊息
-        """
-        await ctx.send(help_message)
+        prefix = ctx.router.prefix
+        lines = ['可用的命令：']
+        for command in ctx.router.commands:
+            aliases = ''.join(f', {prefix}{alias}' for alias in command.aliases)
+            lines.append(f'{prefix}{command.name}{aliases} - {command.description}')
+        await ctx.send('\n'.join(lines))
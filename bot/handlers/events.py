@@ -4,10 +4,13 @@
 此模組包含所有 Discord 機器人的事件處理器。
 """
 
-from typing import Dict, List, Optional
+from typing import Optional
 import discord
 from discord.ext import commands
-from ..core.logger import logger
+from ..core.logger import logger, message_logger
+from ..core.metrics import ON_MESSAGE_SECONDS, timed
+from ..core.serializer import serialize_edit, serialize_message
+from ..core.startup import startup
 
 
 def setup_events(bot: commands.Bot, discord_bot) -> None:
@@ -18,20 +21,31 @@ def setup_events(bot: commands.Bot, discord_bot) -> None:
         bot (commands.Bot): Discord 機器人實例
         discord_bot: DiscordBot 類的實例
     """
+    shards = discord_bot.shards
+    sharded = isinstance(bot, commands.AutoShardedBot)
+
     @bot.event
     async def on_ready() -> None:
         """
-        當機器人準備就緒時觸發的事件處理器
+        當機器人準備就緒時觸發的事件處理器（分片模式下在所有分片就緒後觸發）
         """
-        logger.info(f'{bot.user} 已經上線！')
+        logger.info("%s 已經上線！", bot.user)
+        if not sharded:
+            shards.mark(0, 'ready')
+        # 建立伺服器和頻道目錄，之後由事件逐筆更新
+        discord_bot.update_guilds_info()
+        startup.report()
+        # 頻道已可讀取，繼續上次未完成的匯出工作
+        discord_bot.exporter.resume()
         logger.info('已加入的伺服器列表:')
         for guild in bot.guilds:
-            logger.info(f'伺服器名稱: {guild.name}')
-            logger.info(f'伺服器 ID: {guild.id}')
-            logger.info(f'成員數量: {guild.member_count}')
+            logger.info("伺服器名稱: %s", guild.name)
+            logger.info("伺服器 ID: %s", guild.id)
+            logger.info("成員數量: %s", guild.member_count)
             logger.info('---')
 
     @bot.event
+    @timed(ON_MESSAGE_SECONDS)
     async def on_message(message: discord.Message) -> None:
         """
         當收到新訊息時觸發的事件處理器
@@ -39,44 +53,190 @@ def setup_events(bot: commands.Bot, discord_bot) -> None:
         Args:
             message (discord.Message): 收到的訊息對象
         """
+        try:
+            # 每則訊息只序列化一次，快取、推送與歷史記錄共用同一個紀錄
+            record = serialize_message(message)
+            shards.record(record.guild_id)
+        except Exception as e:
+            logger.error("處理訊息時發生錯誤: %s", e)
+            await discord_bot.router.dispatch(message)
+            return
+
+        # 更新控制面板的快取並推送（包含機器人自己發送的訊息）
+        channel_id = str(message.channel.id)
+        has_subscribers = discord_bot.hub.has_subscribers(channel_id)
+        if has_subscribers or discord_bot.message_cache.is_warm(channel_id):
+            try:
+                discord_bot.message_cache.add(channel_id, record)
+                if has_subscribers:
+                    discord_bot.hub.publish(channel_id, record)
+            except Exception as e:
+                logger.error("推送訊息時發生錯誤: %s", e)
+
         if message.author == bot.user:
             return
 
         try:
-            logger.info(f"收到來自 {message.author} 的訊息")
-
-            # 處理附件
-            attachments: List[Dict] = []
-            for attachment in message.attachments:
-                attachment_data = {
-                    'url': attachment.url,
-                    'filename': attachment.filename,
-                    'content_type': attachment.content_type,
-                    'size': attachment.size
-                }
-                attachments.append(attachment_data)
-                logger.debug(f"處理附件: {attachment_data}")
-
-            # 建立訊息資料
-            message_data = {
-                'id': str(message.id),
-                'author': str(message.author),
-                'content': message.content,
-                'timestamp': message.created_at.isoformat(),
-                'channel_id': str(message.channel.id),
-                'channel_name': str(message.channel.name),
-                'guild_id': str(message.guild.id) if message.guild else None,
-                'guild_name': str(message.guild.name) if message.guild else None,
-                'attachments': attachments
-            }
+            message_logger.debug("收到來自 %s 的訊息", message.author)
+            for attachment in record.attachments:
+                message_logger.debug("處理附件: %s", attachment)
 
             # 添加到訊息歷史
-            discord_bot.add_message(message_data)
+            discord_bot.add_message(record)
 
         except Exception as e:
-            logger.error(f"處理訊息時發生錯誤: {e}")
+            logger.error("處理訊息時發生錯誤: %s", e)
             # 繼續處理命令
-            await bot.process_commands(message)
+            await discord_bot.router.dispatch(message)
             return
 
-        await bot.process_commands(message)
+        await discord_bot.router.dispatch(message)
+
+    @bot.event
+    async def on_raw_message_edit(payload: discord.RawMessageUpdateEvent) -> None:
+        """
+        當訊息被編輯時觸發的事件處理器（包含不在 discord.py 快取中的訊息）
+
+        Args:
+            payload (discord.RawMessageUpdateEvent): 編輯事件資料
+        """
+        shards.record(payload.guild_id)
+        try:
+            fields = serialize_edit(payload.data)
+            if fields:
+                discord_bot.message_cache.update(
+                    str(payload.channel_id), str(payload.message_id), fields)
+                # 經由寫入佇列更新封存，排在同一則訊息的寫入之後
+                discord_bot.writer.enqueue_edit(payload.message_id, fields)
+        except Exception as e:
+            logger.error("處理訊息編輯時發生錯誤: %s", e)
+
+    @bot.event
+    async def on_raw_message_delete(payload: discord.RawMessageDeleteEvent) -> None:
+        """
+        當訊息被刪除時觸發的事件處理器
+
+        Args:
+            payload (discord.RawMessageDeleteEvent): 刪除事件資料
+        """
+        shards.record(payload.guild_id)
+        discord_bot.message_cache.remove(
+            str(payload.channel_id), [str(payload.message_id)])
+        discord_bot.writer.enqueue_delete([payload.message_id])
+
+    @bot.event
+    async def on_raw_bulk_message_delete(payload: discord.RawBulkMessageDeleteEvent) -> None:
+        """
+        當訊息被批次刪除時觸發的事件處理器
+
+        Args:
+            payload (discord.RawBulkMessageDeleteEvent): 批次刪除事件資料
+        """
+        shards.record(payload.guild_id)
+        discord_bot.message_cache.remove(
+            str(payload.channel_id), [str(message_id) for message_id in payload.message_ids])
+        discord_bot.writer.enqueue_delete(payload.message_ids)
+
+    if sharded:
+        @bot.event
+        async def on_shard_connect(shard_id: int) -> None:
+            shards.mark(shard_id, 'connected')
+
+        @bot.event
+        async def on_shard_ready(shard_id: int) -> None:
+            shards.mark(shard_id, 'ready')
+
+        @bot.event
+        async def on_shard_resumed(shard_id: int) -> None:
+            shards.mark(shard_id, 'resumed')
+
+        @bot.event
+        async def on_shard_disconnect(shard_id: int) -> None:
+            shards.mark(shard_id, 'disconnected')
+    else:
+        @bot.event
+        async def on_connect() -> None:
+            shards.mark(0, 'connected')
+
+        @bot.event
+        async def on_resumed() -> None:
+            shards.mark(0, 'resumed')
+
+        @bot.event
+        async def on_disconnect() -> None:
+            shards.mark(0, 'disconnected')
+
+    @bot.event
+    async def on_guild_join(guild: discord.Guild) -> None:
+        """
+        當機器人加入伺服器時觸發的事件處理器
+
+        Args:
+            guild (discord.Guild): 加入的伺服器
+        """
+        logger.info("已加入伺服器: %s (%s)", guild.name, guild.id)
+        discord_bot.directory.upsert_guild(guild)
+
+    @bot.event
+    async def on_guild_available(guild: discord.Guild) -> None:
+        """
+        當伺服器恢復可用時觸發的事件處理器
+
+        Args:
+            guild (discord.Guild): 恢復可用的伺服器
+        """
+        discord_bot.directory.upsert_guild(guild)
+
+    @bot.event
+    async def on_guild_update(before: discord.Guild, after: discord.Guild) -> None:
+        """
+        當伺服器資訊變更時觸發的事件處理器
+
+        Args:
+            before (discord.Guild): 變更前的伺服器
+            after (discord.Guild): 變更後的伺服器
+        """
+        discord_bot.directory.upsert_guild(after)
+
+    @bot.event
+    async def on_guild_remove(guild: discord.Guild) -> None:
+        """
+        當機器人離開伺服器時觸發的事件處理器
+
+        Args:
+            guild (discord.Guild): 離開的伺服器
+        """
+        logger.info("已離開伺服器: %s (%s)", guild.name, guild.id)
+        discord_bot.directory.remove_guild(guild.id)
+
+    @bot.event
+    async def on_guild_channel_create(channel: discord.abc.GuildChannel) -> None:
+        """
+        當頻道建立時觸發的事件處理器
+
+        Args:
+            channel (discord.abc.GuildChannel): 建立的頻道
+        """
+        discord_bot.directory.upsert_channel(channel)
+
+    @bot.event
+    async def on_guild_channel_update(before: discord.abc.GuildChannel,
+                                      after: discord.abc.GuildChannel) -> None:
+        """
+        當頻道變更時觸發的事件處理器
+
+        Args:
+            before (discord.abc.GuildChannel): 變更前的頻道
+            after (discord.abc.GuildChannel): 變更後的頻道
+        """
+        discord_bot.directory.upsert_channel(after)
+
+    @bot.event
+    async def on_guild_channel_delete(channel: discord.abc.GuildChannel) -> None:
+        """
+        當頻道刪除時觸發的事件處理器
+
+        Args:
+            channel (discord.abc.GuildChannel): 刪除的頻道
+        """
+        discord_bot.directory.remove_channel(channel)
@@ -1,74 +1,96 @@
+import time
+
+# 在匯入其他模組之前記錄啟動時間，啟動量測包含匯入的耗時
+STARTED = time.perf_counter()
+
 import asyncio
 import sys
-import os
 import logging
-from dotenv import load_dotenv
+# utils.config 會載入 .env，其他模組匯入前環境變數已就緒
+from utils.config import (DISCORD_TOKEN, IPC_SOCKET, LOG_LEVEL, LOG_SAMPLE_EVERY, MEMORY_PROFILE,
+                          SHARD_COUNT, SHARD_IDS, WEB_SERVER)
 from bot import DiscordBot
-from web.app import FlaskApp
-
-# 載入環境變數
-load_dotenv()
+from bot.core.logger import setup_logging as configure_logging, stop_logging
+from bot.core.profile import get_profile
+from bot.core.shards import parse_shard_config
+from bot.core.startup import startup
 
 # 配置根日誌記錄器
 
 
 def setup_logging():
-    # 移除所有現有的處理器
-    root_logger = logging.getLogger()
-    for handler in root_logger.handlers[:]:
-        root_logger.removeHandler(handler)
-
-    # 設置根日誌記錄器
-    root_logger.setLevel(logging.DEBUG)
-
-    # 創建控制台處理器
-    console_handler = logging.StreamHandler()
-    console_handler.setLevel(logging.DEBUG)
-
-    # 創建格式化器
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-    console_handler.setFormatter(formatter)
-
-    # 添加處理器到根日誌記錄器
-    root_logger.addHandler(console_handler)
-
-    # 設置 Discord.py 的日誌級別
-    logging.getLogger('discord.gateway').setLevel(logging.WARNING)
-    logging.getLogger('discord.client').setLevel(logging.WARNING)
-    logging.getLogger('discord.http').setLevel(logging.WARNING)
+    # 日誌級別由 LOG_LEVEL 設定，輸出在背景執行緒進行
+    configure_logging(LOG_LEVEL, LOG_SAMPLE_EVERY)
 
 
 async def main():
     # 設置日誌
     setup_logging()
     logger = logging.getLogger(__name__)
+    startup.begin(STARTED)
+    startup.mark('imports')
 
     # 從環境變數獲取 Discord token
-    token = os.getenv('DISCORD_TOKEN')
+    token = DISCORD_TOKEN
     if not token:
         logger.error("錯誤：未找到 DISCORD_TOKEN 環境變數")
         sys.exit(1)
 
+    try:
+        sharded, shard_count, shard_ids = parse_shard_config(SHARD_COUNT, SHARD_IDS)
+    except ValueError as e:
+        logger.error("分片設定錯誤: %s", e)
+        sys.exit(1)
+
+    try:
+        profile = get_profile(MEMORY_PROFILE)
+    except ValueError as e:
+        logger.error("執行設定檔錯誤: %s", e)
+        sys.exit(1)
+
     # 初始化 Discord 機器人
-    discord_bot = DiscordBot(token)
+    discord_bot = DiscordBot(token, sharded, shard_count, shard_ids, profile)
     bot = discord_bot.get_bot()
-
-    # 初始化並啟動 Flask 應用
-    flask_app = FlaskApp(discord_bot)
-    flask_app.start()
+    startup.mark('bot')
+
+    flask_app = None
+    async_server = None
+    ipc_server = None
+    if WEB_SERVER == 'ipc':
+        # 控制面板在其他程序執行，機器人只透過 Unix socket 提供狀態與發送佇列
+        from web.ipc import IPCServer
+        ipc_server = IPCServer(discord_bot, IPC_SOCKET)
+        await ipc_server.start()
+    elif WEB_SERVER == 'async':
+        # 在機器人的事件迴圈上執行控制面板；網頁相關模組只在需要時匯入
+        from web.app import FlaskApp
+        flask_app = FlaskApp(discord_bot)
+        from web.async_server import AsyncPanelServer
+        async_server = AsyncPanelServer(flask_app)
+        await async_server.start()
+    else:
+        # 初始化並啟動 Flask 應用
+        from web.app import FlaskApp
+        flask_app = FlaskApp(discord_bot)
+        flask_app.start()
+    startup.mark('web')
 
     try:
         # 啟動 Discord 機器人
         await discord_bot.start_bot()
-    except KeyboardInterrupt:
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        # Python 3.11 起 asyncio.run 收到 Ctrl+C 時會取消主任務，而不是拋出 KeyboardInterrupt
         logger.info("正在關閉程式...")
         # 關閉 Flask 應用
-        flask_app.shutdown()
+        if ipc_server:
+            await ipc_server.shutdown()
+        elif async_server:
+            await async_server.shutdown()
+        else:
+            flask_app.shutdown()
         # 關閉 Discord 機器人
         await discord_bot.close_bot()
+        stop_logging()
         sys.exit(0)
 
 
@@ -0,0 +1,89 @@
+"""
+minify_js 的測試：除號與正規表示式、樣板字串的 ${ } 巢狀、字串中的註解符號，
+並以實際的 panel.js 原始檔案確認縮減結果仍是有效的 JS
+"""
+
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from web.assets import BUNDLES, minify_js
+
+STATIC_DIR = os.path.join(os.path.dirname(__file__), os.pardir, 'web', 'static')
+
+
+def js_sources():
+    return [os.path.join(STATIC_DIR, path) for path in BUNDLES['panel.js']]
+
+
+@pytest.mark.parametrize('source', [
+    'const half = total / 2 / count;',
+    'const mean = (a + b) / 2, first = values[0] / 3;',
+    'let n = i++ / 2, m = j-- / 2;',
+    'x = i++ / 2 + "a/b // c";',
+])
+def test_division_is_kept(source):
+    assert minify_js(source) == source + '\n'
+
+
+@pytest.mark.parametrize('source', [
+    'const re = /[/]\\/+/g;',
+    'if (!/^\\d+$/.test(value)) return;',
+    'const parts = text.split(/\\s*,\\s*/);',
+    'return /x\\/y/i.test(s);',
+    'const s = typeof /x/;',
+])
+def test_regex_is_kept(source):
+    assert minify_js(source) == source + '\n'
+
+
+def test_regex_does_not_swallow_comment_after_it():
+    assert minify_js('const re = /a\\/b/g; // trailing') == 'const re = /a\\/b/g;\n'
+
+
+@pytest.mark.parametrize('source', [
+    'const t = `a ${ `b ${c + `d ${e}`}` } // not a comment`;',
+    'const u = `${ {a: 1}.a } /* keep */`;',
+    'const v = `${fn({x: `${y}`})}\\`${z}`;',
+])
+def test_template_nesting_is_kept(source):
+    assert minify_js(source) == source + '\n'
+
+
+def test_template_resumes_after_nested_braces():
+    source = 'const t = `${ {a: 1}.a } // kept`; // dropped\nnext();'
+    assert minify_js(source) == 'const t = `${ {a: 1}.a } // kept`;\nnext();\n'
+
+
+@pytest.mark.parametrize('source', [
+    "const url = 'https://example.com/*x*/';",
+    'const q = "/* still */ // here";',
+    "const escaped = 'it\\'s // here';",
+])
+def test_comments_inside_strings_are_kept(source):
+    assert minify_js(source + ' // dropped') == source + '\n'
+
+
+def test_comments_and_indentation_are_removed():
+    source = 'x = y\n\n\n    /* c */\n    z = 1 // end\n'
+    assert minify_js(source) == 'x = y\nz = 1\n'
+
+
+@pytest.mark.parametrize('path', js_sources(), ids=os.path.basename)
+def test_bundle_sources_are_stable(path):
+    with open(path, encoding='utf-8') as f:
+        minified = minify_js(f.read())
+    assert minify_js(minified) == minified
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason='需要 node 檢查語法')
+@pytest.mark.parametrize('path', js_sources(), ids=os.path.basename)
+def test_bundle_sources_stay_valid(path, tmp_path):
+    with open(path, encoding='utf-8') as f:
+        minified = minify_js(f.read())
+    output = tmp_path / os.path.basename(path)
+    output.write_text(minified, encoding='utf-8')
+    result = subprocess.run(['node', '--check', str(output)], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
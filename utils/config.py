@@ -7,10 +7,77 @@ load_dotenv()
 # Discord 配置
 DISCORD_TOKEN = os.getenv('DISCORD_TOKEN')
 COMMAND_PREFIX = '!'
+# 執行會阻塞的命令處理函式的執行緒數量
+COMMAND_THREADS = int(os.getenv('COMMAND_THREADS', '4'))
+
+# 分片配置
+# SHARD_COUNT 留空時使用單一連線；'auto' 使用 AutoShardedBot 並由 Discord 建議分片數；
+# 也可以指定分片總數，並以 SHARD_IDS（逗號分隔）讓此程序只負責其中幾個分片
+SHARD_COUNT = os.getenv('SHARD_COUNT', '')
+SHARD_IDS = os.getenv('SHARD_IDS', '')
+# 此程序負責的分片，例如 '0-1'；未指定 SHARD_IDS 時為空字串
+_SHARD_KEY = '-'.join(sorted({value.strip() for value in SHARD_IDS.split(',')
+                              if value.strip().isdigit()}, key=int))
+
+# 資料目錄配置
+# 訊息日誌、封存、快照、程序間通訊 socket、匯出與媒體快取預設都放在此目錄；
+# 以 SHARD_IDS 分散到多個程序時，每個程序預設使用 log/shard-<分片 ID>，不會互相覆寫
+DATA_DIR = os.getenv('DATA_DIR') or (
+    os.path.join('log', f'shard-{_SHARD_KEY}') if _SHARD_KEY else 'log')
 
 # Flask 配置
 FLASK_HOST = 'localhost'
-FLASK_PORT = 5000
+# 以 SHARD_IDS 分散到多個程序時，預設連接埠為 5000 加上此程序的第一個分片 ID
+FLASK_PORT = int(os.getenv('FLASK_PORT') or 5000 + (int(_SHARD_KEY.split('-')[0])
+                                                   if _SHARD_KEY else 0))
 
 # 訊息歷史配置
 MAX_MESSAGES = 100
+# 執行設定檔 (default: discord.py 的預設快取, lean: 關閉 discord.py 的訊息與成員快取，
+# 只訂閱需要的 Gateway 事件，訊息只以精簡紀錄保存一份)
+MEMORY_PROFILE = os.getenv('MEMORY_PROFILE', 'default')
+
+# 網頁伺服器配置
+# threaded: 在背景執行緒中執行 werkzeug 伺服器
+# async: 在機器人的事件迴圈上執行非同步伺服器
+# ipc: 機器人只提供程序間通訊，控制面板由 python -m web.worker 在其他程序執行
+WEB_SERVER = os.getenv('WEB_SERVER', 'threaded')
+# Flask 執行緒等待機器人事件迴圈的逾時秒數
+BRIDGE_TIMEOUT = float(os.getenv('BRIDGE_TIMEOUT', '10'))
+# 補齊快取或往回翻頁沒有取得任何訊息時，相同的請求在此秒數內不再送出
+HISTORY_NEGATIVE_TTL = float(os.getenv('HISTORY_NEGATIVE_TTL', '2'))
+# WEB_SERVER=ipc 時機器人與控制面板工作程序之間的 Unix socket
+IPC_SOCKET = os.getenv('IPC_SOCKET') or os.path.join(DATA_DIR, 'panel.sock')
+
+# 歷史訊息匯出配置
+# 匯出檔案與檢查點的目錄，未完成的匯出工作在下次啟動時從檢查點繼續
+EXPORT_DIR = os.getenv('EXPORT_DIR') or os.path.join(DATA_DIR, 'exports')
+# 所有匯出工作合計同時讀取歷史訊息的 REST 請求數
+EXPORT_CONCURRENCY = int(os.getenv('EXPORT_CONCURRENCY', '4'))
+
+# 啟動配置
+# 關閉時寫入、下次啟動時還原的狀態快照（訊息歷史、頻道訊息快取與伺服器目錄），留空表示停用
+SNAPSHOT_PATH = os.getenv('SNAPSHOT_PATH', os.path.join(DATA_DIR, 'snapshot.bin'))
+# 啟用後在連線就緒時列出各啟動階段的耗時
+STARTUP_PROFILE = os.getenv('STARTUP_PROFILE', '0').lower() in ('1', 'true', 'yes')
+
+# 靜態資源配置
+# 合併、縮減並預先壓縮控制面板的 JS 與 CSS；設為 0 時直接載入原始檔案，方便除錯
+ASSET_PIPELINE = os.getenv('ASSET_PIPELINE', '1').lower() in ('1', 'true', 'yes')
+
+# 媒體代理配置
+# 附件與頭像的磁碟快取目錄與大小上限（MB）
+MEDIA_CACHE_DIR = os.getenv('MEDIA_CACHE_DIR') or os.path.join(DATA_DIR, 'media')
+MEDIA_CACHE_MAX_MB = int(os.getenv('MEDIA_CACHE_MAX_MB', '256'))
+# 允許代理的來源，以逗號分隔；只寫主機時使用 https，測試時可加入 http://127.0.0.1:8000
+MEDIA_ALLOWED_HOSTS = os.getenv('MEDIA_ALLOWED_HOSTS', 'cdn.discordapp.com,media.discordapp.net')
+
+# 日誌配置
+# 日誌級別 (DEBUG, INFO, WARNING, ERROR, CRITICAL)，可在執行時從控制面板調整
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+# 每則訊息都會產生的除錯日誌每幾筆保留一筆
+LOG_SAMPLE_EVERY = int(os.getenv('LOG_SAMPLE_EVERY', '1'))
+
+# 效能指標配置
+# 啟用後在 /metrics 以 Prometheus 格式輸出，未啟用時不會量測
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '0').lower() in ('1', 'true', 'yes')
@@ -2,6 +2,7 @@ from flask import Flask
 from werkzeug.serving import make_server
 import threading
 import logging
+import socket
 from datetime import datetime
 from .routes import Routes
 from utils.config import FLASK_HOST, FLASK_PORT
@@ -11,28 +12,33 @@ logger = logging.getLogger(__name__)
 
 
 class FlaskApp:
-    def __init__(self, discord_bot):
+    def __init__(self, discord_bot, service=None):
         self.discord_bot = discord_bot
+        self.service = service
         self.app = Flask(__name__,
                          template_folder='templates',
                          static_folder='static')
         self.server = None
         self.server_thread = None
 
-        # 初始化訊息快取
-        self.message_cache = {}
+        # 使用機器人的頻道訊息快取，由 Gateway 事件直接更新
+        self.message_cache = discord_bot.message_cache
         self.setup_routes()
         logger.info("FlaskApp 初始化完成")
 
     def setup_routes(self):
         # 初始化路由
-        self.routes = Routes(self.app, self.discord_bot, self.message_cache)
+        self.routes = Routes(self.app, self.discord_bot, self.message_cache, self.service)
         logger.info("路由設置完成")
 
-    def start(self):
+    def start(self, host=FLASK_HOST, port=FLASK_PORT, reuse_port=False):
         try:
-            logger.info(f"正在啟動 Flask 伺服器於 {FLASK_HOST}:{FLASK_PORT}")
-            self.server = make_server(FLASK_HOST, FLASK_PORT, self.app)
+            logger.info("正在啟動 Flask 伺服器於 %s:%s", host, port)
+            # 多個工作程序共用同一個連接埠時，由核心分配連線
+            fd = self.listen_reuse_port(host, port).fileno() if reuse_port else None
+            # 使用多執行緒伺服器，讓長連線的訊息推送不會阻塞其他請求
+            self.server = make_server(
+                host, port, self.app, threaded=True, fd=fd)
             self.server_thread = threading.Thread(
                 target=self.server.serve_forever,
                 name="FlaskServer"
@@ -41,9 +47,19 @@ class FlaskApp:
             self.server_thread.start()
             logger.info("Flask 伺服器已啟動")
         except Exception as e:
-            logger.error(f"啟動 Flask 伺服器時發生錯誤: {str(e)}")
+            logger.error("啟動 Flask 伺服器時發生錯誤: %s", e)
             raise
 
+    def listen_reuse_port(self, host, port):
+        # 建立設定 SO_REUSEPORT 的監聽 socket；保留參照避免被回收而關閉
+        family = socket.AF_INET6 if ':' in host else socket.AF_INET
+        self.listen_socket = socket.socket(family, socket.SOCK_STREAM)
+        self.listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        self.listen_socket.bind((host, port))
+        self.listen_socket.listen(128)
+        return self.listen_socket
+
     def shutdown(self):
         if self.server:
             logger.info("正在關閉 Flask 伺服器...")
@@ -0,0 +1,497 @@
+"""
+靜態資源處理模組
+
+把控制面板的 JS 與 CSS 合併、縮減並加上內容雜湊，供瀏覽器長期快取：
+- 每個組合（panel.js、panel.css）由多個原始檔案依序合併，縮減後以內容雜湊命名
+- 預先產生 gzip 與 brotli（安裝 brotli 套件時）版本，依 Accept-Encoding 選擇
+- 內容不會改變，回應帶有 immutable 快取標頭，重新載入頁面時不需要重新驗證
+- 結果寫入 static/dist 與 manifest.json；原始檔案沒有變更時啟動直接讀取，不重新建置
+
+用法：
+    python -m web.assets    # 重新建置並列出各組合的大小
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # brotli 是選用的套件，未安裝時只提供 gzip
+    brotli = None
+
+# 獲取日誌記錄器
+logger = logging.getLogger(__name__)
+
+# 各組合的原始檔案，順序與 index.html 原本載入的順序相同
+BUNDLES = {
+    'panel.css': ['css/style.css'],
+    'panel.js': ['js/language.js', 'js/messageManager.js', 'js/eventHandler.js'],
+}
+
+CONTENT_TYPES = {
+    '.css': 'text/css; charset=utf-8',
+    '.js': 'text/javascript; charset=utf-8',
+}
+
+# 檔名中的內容雜湊長度
+HASH_LENGTH = 10
+# 偏好的壓縮格式順序
+ENCODINGS = ('br', 'gzip')
+ENCODING_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+# 資源內容以雜湊命名，永遠不會改變
+ASSET_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# 接在這些字元之後的 / 是正規表示式的開頭，而不是除號
+_REGEX_PRECEDERS = set('(,=:[!&|?{};+-*%<>~^')
+_REGEX_KEYWORDS = {'return', 'typeof', 'case', 'in', 'of', 'delete', 'void', 'throw'}
+_TRAILING_WORD = re.compile(r'([A-Za-z_$][\w$]*)\s*$')
+_CSS_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+_CSS_SPACE = re.compile(r'\s+')
+# 選擇器中 : 前的空白有意義（.a :hover），只移除 : 之後的空白
+_CSS_PUNCTUATION = re.compile(r'\s*([{};,>])\s*|(:)\s+')
+
+
+def minify_css(source: str) -> str:
+    """
+    移除 CSS 的註解與多餘的空白
+
+    Args:
+        source (str): 原始 CSS
+
+    Returns:
+        str: 縮減後的 CSS
+    """
+    source = _CSS_COMMENT.sub('', source)
+    source = _CSS_SPACE.sub(' ', source)
+    source = _CSS_PUNCTUATION.sub(lambda match: match.group(1) or match.group(2), source)
+    return source.replace(';}', '}').strip()
+
+
+def minify_js(source: str) -> str:
+    """
+    移除 JS 的註解、縮排與空行
+
+    保留換行（不改變自動補分號的行為），字串、樣板字串與正規表示式的內容不會改變。
+
+    Args:
+        source (str): 原始 JS
+
+    Returns:
+        str: 縮減後的 JS
+    """
+    output: List[str] = []
+    index = 0
+    length = len(source)
+    # 目前所在的樣板字串中 ${ } 的巢狀深度
+    template_depth: List[int] = []
+    braces = 0
+    previous = ''
+
+    def emit(text: str) -> None:
+        nonlocal previous
+        output.append(text)
+        stripped = text.strip()
+        if stripped:
+            previous = stripped[-1]
+
+    while index < length:
+        char = source[index]
+        following = source[index + 1] if index + 1 < length else ''
+
+        if char == '/' and following == '/':
+            end = source.find('\n', index)
+            index = length if end < 0 else end
+            continue
+        if char == '/' and following == '*':
+            end = source.find('*/', index + 2)
+            index = length if end < 0 else end + 2
+            if output and not output[-1].endswith((' ', '\n')):
+                output.append(' ')
+            continue
+        if char in '\'"' or (char == '`') or (char == '}' and template_depth
+                                              and template_depth[-1] == braces):
+            # 字串與樣板字串原樣保留；} 結束樣板字串中的 ${ } 後繼續讀取樣板字串
+            if char == '}':
+                template_depth.pop()
+                quote = '`'
+            else:
+                quote = char
+            start = index
+            index += 1
+            while index < length:
+                current = source[index]
+                if current == '\\':
+                    index += 2
+                    continue
+                if quote == '`' and current == '$' and source.startswith('${', index):
+                    index += 2
+                    template_depth.append(braces)
+                    break
+                index += 1
+                if current == quote:
+                    break
+            emit(source[start:index])
+            continue
+        if char == '/' and _starts_regex(previous, output):
+            # 正規表示式，包含字元類別中的 /
+            end = _regex_end(source, index)
+            if end > 0:
+                emit(source[index:end])
+                index = end
+                continue
+        if char == '\n':
+            # 移除行尾空白、下一行的縮排與空行，保留一個換行
+            while output and output[-1] in (' ', '\t'):
+                output.pop()
+            if output and output[-1].endswith((' ', '\t')):
+                output[-1] = output[-1].rstrip(' \t')
+            if output and not output[-1].endswith('\n'):
+                output.append('\n')
+            index += 1
+            while index < length and source[index] in ' \t\r\n':
+                index += 1
+            continue
+        if char in ' \t\r':
+            # 連續的空白縮減為一個
+            while index + 1 < length and source[index + 1] in ' \t\r':
+                index += 1
+            if output and not output[-1].endswith((' ', '\n')):
+                output.append(' ')
+            index += 1
+            continue
+        if char == '{':
+            braces += 1
+        elif char == '}':
+            braces -= 1
+        emit(char)
+        index += 1
+
+    return ''.join(output).strip() + '\n'
+
+
+def _starts_regex(previous: str, output: List[str]) -> bool:
+    # 接在運算子、左括號或 return 等關鍵字之後的 / 是正規表示式的開頭
+    if not previous or _ends_with_keyword(output):
+        return True
+    if previous not in _REGEX_PRECEDERS:
+        return False
+    # a++ / 2 與 a-- / 2 的 / 是除號
+    return not (previous in '+-' and ''.join(output[-4:]).rstrip().endswith(previous * 2))
+
+
+def _regex_end(source: str, index: int) -> int:
+    """
+    找出從 index 開始的正規表示式結尾（包含旗標）
+
+    Args:
+        source (str): 原始 JS
+        index (int): 開頭 / 的位置
+
+    Returns:
+        int: 結尾之後的位置；在同一行內沒有結束時返回 -1，當作除號處理
+    """
+    length = len(source)
+    index += 1
+    in_class = False
+    while index < length:
+        current = source[index]
+        if current == '\\':
+            index += 2
+            continue
+        if current == '\n':
+            return -1
+        index += 1
+        if current == '[':
+            in_class = True
+        elif current == ']':
+            in_class = False
+        elif current == '/' and not in_class:
+            while index < length and source[index].isalpha():
+                index += 1
+            return index
+    return -1
+
+
+def _ends_with_keyword(output: List[str]) -> bool:
+    # return /x/ 或 typeof /x/ 之後的 / 也是正規表示式
+    word = _TRAILING_WORD.search(''.join(output[-12:]))
+    return word is not None and word.group(1) in _REGEX_KEYWORDS
+
+
+def parse_accept_encoding(header: Optional[str]) -> Dict[str, float]:
+    """
+    解析 Accept-Encoding 標頭
+
+    Args:
+        header (Optional[str]): 標頭內容
+
+    Returns:
+        Dict[str, float]: 壓縮格式與權重
+    """
+    accepted: Dict[str, float] = {}
+    for part in (header or '').split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        accepted[name] = weight
+    return accepted
+
+
+class Asset:
+    """
+    已建置的資源
+
+    此類別負責：
+    - 保存原始與壓縮後的內容、內容類型與 ETag
+    - 依 Accept-Encoding 選擇回應的版本
+    """
+
+    __slots__ = ('name', 'filename', 'content_type', 'etag', 'variants')
+
+    def __init__(self, name: str, filename: str, variants: Dict[str, bytes]) -> None:
+        """
+        初始化資源
+
+        Args:
+            name (str): 組合名稱，例如 panel.js
+            filename (str): 含內容雜湊的檔名
+            variants (Dict[str, bytes]): 壓縮格式（identity 表示未壓縮）與內容
+        """
+        self.name = name
+        self.filename = filename
+        self.content_type = CONTENT_TYPES[os.path.splitext(name)[1]]
+        self.etag = filename.split('.')[-2]
+        self.variants = variants
+
+    def negotiate(self, accept_encoding: Optional[str]) -> Tuple[str, bytes]:
+        """
+        選擇回應的壓縮格式
+
+        Args:
+            accept_encoding (Optional[str]): Accept-Encoding 標頭
+
+        Returns:
+            Tuple[str, bytes]: 壓縮格式與內容
+        """
+        accepted = parse_accept_encoding(accept_encoding)
+        wildcard = accepted.get('*', 0.0)
+        for encoding in ENCODINGS:
+            if encoding in self.variants and accepted.get(encoding, wildcard) > 0:
+                return encoding, self.variants[encoding]
+        return 'identity', self.variants['identity']
+
+
+class AssetPipeline:
+    """
+    靜態資源處理
+
+    此類別負責：
+    - 合併、縮減、加上內容雜湊並壓縮各組合
+    - 以 manifest.json 記錄原始檔案的狀態，沒有變更時直接讀取建置結果
+    - 提供頁面使用的網址與回應用的內容
+    """
+
+    def __init__(self, static_root: str, bundles: Optional[Dict[str, List[str]]] = None,
+                 output: str = 'dist', enabled: bool = True) -> None:
+        """
+        初始化靜態資源處理
+
+        Args:
+            static_root (str): static 目錄
+            bundles (Optional[Dict[str, List[str]]]): 組合名稱與原始檔案（相對於 static 目錄）
+            output (str): 建置結果的目錄（相對於 static 目錄）
+            enabled (bool): 停用時頁面直接載入原始檔案，方便除錯
+        """
+        self.static_root = os.path.abspath(static_root)
+        self.bundles = bundles or BUNDLES
+        self.output = os.path.join(self.static_root, output)
+        self.manifest_path = os.path.join(self.output, 'manifest.json')
+        self.enabled = enabled
+        self.assets: Dict[str, Asset] = {}
+        self.by_filename: Dict[str, Asset] = {}
+        if enabled:
+            try:
+                self.load() or self.build()
+            except Exception as e:
+                # 建置失敗時退回原始檔案，控制面板仍可使用
+                logger.error("建置靜態資源時發生錯誤: %s", e, exc_info=True)
+                self.enabled = False
+
+    def _sources_state(self) -> Dict[str, List]:
+        state = {}
+        for sources in self.bundles.values():
+            for source in sources:
+                stat = os.stat(os.path.join(self.static_root, source))
+                state[source] = [stat.st_size, stat.st_mtime_ns]
+        return state
+
+    def load(self) -> bool:
+        """
+        讀取上次的建置結果
+
+        Returns:
+            bool: 原始檔案沒有變更且建置結果完整時返回 True
+        """
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if (manifest.get('sources') != self._sources_state()
+                or set(manifest.get('assets', {})) != set(self.bundles)
+                or manifest.get('brotli') != (brotli is not None)):
+            return False
+
+        assets = {}
+        try:
+            for name, filename in manifest['assets'].items():
+                variants = {}
+                for encoding, suffix in (('identity', ''), *ENCODING_SUFFIXES.items()):
+                    path = os.path.join(self.output, filename + suffix)
+                    if os.path.exists(path):
+                        with open(path, 'rb') as f:
+                            variants[encoding] = f.read()
+                if 'identity' not in variants:
+                    return False
+                assets[name] = Asset(name, filename, variants)
+        except OSError:
+            return False
+        self._install(assets)
+        logger.debug("已載入靜態資源: %s", ', '.join(manifest['assets'].values()))
+        return True
+
+    def build(self) -> None:
+        """
+        重新建置所有組合並寫入 manifest.json
+        """
+        os.makedirs(self.output, exist_ok=True)
+        state = self._sources_state()
+        assets = {}
+        for name, sources in self.bundles.items():
+            parts = []
+            for source in sources:
+                with open(os.path.join(self.static_root, source), 'r', encoding='utf-8') as f:
+                    parts.append(f.read())
+            if name.endswith('.css'):
+                content = '\n'.join(minify_css(part) for part in parts)
+            else:
+                # 每個檔案以分號結尾，避免合併後與下一個檔案的開頭連在一起
+                content = ''.join(minify_js(part).rstrip().rstrip(';') + ';\n' for part in parts)
+            data = content.encode('utf-8')
+            digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+            stem, extension = os.path.splitext(name)
+            filename = f'{stem}.{digest}{extension}'
+
+            variants = {'identity': data, 'gzip': gzip.compress(data, 9, mtime=0)}
+            if brotli is not None:
+                variants['br'] = brotli.compress(data, quality=11)
+            for encoding, body in variants.items():
+                suffix = ENCODING_SUFFIXES.get(encoding, '')
+                with open(os.path.join(self.output, filename + suffix), 'wb') as f:
+                    f.write(body)
+            assets[name] = Asset(name, filename, variants)
+
+        self._remove_stale(assets)
+        manifest = {
+            'sources': state,
+            'brotli': brotli is not None,
+            'assets': {name: asset.filename for name, asset in assets.items()},
+        }
+        temporary = self.manifest_path + '.tmp'
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(temporary, self.manifest_path)
+        self._install(assets)
+        logger.info("已建置靜態資源: %s", ', '.join(manifest['assets'].values()))
+
+    def _remove_stale(self, assets: Dict[str, Asset]) -> None:
+        # 刪除舊版本的建置結果；開著舊頁面的瀏覽器已快取舊檔案
+        current = {asset.filename for asset in assets.values()}
+        for entry in os.listdir(self.output):
+            base = entry
+            for suffix in ENCODING_SUFFIXES.values():
+                if base.endswith(suffix):
+                    base = base[:-len(suffix)]
+            if base != 'manifest.json' and base not in current:
+                os.remove(os.path.join(self.output, entry))
+
+    def _install(self, assets: Dict[str, Asset]) -> None:
+        self.assets = assets
+        self.by_filename = {asset.filename: asset for asset in assets.values()}
+
+    def urls(self, name: str) -> List[str]:
+        """
+        取得頁面載入組合時使用的網址
+
+        Args:
+            name (str): 組合名稱
+
+        Returns:
+            List[str]: 建置後的網址；停用時為各原始檔案的網址
+        """
+        asset = self.assets.get(name) if self.enabled else None
+        if asset is None:
+            return [f'/static/{source}' for source in self.bundles[name]]
+        return [f'/assets/{asset.filename}']
+
+    def get(self, filename: str) -> Optional[Asset]:
+        return self.by_filename.get(filename)
+
+    def respond(self, filename: str, accept_encoding: Optional[str],
+                if_none_match: Optional[str]) -> Tuple[int, Dict[str, str], bytes]:
+        """
+        產生資源的回應，供 Flask 與非同步伺服器共用
+
+        Args:
+            filename (str): 含內容雜湊的檔名
+            accept_encoding (Optional[str]): Accept-Encoding 標頭
+            if_none_match (Optional[str]): If-None-Match 標頭
+
+        Returns:
+            Tuple[int, Dict[str, str], bytes]: 狀態碼、標頭與內容
+        """
+        asset = self.get(filename)
+        if asset is None:
+            return 404, {'Content-Type': 'text/plain; charset=utf-8'}, b'Not Found'
+        encoding, body = asset.negotiate(accept_encoding)
+        etag = f'"{asset.etag}-{encoding}"'
+        headers = {
+            'Cache-Control': ASSET_CACHE_CONTROL,
+            'Vary': 'Accept-Encoding',
+            'ETag': etag,
+            'X-Content-Type-Options': 'nosniff',
+        }
+        if if_none_match and (etag in if_none_match or if_none_match.strip() == '*'):
+            return 304, headers, b''
+        headers['Content-Type'] = asset.content_type
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return 200, headers, body
+
+
+def main():
+    pipeline = AssetPipeline(os.path.join(os.path.dirname(__file__), 'static'), enabled=False)
+    pipeline.build()
+    for name, asset in pipeline.assets.items():
+        original = sum(os.path.getsize(os.path.join(pipeline.static_root, source))
+                       for source in pipeline.bundles[name])
+        sizes = ', '.join(f'{encoding} {len(body)}' for encoding, body in asset.variants.items())
+        print(f'{asset.filename}: source {original} bytes -> {sizes}')
+
+
+if __name__ == '__main__':
+    main()
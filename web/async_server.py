@@ -0,0 +1,277 @@
+import asyncio
+import io
+import json
+import logging
+import sys
+import time
+from functools import partial
+
+from aiohttp import web
+
+from bot.core import metrics
+from bot.core.hub import CLOSED, RESYNC
+from bot.core.serializer import encode_messages
+from utils.config import FLASK_HOST, FLASK_PORT
+from .service import PanelError, PanelService
+
+# 獲取日誌記錄器
+logger = logging.getLogger(__name__)
+
+# SSE 連線閒置時發送心跳的間隔（秒）
+STREAM_KEEPALIVE_SECONDS = 15
+
+json_response = partial(web.json_response, dumps=partial(json.dumps, ensure_ascii=False))
+
+
+class AsyncPanelServer:
+    # 在機器人的事件迴圈上執行的控制面板伺服器
+    # 熱門路由直接 await Discord 呼叫，其他路由轉交給 Flask 應用處理
+    def __init__(self, flask_app, host=FLASK_HOST, port=FLASK_PORT):
+        self.flask_app = flask_app
+        self.discord_bot = flask_app.discord_bot
+        self.service = PanelService(self.discord_bot, flask_app.message_cache)
+        self.host = host
+        self.port = port
+        self.runner = None
+        self.app = self.build_app()
+        logger.info("AsyncPanelServer 初始化完成")
+
+    def build_app(self):
+        middlewares = [self.metrics_middleware] if metrics.registry.enabled else []
+        app = web.Application(middlewares=middlewares)
+        app.router.add_get('/guilds', self.get_guilds)
+        app.router.add_get('/channels/{guild_id}', self.get_channels)
+        app.router.add_get('/messages/{channel_id}', self.get_messages)
+        app.router.add_get('/stream/{channel_id}', self.stream_messages)
+        app.router.add_post('/send-message', self.send_message)
+        app.router.add_get('/send-status/{job_id}', self.get_send_status)
+        app.router.add_post('/broadcast', self.broadcast)
+        app.router.add_get('/exports/{job_id}/{channel_id}.ndjson.gz', self.download_export)
+        app.router.add_get('/assets/{filename}', self.get_asset)
+        app.router.add_static('/static', self.flask_app.app.static_folder)
+        # 其餘路由（首頁與其他 API）交給 Flask 處理
+        app.router.add_route('*', '/{tail:.*}', self.wsgi_fallback)
+        return app
+
+    @web.middleware
+    async def metrics_middleware(self, request, handler):
+        # 以路由名稱記錄處理時間；轉交給 Flask 的請求由 Flask 自己記錄
+        if handler == self.wsgi_fallback:
+            return await handler(request)
+        started = time.perf_counter()
+        try:
+            return await handler(request)
+        finally:
+            endpoint = getattr(handler, '__name__', 'unknown')
+            metrics.PANEL_REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - started)
+
+    async def start(self):
+        try:
+            logger.info("正在啟動非同步伺服器於 %s:%s", self.host, self.port)
+            self.runner = web.AppRunner(self.app, access_log=None)
+            await self.runner.setup()
+            site = web.TCPSite(self.runner, self.host, self.port)
+            await site.start()
+            logger.info("非同步伺服器已啟動")
+        except Exception as e:
+            logger.error("啟動非同步伺服器時發生錯誤: %s", e)
+            raise
+
+    async def shutdown(self):
+        if self.runner:
+            logger.info("正在關閉非同步伺服器...")
+            await self.runner.cleanup()
+            logger.info("非同步伺服器已關閉")
+
+    @staticmethod
+    def error_response(e):
+        if isinstance(e, PanelError):
+            return json_response({'error': e.message}, status=e.status)
+        logger.error("處理請求時發生錯誤: %s", e, exc_info=True)
+        return json_response({'error': str(e)}, status=500)
+
+    @staticmethod
+    def cached_json(request, payload, etag):
+        # 回傳預先序列化的 JSON，並支援 If-None-Match 條件請求
+        quoted = f'"{etag}"'
+        headers = {'ETag': quoted, 'Cache-Control': 'no-cache'}
+        if_none_match = request.headers.get('If-None-Match', '')
+        if quoted in if_none_match or if_none_match.strip() == '*':
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=payload, content_type='application/json',
+                            charset='utf-8', headers=headers)
+
+    async def get_guilds(self, request):
+        try:
+            return self.cached_json(request, *self.service.guilds_json())
+        except Exception as e:
+            return self.error_response(e)
+
+    async def get_channels(self, request):
+        try:
+            return self.cached_json(
+                request, *self.service.channels_json(request.match_info['guild_id']))
+        except Exception as e:
+            return self.error_response(e)
+
+    async def get_messages(self, request):
+        try:
+            messages = await self.service.get_messages(
+                request.match_info['channel_id'], request.query)
+            return web.Response(text=encode_messages(messages), content_type='application/json')
+        except Exception as e:
+            return self.error_response(e)
+
+    async def get_asset(self, request):
+        # 資源已在記憶體中，直接在事件迴圈上回應
+        status, headers, body = self.flask_app.routes.assets.respond(
+            request.match_info['filename'], request.headers.get('Accept-Encoding'),
+            request.headers.get('If-None-Match'))
+        return web.Response(status=status, headers=headers, body=body)
+
+    async def send_message(self, request):
+        try:
+            data = await request.json()
+            job_id = self.service.send_message(data.get('channel_id'), data.get('content'))
+            return json_response({'status': 'queued', 'job_id': job_id}, status=202)
+        except Exception as e:
+            return self.error_response(e)
+
+    async def broadcast(self, request):
+        try:
+            data = await request.json()
+            plan = self.service.plan_broadcast(data if isinstance(data, dict) else {})
+        except ValueError:
+            return json_response({'error': '請求內容不是有效的 JSON'}, status=400)
+        except Exception as e:
+            return self.error_response(e)
+
+        response = web.StreamResponse(headers={
+            'Content-Type': 'application/x-ndjson',
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
+        await response.prepare(request)
+        try:
+            async for result in self.service.broadcast(plan):
+                await response.write(
+                    (json.dumps(result, ensure_ascii=False) + '\n').encode('utf-8'))
+        except (ConnectionResetError, asyncio.CancelledError):
+            pass
+        return response
+
+    async def download_export(self, request):
+        # 匯出檔案可能很大，直接由 aiohttp 分段送出，不經由 Flask 整個讀進記憶體
+        channel_id = request.match_info['channel_id']
+        try:
+            path = self.service.export_file(request.match_info['job_id'], channel_id)
+        except Exception as e:
+            return self.error_response(e)
+        return web.FileResponse(path, headers={
+            'Content-Type': 'application/gzip',
+            'Content-Disposition': f'attachment; filename="{channel_id}.ndjson.gz"'
+        })
+
+    async def get_send_status(self, request):
+        try:
+            return json_response(self.service.get_send_status(request.match_info['job_id']))
+        except Exception as e:
+            return self.error_response(e)
+
+    async def stream_messages(self, request):
+        channel_id = request.match_info['channel_id']
+        try:
+            self.service.get_channel(channel_id)
+        except Exception as e:
+            return self.error_response(e)
+
+        response = web.StreamResponse(headers={
+            'Content-Type': 'text/event-stream',
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
+        await response.prepare(request)
+
+        hub = self.discord_bot.hub
+        subscriber = hub.subscribe(channel_id, asyncio.Queue(maxsize=hub.max_queue))
+        logger.debug("開始推送頻道 %s 的訊息", channel_id)
+        try:
+            await response.write(b'retry: 3000\n\n')
+            while True:
+                try:
+                    item = await asyncio.wait_for(subscriber.get(), STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    await response.write(b': keepalive\n\n')
+                    continue
+
+                if item is CLOSED:
+                    break
+                if item is RESYNC:
+                    await response.write(b'event: resync\ndata: {}\n\n')
+                    continue
+
+                await response.write(
+                    f"id: {item.id}\ndata: {item.panel_json()}\n\n".encode('utf-8'))
+        except (ConnectionResetError, asyncio.CancelledError):
+            pass
+        finally:
+            hub.unsubscribe(channel_id, subscriber)
+            logger.debug("停止推送頻道 %s 的訊息", channel_id)
+        return response
+
+    async def wsgi_fallback(self, request):
+        body = await request.read()
+        environ = {
+            'REQUEST_METHOD': request.method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': request.path,
+            'QUERY_STRING': request.query_string,
+            'SERVER_NAME': self.host,
+            'SERVER_PORT': str(self.port),
+            'SERVER_PROTOCOL': 'HTTP/%d.%d' % request.version,
+            'REMOTE_ADDR': request.remote or '',
+            'CONTENT_TYPE': request.headers.get('Content-Type', ''),
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': request.scheme,
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in request.headers.items():
+            key = 'HTTP_' + name.upper().replace('-', '_')
+            if key in ('HTTP_CONTENT_TYPE', 'HTTP_CONTENT_LENGTH'):
+                continue
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+
+        # Flask 是同步的，在執行緒池中執行以免阻塞事件迴圈
+        loop = asyncio.get_running_loop()
+        status, headers, payload = await loop.run_in_executor(
+            None, self.call_wsgi, environ)
+
+        response = web.Response(status=int(status.split(' ', 1)[0]), body=payload)
+        for name, value in headers:
+            if name.lower() in ('content-length', 'transfer-encoding', 'connection'):
+                continue
+            response.headers.add(name, value)
+        return response
+
+    def call_wsgi(self, environ):
+        captured = {}
+        chunks = []
+
+        def start_response(status, headers, exc_info=None):
+            captured['status'] = status
+            captured['headers'] = headers
+            return chunks.append
+
+        result = self.flask_app.app(environ, start_response)
+        try:
+            for chunk in result:
+                chunks.append(chunk)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return captured['status'], captured['headers'], b''.join(chunks)
@@ -0,0 +1,285 @@
+"""
+程序間通訊模組
+
+讓控制面板在獨立的工作程序中執行，機器人程序只透過本機 Unix socket 提供狀態：
+- 每個訊框為 4 位元組的長度（big-endian）加上 UTF-8 JSON
+- 工作程序送出請求 {id, op, args}，機器人回應 {id, result} 或 {id, error, status}
+- 機器人主動推送事件 {event, ...}：目錄變更，工作程序關注頻道的新訊息、編輯與刪除，
+  以及工作程序發出的廣播中各頻道的發送結果
+- 工作程序跟不上推送時直接中斷連線，由工作程序重新連線並重新同步
+"""
+
+import asyncio
+import json
+import logging
+import os
+import struct
+
+from bot.core.hub import CLOSED
+from bot.core.metrics import registry
+from bot.core.serializer import serialize_edit
+from .service import PanelError, PanelService
+
+# 獲取日誌記錄器
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct('>I')
+# 單一訊框的大小上限，避免錯誤的長度讓對方配置過多記憶體
+MAX_FRAME_BYTES = 16 * 1024 * 1024
+# 每個連線等待送出的訊框上限，超過時中斷連線
+MAX_PENDING_FRAMES = 4096
+
+
+def encode_frame(payload):
+    body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return _HEADER.pack(len(body)) + body
+
+
+async def read_frame(reader):
+    # 連線關閉時拋出 asyncio.IncompleteReadError
+    size, = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    if size > MAX_FRAME_BYTES:
+        raise ValueError(f'訊框過大: {size} 位元組')
+    return json.loads(await reader.readexactly(size))
+
+
+class _Forwarder:
+    # 以 MessageHub 訂閱者的介面接收頻道的新訊息，直接轉送給工作程序
+    __slots__ = ('connection',)
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def put_nowait(self, item):
+        if item is CLOSED:
+            self.connection.close()
+            return
+        self.connection.send({'event': 'message', 'message': item.to_wire()})
+
+    def get_nowait(self):
+        raise asyncio.QueueEmpty
+
+
+class _Connection:
+    # 一個工作程序的連線，訊框在背景工作中依序寫出
+    def __init__(self, writer):
+        self.writer = writer
+        self.queue = asyncio.Queue(maxsize=MAX_PENDING_FRAMES)
+        self.channels = {}
+        self.closed = False
+        self.sender = asyncio.ensure_future(self.send_loop())
+
+    def send(self, payload):
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            logger.warning("工作程序跟不上推送，中斷連線讓其重新同步")
+            self.close()
+
+    async def send_loop(self):
+        try:
+            while True:
+                payload = await self.queue.get()
+                self.writer.write(encode_frame(payload))
+                await self.writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.sender.cancel()
+        self.writer.close()
+
+
+class IPCServer:
+    # 在機器人的事件迴圈上執行，讓控制面板工作程序讀取狀態與發送訊息
+    def __init__(self, discord_bot, path):
+        self.discord_bot = discord_bot
+        self.path = path
+        self.service = PanelService(discord_bot, discord_bot.message_cache)
+        self.connections = set()
+        self.server = None
+        self.loop = None
+        self.directory_pending = False
+
+    @property
+    def bot(self):
+        return self.discord_bot.bot
+
+    async def start(self):
+        try:
+            logger.info("正在啟動程序間通訊伺服器於 %s", self.path)
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # 移除上次未正常關閉留下的 socket 檔案
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            self.server = await asyncio.start_unix_server(self.handle_connection, path=self.path)
+            # 只允許同一個使用者的程序連線
+            os.chmod(self.path, 0o600)
+            self.bot.add_listener(self.on_raw_message_edit, 'on_raw_message_edit')
+            self.bot.add_listener(self.on_raw_message_delete, 'on_raw_message_delete')
+            self.bot.add_listener(self.on_raw_bulk_message_delete, 'on_raw_bulk_message_delete')
+            self.loop = asyncio.get_running_loop()
+            self.discord_bot.directory.subscribe(self.on_directory_changed)
+            logger.info("程序間通訊伺服器已啟動")
+        except Exception as e:
+            logger.error("啟動程序間通訊伺服器時發生錯誤: %s", e)
+            raise
+
+    async def shutdown(self):
+        if self.server:
+            logger.info("正在關閉程序間通訊伺服器...")
+            self.discord_bot.directory.unsubscribe(self.on_directory_changed)
+            self.server.close()
+            for connection in list(self.connections):
+                connection.close()
+            await self.server.wait_closed()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            logger.info("程序間通訊伺服器已關閉")
+
+    async def handle_connection(self, reader, writer):
+        connection = _Connection(writer)
+        self.connections.add(connection)
+        logger.info("控制面板工作程序已連線，目前 %s 個", len(self.connections))
+        directory = self.discord_bot.directory
+        if directory.built:
+            connection.send({'event': 'directory', 'directory': directory.export()})
+        try:
+            while not connection.closed:
+                request = await read_frame(reader)
+                # 每個請求各自執行，補齊快取等較慢的請求不會阻塞其他請求
+                asyncio.ensure_future(self.handle_request(connection, request))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            logger.error("讀取工作程序請求時發生錯誤: %s", e, exc_info=True)
+        finally:
+            for channel_id, forwarder in connection.channels.items():
+                self.discord_bot.hub.unsubscribe(channel_id, forwarder)
+            connection.close()
+            self.connections.discard(connection)
+            logger.info("控制面板工作程序已斷線，目前 %s 個", len(self.connections))
+
+    async def handle_request(self, connection, request):
+        request_id = request.get('id')
+        try:
+            handler = getattr(self, 'op_' + str(request.get('op')), None)
+            if handler is None:
+                raise PanelError(f"未知的操作: {request.get('op')}", 400)
+            result = handler(connection, **(request.get('args') or {}))
+            if asyncio.iscoroutine(result):
+                result = await result
+            connection.send({'id': request_id, 'result': result})
+        except PanelError as e:
+            connection.send({'id': request_id, 'error': e.message, 'status': e.status})
+        except (TypeError, ValueError) as e:
+            connection.send({'id': request_id, 'error': str(e), 'status': 400})
+        except Exception as e:
+            logger.error("處理工作程序請求時發生錯誤: %s", e, exc_info=True)
+            connection.send({'id': request_id, 'error': str(e), 'status': 500})
+
+    def on_directory_changed(self):
+        # 目錄可能在其他執行緒更新；同一輪事件迴圈中的多次變更只推送一次
+        if self.directory_pending:
+            return
+        self.directory_pending = True
+        self.loop.call_soon_threadsafe(self.push_directory)
+
+    def push_directory(self):
+        # 推送完整目錄給所有工作程序
+        self.directory_pending = False
+        directory = self.discord_bot.directory
+        if directory.built:
+            self.broadcast(None, {'event': 'directory', 'directory': directory.export()})
+
+    def broadcast(self, channel_id, payload):
+        # channel_id 為 None 時推送給所有工作程序，否則只推送給關注該頻道的工作程序
+        for connection in list(self.connections):
+            if channel_id is None or channel_id in connection.channels:
+                connection.send(payload)
+
+    async def on_raw_message_edit(self, payload):
+        channel_id = str(payload.channel_id)
+        if not any(channel_id in connection.channels for connection in self.connections):
+            return
+        fields = serialize_edit(payload.data)
+        if 'attachments' in fields:
+            fields['attachments'] = [list(attachment) for attachment in fields['attachments']]
+        if fields:
+            self.broadcast(channel_id, {'event': 'edit', 'channel_id': channel_id,
+                                        'message_id': str(payload.message_id), 'fields': fields})
+
+    async def on_raw_message_delete(self, payload):
+        channel_id = str(payload.channel_id)
+        self.broadcast(channel_id, {'event': 'delete', 'channel_id': channel_id,
+                                    'message_ids': [str(payload.message_id)]})
+
+    async def on_raw_bulk_message_delete(self, payload):
+        channel_id = str(payload.channel_id)
+        self.broadcast(channel_id, {'event': 'delete', 'channel_id': channel_id,
+                                    'message_ids': [str(message_id)
+                                                    for message_id in payload.message_ids]})
+
+    async def op_watch(self, connection, channel_id):
+        # 開始推送頻道的新訊息，並返回目前快取中的訊息作為複本的起點
+        channel = self.service.get_channel(channel_id)
+        if channel_id not in connection.channels:
+            forwarder = _Forwarder(connection)
+            connection.channels[channel_id] = forwarder
+            self.discord_bot.hub.subscribe(channel_id, forwarder)
+        if self.service.needs_backfill(channel):
+            await self.service.backfill(channel)
+        return [message.to_wire() for message in self.service.read_messages(channel_id)]
+
+    async def op_messages(self, connection, channel_id, params):
+        messages = await self.service.get_messages(channel_id, params)
+        return [message.to_wire() for message in messages]
+
+    def op_send(self, connection, channel_id, content):
+        return self.service.send_message(channel_id, content)
+
+    def op_broadcast(self, connection, broadcast_id, channel_ids, content):
+        # 各頻道的結果以 broadcast 事件推送給發出請求的工作程序
+        self.service.submit_broadcast(channel_ids, content, lambda result: connection.send(
+            {'event': 'broadcast', 'broadcast_id': broadcast_id, 'result': result}))
+
+    def op_exports(self, connection):
+        return self.service.list_exports()
+
+    def op_export(self, connection, job_id):
+        return self.service.get_export(job_id)
+
+    async def op_export_start(self, connection, data):
+        return await self.service.create_export(data)
+
+    async def op_export_cancel(self, connection, job_id):
+        return await self.service.stop_export(job_id)
+
+    def op_send_status(self, connection, job_id):
+        return self.service.get_send_status(job_id)
+
+    def op_shards(self, connection):
+        return self.service.get_shards()
+
+    def op_persistence(self, connection):
+        return self.service.get_persistence_stats()
+
+    def op_log_level(self, connection, level=None, logger_name=None, sample_every=None):
+        if level is None:
+            return self.service.get_log_level()
+        return self.service.set_log_level(level, logger_name, sample_every)
+
+    def op_metrics(self, connection):
+        # 只輸出機器人程序的指標，控制面板的指標由工作程序自己輸出
+        if not registry.enabled:
+            raise PanelError('效能指標未啟用', 404)
+        return registry.render(('discord_',))
@@ -0,0 +1,351 @@
+"""
+附件與頭像的快取代理
+
+控制面板的圖片不直接從 Discord CDN 載入，而是經過 /media：
+- 原始檔與縮圖保存在磁碟上，總大小超過上限時淘汰最久未使用的檔案
+- 附件以附件 ID 為鍵，CDN 網址中會過期的簽章參數不影響快取
+- 內容不會改變，回應帶有強 ETag 與 immutable 快取標頭，條件請求不需要讀取磁碟
+- 縮圖需要 Pillow；未安裝時一律返回原始檔
+- 只允許連線到設定的主機，且不跟隨重新導向，避免被用來存取內部網路
+"""
+
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from io import BytesIO
+from typing import Dict, Iterable, Optional, Tuple
+from urllib.parse import urlsplit
+
+from bot.core.metrics import MEDIA_REQUESTS
+from .service import PanelError
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# 獲取日誌記錄器
+logger = logging.getLogger(__name__)
+
+# 可用的縮圖寬度，請求的寬度會向上取到其中之一，限制每個檔案的縮圖數量
+THUMBNAIL_WIDTHS = (64, 160, 320, 640)
+# 單一檔案的大小上限
+MAX_OBJECT_BYTES = 25 * 1024 * 1024
+# 向 CDN 讀取的逾時秒數
+FETCH_TIMEOUT = 10
+
+MEDIA_HIT = MEDIA_REQUESTS.labels('hit')
+MEDIA_MISS = MEDIA_REQUESTS.labels('miss')
+MEDIA_NOT_MODIFIED = MEDIA_REQUESTS.labels('not_modified')
+
+# 只代理瀏覽器可以直接顯示的點陣圖，不包含可能夾帶指令碼的 SVG
+IMAGE_TYPES = {
+    'image/png': '.png',
+    'image/jpeg': '.jpg',
+    'image/gif': '.gif',
+    'image/webp': '.webp',
+    'image/avif': '.avif',
+}
+_CONTENT_TYPES = {extension: content_type for content_type, extension in IMAGE_TYPES.items()}
+
+# https://cdn.discordapp.com/attachments/<頻道 ID>/<附件 ID>/<檔名>
+_ATTACHMENT_PATH = re.compile(r'^/(?:ephemeral-)?attachments/\d+/(\d+)/')
+_FILENAME = re.compile(r'^([0-9a-z]+)-(orig|\d+)(\.[0-9a-z]+)?$')
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # 重新導向可能指向不在允許清單中的主機，直接視為錯誤
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        raise urllib.error.HTTPError(req.full_url, code, '不允許重新導向', headers, fp)
+
+
+def parse_allowed_hosts(value: str) -> Tuple[str, ...]:
+    """
+    解析允許的來源
+
+    Args:
+        value (str): 以逗號分隔的主機（只允許 https）或完整來源，例如 http://127.0.0.1:8000
+
+    Returns:
+        Tuple[str, ...]: 正規化後的來源（scheme://host[:port]）
+    """
+    origins = []
+    for entry in value.split(','):
+        entry = entry.strip().lower().rstrip('/')
+        if entry:
+            origins.append(entry if '://' in entry else 'https://' + entry)
+    return tuple(origins)
+
+
+class MediaCache:
+    """
+    磁碟上的媒體快取
+
+    此類別負責：
+    - 檢查來源網址並換算快取鍵
+    - 從 CDN 讀取原始檔並產生縮圖
+    - 依最近使用順序淘汰檔案，讓總大小不超過上限
+    """
+
+    def __init__(self, root: str, max_bytes: int, allowed_hosts: Iterable[str],
+                 opener: Optional[urllib.request.OpenerDirector] = None) -> None:
+        """
+        初始化媒體快取
+
+        Args:
+            root (str): 快取目錄
+            max_bytes (int): 快取的總大小上限
+            allowed_hosts (Iterable[str]): 允許的來源（parse_allowed_hosts 的結果）
+            opener (Optional[urllib.request.OpenerDirector]): 自訂的 HTTP opener
+        """
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.allowed_hosts = tuple(allowed_hosts)
+        self.opener = opener or urllib.request.build_opener(_NoRedirect)
+        self._files: "OrderedDict[Tuple[str, str], Tuple[str, int]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._fetching: Dict[str, threading.Lock] = {}
+        os.makedirs(root, exist_ok=True)
+        self._scan()
+
+    def _scan(self) -> None:
+        """
+        以磁碟上既有的檔案重建索引，依修改時間排列
+        """
+        entries = []
+        for entry in os.scandir(self.root):
+            match = _FILENAME.match(entry.name)
+            if match and entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_mtime, match.group(1), match.group(2),
+                                entry.name, stat.st_size))
+        for _, key, variant, name, size in sorted(entries):
+            self._files[(key, variant)] = (name, size)
+            self._size += size
+        logger.debug("媒體快取共 %s 個檔案，%s 位元組", len(self._files), self._size)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'files': len(self._files), 'bytes': self._size, 'max_bytes': self.max_bytes}
+
+    def check_url(self, url: str) -> str:
+        """
+        檢查來源網址並返回快取鍵
+
+        Args:
+            url (str): CDN 網址
+
+        Returns:
+            str: 快取鍵；附件為附件 ID，其他檔案（例如頭像）為路徑的雜湊值
+
+        Raises:
+            PanelError: 網址無效或不在允許清單中
+        """
+        try:
+            parts = urlsplit(url)
+        except ValueError:
+            raise PanelError('無效的 url', 400)
+        origin = f'{parts.scheme}://{parts.netloc}'.lower()
+        if parts.scheme not in ('http', 'https') or origin not in self.allowed_hosts:
+            raise PanelError('不允許的媒體來源', 403)
+        match = _ATTACHMENT_PATH.match(parts.path)
+        if match:
+            return match.group(1)
+        return hashlib.blake2b(f'{origin}{parts.path}'.encode('utf-8'),
+                               digest_size=10).hexdigest()
+
+    @staticmethod
+    def parse_width(value: Optional[str]) -> Optional[int]:
+        if value in (None, ''):
+            return None
+        try:
+            width = int(value)
+        except ValueError:
+            raise PanelError('無效的 w', 400)
+        if width < 1:
+            raise PanelError('無效的 w', 400)
+        return width
+
+    @staticmethod
+    def variant_for(width: Optional[int]) -> str:
+        if not width or Image is None:
+            return 'orig'
+        for size in THUMBNAIL_WIDTHS:
+            if width <= size:
+                return str(size)
+        return 'orig'
+
+    @staticmethod
+    def etag(key: str, variant: str) -> str:
+        # 同一個鍵的內容不會改變，ETag 不需要讀取檔案
+        return f'{key}-{variant}'
+
+    def _lookup(self, key: str, variant: str) -> Optional[str]:
+        with self._lock:
+            entry = self._files.get((key, variant))
+            if entry is None:
+                return None
+            self._files.move_to_end((key, variant))
+        return os.path.join(self.root, entry[0])
+
+    def get(self, url: str, width: Optional[int] = None) -> Tuple[str, str]:
+        """
+        取得快取中的檔案，不存在時從 CDN 讀取
+
+        Args:
+            url (str): CDN 網址
+            width (Optional[int]): 縮圖寬度，未指定時返回原始檔
+
+        Returns:
+            Tuple[str, str]: 檔案路徑與 MIME 類型
+        """
+        key = self.check_url(url)
+        variant = self.variant_for(width)
+        path = self._lookup(key, variant)
+        if path is not None and os.path.exists(path):
+            MEDIA_HIT.inc()
+            return path, self._content_type(path)
+
+        MEDIA_MISS.inc()
+        # 同一個鍵同時只讀取一次，其他請求等待結果
+        with self._lock:
+            fetching = self._fetching.setdefault(key, threading.Lock())
+        with fetching:
+            try:
+                path = self._lookup(key, variant)
+                if path is None or not os.path.exists(path):
+                    path = self._produce(url, key, variant)
+            finally:
+                with self._lock:
+                    self._fetching.pop(key, None)
+        return path, self._content_type(path)
+
+    @staticmethod
+    def _content_type(path: str) -> str:
+        return _CONTENT_TYPES.get(os.path.splitext(path)[1], 'application/octet-stream')
+
+    def _produce(self, url: str, key: str, variant: str) -> str:
+        original = self._lookup(key, 'orig')
+        if original is None or not os.path.exists(original):
+            body, content_type = self.fetch(url)
+            original = self._store(key, 'orig', IMAGE_TYPES[content_type], body)
+        if variant == 'orig':
+            return original
+        thumbnail = self._thumbnail(original, int(variant))
+        if thumbnail is None:
+            # 原圖已經夠小時，縮圖直接指向原始檔，之後不再重新解碼
+            with self._lock:
+                self._files[(key, variant)] = (os.path.basename(original), 0)
+            return original
+        body, extension = thumbnail
+        return self._store(key, variant, extension, body)
+
+    def fetch(self, url: str) -> Tuple[bytes, str]:
+        """
+        從 CDN 讀取檔案
+
+        Args:
+            url (str): 已檢查過的 CDN 網址
+
+        Returns:
+            Tuple[bytes, str]: 檔案內容與 MIME 類型
+        """
+        request = urllib.request.Request(url, headers={'User-Agent': 'discord-bot-panel'})
+        try:
+            with self.opener.open(request, timeout=FETCH_TIMEOUT) as response:
+                length = response.headers.get('Content-Length')
+                if length and int(length) > MAX_OBJECT_BYTES:
+                    raise PanelError('媒體檔案過大', 413)
+                content_type = response.headers.get_content_type()
+                if content_type not in IMAGE_TYPES:
+                    raise PanelError('不支援的媒體類型', 415)
+                body = response.read(MAX_OBJECT_BYTES + 1)
+        except urllib.error.HTTPError as e:
+            logger.warning("讀取媒體失敗 %s: HTTP %s", url, e.code)
+            raise PanelError('無法讀取媒體', 404 if e.code in (403, 404) else 502)
+        except (urllib.error.URLError, OSError) as e:
+            logger.warning("讀取媒體失敗 %s: %s", url, e)
+            raise PanelError('無法讀取媒體', 502)
+        if len(body) > MAX_OBJECT_BYTES:
+            raise PanelError('媒體檔案過大', 413)
+        return body, content_type
+
+    @staticmethod
+    def _thumbnail(path: str, width: int) -> Optional[Tuple[bytes, str]]:
+        """
+        產生縮圖，原圖已經夠小或無法解碼時返回 None
+
+        Args:
+            path (str): 原始檔路徑
+            width (int): 縮圖寬度
+
+        Returns:
+            Optional[Tuple[bytes, str]]: 縮圖內容與副檔名
+        """
+        try:
+            with Image.open(path) as image:
+                if image.width <= width:
+                    return None
+                image.thumbnail((width, width * 4))
+                has_alpha = image.mode in ('RGBA', 'LA', 'P')
+                image = image.convert('RGBA' if has_alpha else 'RGB')
+                output = BytesIO()
+                if has_alpha:
+                    image.save(output, 'PNG', optimize=True)
+                    return output.getvalue(), '.png'
+                image.save(output, 'JPEG', quality=80, optimize=True)
+                return output.getvalue(), '.jpg'
+        except Exception as e:
+            logger.warning("無法產生縮圖 %s: %s", path, e)
+            return None
+
+    def _store(self, key: str, variant: str, extension: str, body: bytes) -> str:
+        """
+        寫入檔案並淘汰最久未使用的檔案
+
+        Args:
+            key (str): 快取鍵
+            variant (str): orig 或縮圖寬度
+            extension (str): 副檔名，用來決定回應的 MIME 類型
+            body (bytes): 檔案內容
+
+        Returns:
+            str: 檔案路徑
+        """
+        name = f'{key}-{variant}{extension}'
+        path = os.path.join(self.root, name)
+        # 先寫入暫存檔再改名，其他程序不會讀到寫到一半的檔案
+        descriptor, temporary = tempfile.mkstemp(dir=self.root, prefix='.tmp-')
+        with os.fdopen(descriptor, 'wb') as file:
+            file.write(body)
+        os.replace(temporary, path)
+
+        evicted = []
+        with self._lock:
+            previous = self._files.pop((key, variant), None)
+            if previous is not None:
+                self._size -= previous[1]
+            self._files[(key, variant)] = (name, len(body))
+            self._size += len(body)
+            while self._size > self.max_bytes and len(self._files) > 1:
+                (_, old_variant), (old_name, old_size) = self._files.popitem(last=False)
+                self._size -= old_size
+                # 指向原始檔的縮圖項目只移除索引
+                if _FILENAME.match(old_name).group(2) == old_variant:
+                    evicted.append(old_name)
+        for old_name in evicted:
+            try:
+                os.unlink(os.path.join(self.root, old_name))
+            except FileNotFoundError:
+                pass
+        if evicted:
+            logger.debug("媒體快取已淘汰 %s 個檔案", len(evicted))
+        return path
@@ -1,252 +1,331 @@
-from flask import jsonify, render_template, request
+from flask import Response, g, jsonify, render_template, request, send_file
+import json
 import logging
-import asyncio
-from datetime import datetime
-import traceback
-import discord
+import queue
+import time
+
+from bot.core import metrics
+from bot.core.hub import CLOSED, RESYNC
+from bot.core.serializer import encode_messages
+from utils.config import ASSET_PIPELINE, MEDIA_ALLOWED_HOSTS, MEDIA_CACHE_DIR, MEDIA_CACHE_MAX_MB
+from .assets import AssetPipeline
+from .media import MEDIA_NOT_MODIFIED, MediaCache, parse_allowed_hosts
+from .service import PanelError, PanelService
 
 # 獲取日誌記錄器
 logger = logging.getLogger(__name__)
 
+# SSE 連線閒置時發送心跳的間隔（秒）
+STREAM_KEEPALIVE_SECONDS = 15
+# 媒體內容不會改變，瀏覽器可以快取一年且不需要重新驗證
+MEDIA_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
 
 class Routes:
-    def __init__(self, app, discord_bot, message_cache):
+    def __init__(self, app, discord_bot, message_cache, service=None):
         self.app = app
         self.discord_bot = discord_bot
         self.message_cache = message_cache
+        # 多程序部署時由工作程序傳入透過 IPC 存取機器人的服務
+        self.service = service or PanelService(discord_bot, message_cache)
+        self.media = MediaCache(MEDIA_CACHE_DIR, MEDIA_CACHE_MAX_MB * 1024 * 1024,
+                                parse_allowed_hosts(MEDIA_ALLOWED_HOSTS))
+        # 合併並預先壓縮的 JS 與 CSS，頁面以含內容雜湊的網址載入
+        self.assets = AssetPipeline(app.static_folder, enabled=ASSET_PIPELINE)
+        if metrics.registry.enabled:
+            self.setup_metrics()
         self.setup_routes()
         logger.info("Routes 初始化完成")
 
+    @staticmethod
+    def cached_json(payload, etag):
+        # 回傳預先序列化的 JSON，並支援 If-None-Match 條件請求
+        response = Response(payload, mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
+
+    def setup_metrics(self):
+        # 記錄每個端點的處理時間（串流回應只計算到開始串流為止）
+        @self.app.before_request
+        def start_timer():
+            g.request_started = time.perf_counter()
+
+        @self.app.after_request
+        def observe_request(response):
+            started = g.pop('request_started', None)
+            if started is not None:
+                metrics.PANEL_REQUEST_SECONDS.labels(request.endpoint or 'unknown').observe(
+                    time.perf_counter() - started)
+            return response
+
     def setup_routes(self):
+        @self.app.context_processor
+        def asset_urls():
+            return {'asset_urls': self.assets.urls}
+
         @self.app.route('/')
         def index():
             logger.debug("訪問首頁")
-            return render_template('index.html')
+            # 頁面每次都重新驗證，部署新版本後立即載入新的資源網址
+            response = Response(render_template('index.html'), mimetype='text/html')
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+
+        @self.app.route('/assets/<filename>')
+        def get_asset(filename):
+            status, headers, body = self.assets.respond(
+                filename, request.headers.get('Accept-Encoding'),
+                request.headers.get('If-None-Match'))
+            return Response(body, status=status, headers=headers)
 
         @self.app.route('/guilds')
         def get_guilds():
             try:
                 logger.debug("開始獲取伺服器列表")
-                guilds = []
-                for guild in self.discord_bot.bot.guilds:
-                    guilds.append({
-                        'id': str(guild.id),
-                        'name': guild.name,
-                        'icon': str(guild.icon.url) if guild.icon else None
-                    })
-                logger.debug(f"成功獲取 {len(guilds)} 個伺服器")
-                return jsonify(guilds)
+                return self.cached_json(*self.service.guilds_json())
             except Exception as e:
                 logger.error(
-                    f"獲取伺服器列表時發生錯誤: {str(e)}\n{traceback.format_exc()}")
+                    "獲取伺服器列表時發生錯誤: %s", e, exc_info=True)
                 return jsonify({'error': str(e)}), 500
 
         @self.app.route('/channels/<guild_id>')
         def get_channels(guild_id):
             try:
-                logger.debug(f"開始獲取伺服器 {guild_id} 的頻道列表")
-                guild = self.discord_bot.bot.get_guild(int(guild_id))
-                if not guild:
-                    logger.warning(f"找不到指定的伺服器: {guild_id}")
-                    return jsonify({'error': '找不到指定的伺服器'}), 404
-
-                channels = []
-                for channel in guild.text_channels:
-                    channels.append({
-                        'id': str(channel.id),
-                        'name': channel.name
-                    })
-                logger.debug(f"成功獲取 {len(channels)} 個頻道")
-                return jsonify(channels)
+                logger.debug("開始獲取伺服器 %s 的頻道列表", guild_id)
+                return self.cached_json(*self.service.channels_json(guild_id))
+            except PanelError as e:
+                return jsonify({'error': e.message}), e.status
             except Exception as e:
                 logger.error(
-                    f"獲取頻道列表時發生錯誤: {str(e)}\n{traceback.format_exc()}")
+                    "獲取頻道列表時發生錯誤: %s", e, exc_info=True)
                 return jsonify({'error': str(e)}), 500
 
         @self.app.route('/messages/<channel_id>')
         def get_messages(channel_id):
             try:
-                logger.debug(f"開始獲取頻道 {channel_id} 的訊息")
-                channel = self.discord_bot.bot.get_channel(int(channel_id))
-                if not channel:
-                    logger.warning(f"找不到指定的頻道: {channel_id}")
-                    return jsonify({'error': '找不到指定的頻道'}), 404
-
-                # 獲取時間戳參數
-                after_timestamp = request.args.get('after')
-                if after_timestamp:
-                    try:
-                        after_timestamp = datetime.fromisoformat(
-                            after_timestamp.replace('Z', '+00:00'))
-                        logger.debug(f"請求 {after_timestamp} 之後的訊息")
-                    except ValueError as e:
-                        logger.error(
-                            f"時間戳格式錯誤: {str(e)}\n{traceback.format_exc()}")
-                        return jsonify({'error': '無效的時間戳格式'}), 400
-
-                # 如果快取中沒有，則從 Discord 獲取
-                if channel_id not in self.message_cache:
-                    logger.debug(f"頻道 {channel_id} 的快取為空，從 Discord 獲取訊息")
-                    messages = []
-
-                    async def fetch_messages():
-                        message: discord.Message
-                        messages = []
-
-                        async for message in channel.history(limit=10):
-                            logger.debug(
-                                f"獲取到的訊息: {message.content},time:{message.created_at.isoformat()}")
-
-                            message_data = {
-                                'id': str(message.id),
-                                'content': message.content,
-                                'author': {
-                                    'id': str(message.author.id),
-                                    'name': message.author.name,
-                                    'avatar': str(message.author.avatar.url) if message.author.avatar else None
-                                },
-                                'timestamp': message.created_at.isoformat(),
-                                'attachments': []
-                            }
-                            for attachment in message.attachments:
-                                if attachment.content_type and attachment.content_type.startswith('image/'):
-                                    message_data['attachments'].append({
-                                        'url': attachment.url,
-                                        'filename': attachment.filename
-                                    })
-
-                            messages.append(message_data)
-                        messages.reverse()
-                        return messages
-
-                    messages = asyncio.run_coroutine_threadsafe(
-                        fetch_messages(),
-                        self.discord_bot.bot.loop
-                    ).result()
-
-                    # 更新快取
-                    self.message_cache[channel_id] = messages
-                    logger.debug(f"成功獲取並快取 {len(messages)} 條訊息")
-
-                # 從快取中獲取訊息
-                cached_messages = self.message_cache[channel_id]
-                logger.debug(f"快取中有 {len(cached_messages)} 條訊息")
-                for message in cached_messages:
-                    logger.debug(
-                        f"快取中的訊息: {message['content']},time:{message['timestamp']}")
-                if after_timestamp:
-                    # 只返回時間戳之後的新訊息
-                    new_messages = []
-                    skipped_count = 0
-                    for msg in cached_messages:
-                        msg_timestamp = datetime.fromisoformat(
-                            msg['timestamp'].replace('Z', '+00:00'))
-                        if msg_timestamp > after_timestamp:
-                            new_messages.append(msg)
-                        else:
-                            skipped_count += 1
-
-                    logger.debug(
-                        f"從快取中過濾出 {len(new_messages)} 條新訊息，跳過 {skipped_count} 條舊訊息")
-
-                    # 如果沒有新訊息，則重新從 Discord 獲取
-                    if not new_messages:
-                        logger.debug("快取中沒有新訊息，重新從 Discord 獲取")
-                        messages = []
-
-                        async def fetch_new_messages():
-                            # 使用訊息 ID 來獲取新訊息
-                            last_message = cached_messages[-1] if cached_messages else None
-                            if last_message:
-                                last_message_id = int(last_message['id'])
-                                logger.debug(
-                                    f"使用最後一條訊息的 ID {last_message_id} 來獲取新訊息")
-                                async for message in channel.history(limit=50, after=discord.Object(id=last_message_id), oldest_first=True):
-                                    message_data = {
-                                        'id': str(message.id),
-                                        'content': message.content,
-                                        'author': {
-                                            'id': str(message.author.id),
-                                            'name': message.author.name,
-                                            'avatar': str(message.author.avatar.url) if message.author.avatar else None
-                                        },
-                                        'timestamp': message.created_at.isoformat(),
-                                        'attachments': []
-                                    }
-
-                                    for attachment in message.attachments:
-                                        if attachment.content_type and attachment.content_type.startswith('image/'):
-                                            message_data['attachments'].append({
-                                                'url': attachment.url,
-                                                'filename': attachment.filename
-                                            })
-
-                                    messages.append(message_data)
-                                    logger.debug(
-                                        f"獲取到新訊息: ID={message.id}, 時間={message.created_at.isoformat()}")
-                            return messages
-
-                        new_messages = asyncio.run_coroutine_threadsafe(
-                            fetch_new_messages(),
-                            self.discord_bot.bot.loop
-                        ).result()
-
-                        # 更新快取
-                        if new_messages:
-                            # 檢查並移除重複的訊息
-                            existing_ids = {msg['id']
-                                            for msg in cached_messages}
-                            unique_new_messages = [
-                                msg for msg in new_messages if msg['id'] not in existing_ids]
-
-                            if unique_new_messages:
-                                self.message_cache[channel_id] = unique_new_messages + \
-                                    cached_messages
-                                logger.debug(
-                                    f"成功獲取並快取 {len(unique_new_messages)} 條新訊息")
-                                # 確保新訊息按時間順序排序
-                                new_messages = sorted(
-                                    unique_new_messages, key=lambda x: x['timestamp'])
-                            else:
-                                logger.debug("沒有新的不重複訊息需要快取")
-                                new_messages = []
-
-                    # 返回新訊息，並確保包含最新的時間戳
-                    if new_messages:
-                        last_message = new_messages[-1]
-                        logger.debug(
-                            f"最後一條訊息的時間戳: {last_message['timestamp']}")
-                    else:
-                        logger.debug("沒有新訊息可返回")
-                    return jsonify(new_messages)
-                else:
-                    logger.debug(f"返回所有 {len(cached_messages)} 條快取訊息")
-                    return jsonify(cached_messages)
+                logger.debug("開始獲取頻道 %s 的訊息", channel_id)
+                messages = self.service.get_messages_threaded(channel_id, request.args)
+                return Response(encode_messages(messages), mimetype='application/json')
+            except PanelError as e:
+                return jsonify({'error': e.message}), e.status
+            except Exception as e:
+                logger.error("獲取訊息時發生錯誤: %s", e, exc_info=True)
+                return jsonify({'error': str(e)}), 500
+
+        @self.app.route('/stream/<channel_id>')
+        def stream_messages(channel_id):
+            try:
+                self.service.get_channel(channel_id)
+            except PanelError as e:
+                return jsonify({'error': e.message}), e.status
+
+            hub = self.discord_bot.hub
+            subscriber = hub.subscribe(channel_id)
+            logger.debug("開始推送頻道 %s 的訊息", channel_id)
+
+            def generate():
+                try:
+                    yield 'retry: 3000\n\n'
+                    while True:
+                        try:
+                            item = subscriber.get(timeout=STREAM_KEEPALIVE_SECONDS)
+                        except queue.Empty:
+                            # 心跳，同時用來偵測已斷線的用戶端
+                            yield ': keepalive\n\n'
+                            continue
+
+                        if item is CLOSED:
+                            return
+                        if item is RESYNC:
+                            yield 'event: resync\ndata: {}\n\n'
+                            continue
+
+                        yield f"id: {item.id}\ndata: {item.panel_json()}\n\n"
+                finally:
+                    hub.unsubscribe(channel_id, subscriber)
+                    logger.debug("停止推送頻道 %s 的訊息", channel_id)
+
+            return Response(generate(), mimetype='text/event-stream', headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'
+            })
 
+        @self.app.route('/media')
+        def get_media():
+            # 代理 Discord CDN 的附件與頭像，w 指定縮圖寬度
+            try:
+                url = request.args.get('url', '')
+                width = self.media.parse_width(request.args.get('w'))
+                key = self.media.check_url(url)
+                etag = self.media.etag(key, self.media.variant_for(width))
+                headers = {'Cache-Control': MEDIA_CACHE_CONTROL,
+                           'X-Content-Type-Options': 'nosniff'}
+                # 條件請求只比對 ETag，不需要讀取快取檔案
+                if etag in request.if_none_match:
+                    MEDIA_NOT_MODIFIED.inc()
+                    return Response(status=304, headers={**headers, 'ETag': f'"{etag}"'})
+                path, content_type = self.media.get(url, width)
+                response = send_file(path, mimetype=content_type, etag=etag, conditional=False)
+                response.headers.update(headers)
+                return response
+            except PanelError as e:
+                return jsonify({'error': e.message}), e.status
             except Exception as e:
-                logger.error(f"獲取訊息時發生錯誤: {str(e)}\n{traceback.format_exc()}")
+                logger.error("讀取媒體時發生錯誤: %s", e, exc_info=True)
                 return jsonify({'error': str(e)}), 500
 
         @self.app.route('/send-message', methods=['POST'])
         def send_message():
             try:
                 data = request.get_json()
-                channel_id = data.get('channel_id')
-                content = data.get('content')
+                job_id = self.service.send_message(
+                    data.get('channel_id'), data.get('content'))
+                return jsonify({'status': 'queued', 'job_id': job_id}), 202
+            except PanelError as e:
+                return jsonify({'error': e.message}), e.status
+            except Exception as e:
+                logger.error("發送訊息時發生錯誤: %s", e, exc_info=True)
+                return jsonify({'error': str(e)}), 500
 
-                if not channel_id or not content:
-                    logger.warning("缺少必要的參數")
-                    return jsonify({'error': '缺少必要的參數'}), 400
+        @self.app.route('/broadcast', methods=['POST'])
+        def broadcast():
+            # 每個頻道的結果在完成時以一行 JSON 串流回傳，最後一行是摘要
+            try:
+                plan = self.service.plan_broadcast(request.get_json(silent=True) or {})
+            except PanelError as e:
+                return jsonify({'error': e.message}), e.status
+            except Exception as e:
+                logger.error("準備廣播時發生錯誤: %s", e, exc_info=True)
+                return jsonify({'error': str(e)}), 500
+
+            def generate():
+                for result in self.service.broadcast_threaded(plan):
+                    yield json.dumps(result, ensure_ascii=False) + '\n'
+
+            return Response(generate(), mimetype='application/x-ndjson', headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'
+            })
+
+        @self.app.route('/exports', methods=['GET', 'POST'])
+        def exports():
+            try:
+                if request.method == 'POST':
+                    job = self.service.start_export(request.get_json(silent=True) or {})
+                    return jsonify(job), 202
+                return jsonify({'jobs': self.service.list_exports()})
+            except PanelError as e:
+                return jsonify({'error': e.message}), e.status
+            except Exception as e:
+                logger.error("處理匯出工作時發生錯誤: %s", e, exc_info=True)
+                return jsonify({'error': str(e)}), 500
+
+        @self.app.route('/exports/<job_id>')
+        def get_export(job_id):
+            try:
+                return jsonify(self.service.get_export(job_id))
+            except PanelError as e:
+                return jsonify({'error': e.message}), e.status
+            except Exception as e:
+                logger.error("查詢匯出工作時發生錯誤: %s", e, exc_info=True)
+                return jsonify({'error': str(e)}), 500
+
+        @self.app.route('/exports/<job_id>/cancel', methods=['POST'])
+        def cancel_export(job_id):
+            try:
+                return jsonify(self.service.cancel_export(job_id))
+            except PanelError as e:
+                return jsonify({'error': e.message}), e.status
+            except Exception as e:
+                logger.error("取消匯出工作時發生錯誤: %s", e, exc_info=True)
+                return jsonify({'error': str(e)}), 500
+
+        @self.app.route('/exports/<job_id>/<channel_id>.ndjson.gz')
+        def download_export(job_id, channel_id):
+            try:
+                path = self.service.export_file(job_id, channel_id)
+                return send_file(path, mimetype='application/gzip', as_attachment=True,
+                                 download_name=f'{channel_id}.ndjson.gz')
+            except PanelError as e:
+                return jsonify({'error': e.message}), e.status
+            except Exception as e:
+                logger.error("下載匯出檔案時發生錯誤: %s", e, exc_info=True)
+                return jsonify({'error': str(e)}), 500
+
+        @self.app.route('/send-status/<job_id>')
+        def get_send_status(job_id):
+            try:
+                return jsonify(self.service.get_send_status(job_id))
+            except PanelError as e:
+                return jsonify({'error': e.message}), e.status
+            except Exception as e:
+                logger.error(
+                    "查詢發送狀態時發生錯誤: %s", e, exc_info=True)
+                return jsonify({'error': str(e)}), 500
+
+        @self.app.route('/archive/search')
+        def search_archive():
+            try:
+                return jsonify(self.service.archive_search(request.args))
+            except PanelError as e:
+                return jsonify({'error': e.message}), e.status
+            except Exception as e:
+                logger.error("搜尋封存訊息時發生錯誤: %s", e, exc_info=True)
+                return jsonify({'error': str(e)}), 500
+
+        @self.app.route('/archive/<channel_id>')
+        def get_archive_range(channel_id):
+            try:
+                return jsonify(self.service.archive_range(channel_id, request.args))
+            except PanelError as e:
+                return jsonify({'error': e.message}), e.status
+            except Exception as e:
+                logger.error("讀取封存訊息時發生錯誤: %s", e, exc_info=True)
+                return jsonify({'error': str(e)}), 500
 
-                logger.debug(f"準備發送訊息到頻道 {channel_id}")
-                channel = self.discord_bot.bot.get_channel(int(channel_id))
-                if not channel:
-                    logger.warning(f"找不到指定的頻道: {channel_id}")
-                    return jsonify({'error': '找不到指定的頻道'}), 404
+        @self.app.route('/persistence')
+        def get_persistence_stats():
+            try:
+                return jsonify(self.service.get_persistence_stats())
+            except PanelError as e:
+                return jsonify({'error': e.message}), e.status
+            except Exception as e:
+                logger.error(
+                    "獲取寫入佇列統計時發生錯誤: %s", e, exc_info=True)
+                return jsonify({'error': str(e)}), 500
 
-                self.discord_bot.bot.loop.create_task(channel.send(content))
-                logger.debug("訊息已發送")
-                return jsonify({'status': 'success'})
+        @self.app.route('/shards')
+        def get_shards():
+            try:
+                return jsonify(self.service.get_shards())
+            except PanelError as e:
+                return jsonify({'error': e.message}), e.status
             except Exception as e:
-                logger.error(f"發送訊息時發生錯誤: {str(e)}\n{traceback.format_exc()}")
+                logger.error("獲取分片狀態時發生錯誤: %s", e, exc_info=True)
                 return jsonify({'error': str(e)}), 500
+
+        @self.app.route('/metrics')
+        def get_metrics():
+            if not metrics.registry.enabled:
+                return jsonify({'error': '效能指標未啟用'}), 404
+            try:
+                return Response(self.service.render_metrics(), content_type=metrics.CONTENT_TYPE)
+            except PanelError as e:
+                return jsonify({'error': e.message}), e.status
+
+        @self.app.route('/log-level', methods=['GET', 'POST'])
+        def log_level():
+            # 查詢或在執行時調整日誌級別
+            try:
+                if request.method == 'GET':
+                    return jsonify(self.service.get_log_level())
+                data = request.get_json() or {}
+                if not data.get('level'):
+                    return jsonify({'error': '缺少必要的參數'}), 400
+                return jsonify(self.service.set_log_level(
+                    data['level'], data.get('logger'), data.get('sample_every')))
+            except PanelError as e:
+                return jsonify({'error': e.message}), e.status
+            except (TypeError, ValueError) as e:
+                return jsonify({'error': str(e)}), 400
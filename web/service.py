@@ -0,0 +1,581 @@
+import asyncio
+import logging
+import os
+import queue
+import time
+from datetime import datetime
+
+import discord
+
+from bot.core.dispatcher import MAX_MESSAGE_LENGTH
+from bot.core.export import output_path
+from bot.core.logger import get_log_level, set_log_level
+from bot.core.metrics import (BRIDGE_SECONDS, CACHE_GAP, CACHE_HIT, CACHE_MISS,
+                              REST_REQUESTS, registry)
+from bot.core.serializer import serialize_message
+from utils.config import BRIDGE_TIMEOUT, EXPORT_DIR
+
+# 獲取日誌記錄器
+logger = logging.getLogger(__name__)
+
+# 補齊快取時讀取歷史訊息的 REST 請求計數
+REST_HISTORY = REST_REQUESTS.labels('history')
+
+# 補齊快取缺漏時每次讀取的訊息數
+BACKFILL_PAGE_SIZE = 50
+
+# 封存查詢每頁的預設與最大訊息數
+ARCHIVE_PAGE_SIZE = 50
+ARCHIVE_MAX_PAGE_SIZE = 500
+
+# 一次廣播最多的頻道數
+BROADCAST_MAX_CHANNELS = 500
+# 廣播超過此秒數沒有任何結果時停止等待，尚未完成的頻道計入摘要的 pending
+BROADCAST_IDLE_TIMEOUT = 60
+
+# 一個匯出工作最多的頻道數
+EXPORT_MAX_CHANNELS = 1000
+
+
+class PanelError(Exception):
+    # 帶有 HTTP 狀態碼的控制面板錯誤
+    def __init__(self, message, status=500):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+class BroadcastProgress:
+    # 統計廣播的結果，串流結束時輸出摘要
+    def __init__(self, total):
+        self.started = time.monotonic()
+        self.total = total
+        self.pending = total
+        self.counts = {'sent': 0, 'failed': 0, 'retrying': 0}
+
+    def record(self, result):
+        self.counts[result['status']] += 1
+        if result['status'] != 'retrying':
+            self.pending -= 1
+        return result
+
+    def summary(self):
+        return {
+            'done': True,
+            'total': self.total,
+            'sent': self.counts['sent'],
+            'failed': self.counts['failed'],
+            'retried': self.counts['retrying'],
+            'pending': self.pending,
+            'elapsed_ms': round((time.monotonic() - self.started) * 1000, 1)
+        }
+
+
+class PanelService:
+    # 控制面板的共用邏輯，同時供 Flask 路由與非同步伺服器使用
+    def __init__(self, discord_bot, message_cache):
+        self.discord_bot = discord_bot
+        self.message_cache = message_cache
+
+    @property
+    def bot(self):
+        return self.discord_bot.bot
+
+    @property
+    def loop(self):
+        return self.bot.loop
+
+    def run(self, coro):
+        # 從其他執行緒在機器人的事件迴圈上執行協程，並設置逾時
+        operation = getattr(coro, '__name__', 'coroutine')
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            with BRIDGE_SECONDS.labels(operation).time():
+                return future.result(timeout=BRIDGE_TIMEOUT)
+        except TimeoutError:
+            future.cancel()
+            raise PanelError('Discord 回應逾時', 504)
+
+    @property
+    def directory(self):
+        # 目錄由 on_ready 建立；尚未建立時（例如連線就緒前）先以目前狀態建立
+        directory = self.discord_bot.directory
+        if not directory.built:
+            directory.rebuild(self.bot.guilds)
+        return directory
+
+    def get_guilds(self):
+        return self.directory.guilds()
+
+    def guilds_json(self):
+        return self.directory.guilds_json()
+
+    def get_channels(self, guild_id):
+        channels = self.directory.channels(guild_id)
+        if channels is None:
+            logger.warning("找不到指定的伺服器: %s", guild_id)
+            raise PanelError('找不到指定的伺服器', 404)
+        return channels
+
+    def channels_json(self, guild_id):
+        encoded = self.directory.channels_json(guild_id)
+        if encoded is None:
+            logger.warning("找不到指定的伺服器: %s", guild_id)
+            raise PanelError('找不到指定的伺服器', 404)
+        return encoded
+
+    def get_channel(self, channel_id):
+        channel = self.bot.get_channel(int(channel_id))
+        if not channel:
+            logger.warning("找不到指定的頻道: %s", channel_id)
+            raise PanelError('找不到指定的頻道', 404)
+        return channel
+
+    def find_channel(self, channel_id):
+        # 連線就緒前，從啟動快照還原的頻道返回 None，只從快取讀取
+        channel = self.bot.get_channel(int(channel_id))
+        if (channel is None and self.message_cache.is_warm(channel_id)
+                and self.directory.has_channel(channel_id)):
+            return None
+        return channel or self.get_channel(channel_id)
+
+    def parse_cursor(self, params):
+        # 解析 after_id / before_id / limit；舊版的 after 時間戳只在此換算一次為 snowflake
+        after_id = self.parse_snowflake(params.get('after_id'), 'after_id')
+        before_id = self.parse_snowflake(params.get('before_id'), 'before_id')
+        if after_id is None and params.get('after'):
+            after = params.get('after').strip().replace(' ', '+')
+            after_id = self.parse_time_bound(after, 'after', high=True)
+        # 往回翻頁預設一頁；往後讀取新訊息時預設返回快取中所有較新的訊息
+        default = ARCHIVE_PAGE_SIZE if before_id is not None else None
+        limit = self.parse_limit(params.get('limit'), default)
+        return after_id, before_id, limit
+
+    def needs_backfill(self, channel):
+        channel_id = str(channel.id)
+        # 冷啟動：頻道不在快取中
+        if not self.message_cache.is_warm(channel_id):
+            CACHE_MISS.inc()
+            return True
+        # 比較頻道最後一條訊息的 ID 與快取已涵蓋的 ID，偵測缺漏；
+        # last_message_id 在最新的訊息被刪除後不會倒退，涵蓋範圍包含已刪除的訊息
+        covered_id = self.message_cache.covered_id(channel_id)
+        last_message_id = channel.last_message_id
+        if last_message_id and (covered_id is None or last_message_id > covered_id):
+            CACHE_GAP.inc()
+            return True
+        CACHE_HIT.inc()
+        return False
+
+    @property
+    def flights(self):
+        return self.discord_bot.history_requests
+
+    def backfill_key(self, channel):
+        # 同一頻道、相同快取狀態的補齊請求共用一次 REST 請求
+        return (channel.id, 'backfill', self.message_cache.covered_id(str(channel.id)))
+
+    async def backfill(self, channel):
+        # 只在冷啟動或偵測到缺漏時透過 REST 補齊快取，相同的請求合併為一次
+        return await self.flights.do(self.backfill_key(channel),
+                                     lambda: self._fetch_backfill(channel))
+
+    async def _fetch_backfill(self, channel):
+        channel_id = str(channel.id)
+        message: discord.Message
+        messages = []
+        REST_HISTORY.inc()
+        # 補齊完成後，請求開始時的最後訊息 ID 之前都已涵蓋（之間被刪除的訊息不會再被視為缺漏）
+        last_message_id = channel.last_message_id
+
+        if not self.message_cache.is_warm(channel_id):
+            logger.debug("頻道 %s 的快取為空，從 Discord 獲取訊息", channel_id)
+            async for message in channel.history(limit=10):
+                messages.append(serialize_message(message))
+            messages.reverse()
+        else:
+            newest_id = self.message_cache.newest_id(channel_id)
+            logger.debug("頻道 %s 的快取有缺漏 (最新 ID %s)，從 Discord 補齊", channel_id, newest_id)
+            after = discord.Object(id=newest_id) if newest_id else None
+            async for message in channel.history(limit=BACKFILL_PAGE_SIZE, after=after,
+                                                 oldest_first=True):
+                messages.append(serialize_message(message))
+            if len(messages) >= BACKFILL_PAGE_SIZE:
+                # 缺漏超過一頁（例如從較舊的快照還原），改為讀取最新的訊息並取代快取，不留下空洞
+                logger.debug("頻道 %s 的缺漏超過 %s 條，重新載入最新的訊息",
+                             channel_id, BACKFILL_PAGE_SIZE)
+                messages = []
+                async for message in channel.history(limit=BACKFILL_PAGE_SIZE):
+                    messages.append(serialize_message(message))
+                messages.reverse()
+                self.message_cache.replace(channel_id, messages)
+                self.message_cache.cover(channel_id, last_message_id)
+                return len(messages)
+
+        self.message_cache.fill(channel_id, messages)
+        self.message_cache.cover(channel_id, last_message_id)
+        logger.debug("成功獲取並快取 %s 條訊息", len(messages))
+        return len(messages)
+
+    def read_messages(self, channel_id, after_id=None, before_id=None, limit=None):
+        messages = self.message_cache.get(
+            channel_id, after_id=after_id, before_id=before_id, limit=limit) or []
+        logger.debug("從快取讀取頻道 %s 的 %s 條訊息 (after_id=%s, before_id=%s)",
+                     channel_id, len(messages), after_id, before_id)
+        return messages
+
+    def older_cursor(self, messages, after_id, before_id, limit):
+        # 往回翻頁超出快取範圍時，返回向 Discord 讀取剩餘訊息的游標；不需要時返回 None
+        if before_id is None or after_id is not None or len(messages) >= limit:
+            return None
+        return messages[0].id if messages else before_id
+
+    def newer_gap(self, channel_id, after_id, before_id):
+        # after_id 早於快取中最舊的訊息時，兩者之間的訊息不在快取中，需要向 Discord 往後讀取
+        if after_id is None or before_id is not None:
+            return False
+        oldest_id = self.message_cache.oldest_id(channel_id)
+        return oldest_id is not None and after_id < oldest_id
+
+    @staticmethod
+    def newer_key(channel, after_id, limit):
+        return (channel.id, 'after', after_id, limit)
+
+    async def fetch_newer(self, channel, after_id, limit):
+        # 快取以外的較新訊息直接從 Discord 由舊到新讀取，不放入快取
+        limit = limit or ARCHIVE_PAGE_SIZE
+        return await self.flights.do(self.newer_key(channel, after_id, limit),
+                                     lambda: self._fetch_newer(channel, after_id, limit))
+
+    async def _fetch_newer(self, channel, after_id, limit):
+        message: discord.Message
+        messages = []
+        REST_HISTORY.inc()
+        async for message in channel.history(limit=limit, after=discord.Object(id=after_id),
+                                             oldest_first=True):
+            messages.append(serialize_message(message))
+        return messages
+
+    @staticmethod
+    def older_key(channel, before_id, limit):
+        return (channel.id, 'before', before_id, limit)
+
+    async def fetch_older(self, channel, before_id, limit):
+        # 快取只保存最新的訊息，更舊的訊息直接從 Discord 讀取，不放入快取
+        return await self.flights.do(self.older_key(channel, before_id, limit),
+                                     lambda: self._fetch_older(channel, before_id, limit))
+
+    async def _fetch_older(self, channel, before_id, limit):
+        message: discord.Message
+        messages = []
+        REST_HISTORY.inc()
+        async for message in channel.history(limit=limit, before=discord.Object(id=before_id)):
+            messages.append(serialize_message(message))
+        messages.reverse()
+        return messages
+
+    async def get_messages(self, channel_id, params):
+        # 供事件迴圈上的伺服器直接 await
+        channel = self.find_channel(channel_id)
+        after_id, before_id, limit = self.parse_cursor(params)
+        if channel is None:
+            return self.read_messages(channel_id, after_id, before_id, limit)
+        if self.needs_backfill(channel):
+            await self.backfill(channel)
+        if self.newer_gap(channel_id, after_id, before_id):
+            return await self.fetch_newer(channel, after_id, limit)
+        messages = self.read_messages(channel_id, after_id, before_id, limit)
+        cursor = self.older_cursor(messages, after_id, before_id, limit)
+        if cursor is not None:
+            messages = await self.fetch_older(channel, cursor, limit - len(messages)) + messages
+        return messages
+
+    def get_messages_threaded(self, channel_id, params):
+        # 供 Flask 執行緒使用，只有補齊快取或讀取更舊的訊息時才跨執行緒等待
+        channel = self.find_channel(channel_id)
+        after_id, before_id, limit = self.parse_cursor(params)
+        if channel is None:
+            return self.read_messages(channel_id, after_id, before_id, limit)
+        # 近期得到空結果的請求直接略過，不需要跨執行緒等待
+        if self.needs_backfill(channel) and not self.flights.cached(self.backfill_key(channel))[0]:
+            self.run(self.backfill(channel))
+        if self.newer_gap(channel_id, after_id, before_id):
+            hit, newer = self.flights.cached(
+                self.newer_key(channel, after_id, limit or ARCHIVE_PAGE_SIZE))
+            return newer if hit else self.run(self.fetch_newer(channel, after_id, limit))
+        messages = self.read_messages(channel_id, after_id, before_id, limit)
+        cursor = self.older_cursor(messages, after_id, before_id, limit)
+        if cursor is not None:
+            remaining = limit - len(messages)
+            hit, older = self.flights.cached(self.older_key(channel, cursor, remaining))
+            if not hit:
+                older = self.run(self.fetch_older(channel, cursor, remaining))
+            messages = older + messages
+        return messages
+
+    def get_shards(self):
+        return self.discord_bot.shards.snapshot()
+
+    def get_persistence_stats(self):
+        return self.discord_bot.get_persistence_stats()
+
+    @staticmethod
+    def get_log_level():
+        return get_log_level()
+
+    @staticmethod
+    def set_log_level(level, name=None, sample_every=None):
+        return set_log_level(level, name, sample_every)
+
+    @staticmethod
+    def render_metrics():
+        return registry.render()
+
+    def send_message(self, channel_id, content):
+        if not channel_id or not content:
+            logger.warning("缺少必要的參數")
+            raise PanelError('缺少必要的參數', 400)
+
+        logger.debug("準備發送訊息到頻道 %s", channel_id)
+        self.get_channel(channel_id)
+        # 放入發送佇列，由機器人的事件迴圈依速率限制發送；長度由發送佇列檢查
+        try:
+            job_id = self.discord_bot.dispatcher.submit(channel_id, content)
+        except ValueError as e:
+            raise PanelError(str(e), 400)
+        logger.debug("訊息已排入發送佇列: %s", job_id)
+        return job_id
+
+    def get_send_status(self, job_id):
+        job = self.discord_bot.dispatcher.get_job(job_id)
+        if job is None:
+            raise PanelError('找不到指定的發送工作', 404)
+        return job
+
+    def channel_exists(self, channel_id):
+        try:
+            return self.bot.get_channel(int(channel_id)) is not None
+        except ValueError:
+            return False
+
+    def resolve_targets(self, data, limit):
+        # 目標為 channel_ids 列表，或以 guild_id 選擇伺服器的所有文字頻道（可用 exclude 排除）
+        channel_ids = data.get('channel_ids')
+        guild_id = data.get('guild_id')
+        if channel_ids:
+            if not isinstance(channel_ids, list):
+                raise PanelError('channel_ids 必須是列表', 400)
+            targets = [str(channel_id) for channel_id in channel_ids]
+        elif guild_id:
+            targets = [channel['id'] for channel in self.get_channels(str(guild_id))]
+        else:
+            raise PanelError('需要指定 channel_ids 或 guild_id', 400)
+
+        exclude = {str(channel_id) for channel_id in data.get('exclude') or ()}
+        targets = [channel_id for channel_id in dict.fromkeys(targets)
+                   if channel_id not in exclude]
+        if not targets:
+            raise PanelError('沒有指定任何頻道', 400)
+        if len(targets) > limit:
+            raise PanelError(f'一次最多指定 {limit} 個頻道', 400)
+        return targets
+
+    def plan_broadcast(self, data):
+        # 解析廣播請求，返回 (訊息內容, 要發送的頻道, 找不到的頻道)
+        content = data.get('content')
+        if not isinstance(content, str) or not content.strip():
+            raise PanelError('缺少必要的參數', 400)
+        if len(content) > MAX_MESSAGE_LENGTH:
+            raise PanelError(f'訊息內容超過 {MAX_MESSAGE_LENGTH} 字元', 400)
+
+        targets = self.resolve_targets(data, BROADCAST_MAX_CHANNELS)
+        known, missing = [], []
+        for channel_id in targets:
+            (known if self.channel_exists(channel_id) else missing).append(channel_id)
+        logger.info("廣播訊息到 %s 個頻道（%s 個找不到）", len(known), len(missing))
+        return content, known, missing
+
+    def submit_broadcast(self, channel_ids, content, put):
+        # put 在事件迴圈上以每次狀態變更的結果呼叫，返回結束廣播時傳給 finish_broadcast 的值
+        self.discord_bot.dispatcher.submit_many(
+            channel_ids, content, lambda job: put(job.to_dict()))
+
+    def finish_broadcast(self, handle):
+        pass
+
+    @staticmethod
+    def failed_results(progress, channel_ids, error):
+        for channel_id in channel_ids:
+            yield progress.record({'channel_id': channel_id, 'status': 'failed', 'error': error})
+
+    def broadcast_threaded(self, plan):
+        # 在 Flask 執行緒中依完成順序產生各頻道的結果，最後是摘要
+        content, channel_ids, missing = plan
+        progress = BroadcastProgress(len(channel_ids) + len(missing))
+        yield from self.failed_results(progress, missing, '找不到指定的頻道')
+        if channel_ids:
+            results = queue.Queue()
+            try:
+                handle = self.submit_broadcast(channel_ids, content, results.put)
+            except PanelError as e:
+                yield from self.failed_results(progress, channel_ids, e.message)
+                yield progress.summary()
+                return
+            try:
+                while progress.pending:
+                    try:
+                        result = results.get(timeout=BROADCAST_IDLE_TIMEOUT)
+                    except queue.Empty:
+                        logger.warning("廣播等待逾時，%s 個頻道尚未完成", progress.pending)
+                        break
+                    yield progress.record(result)
+            finally:
+                self.finish_broadcast(handle)
+        yield progress.summary()
+
+    async def broadcast(self, plan):
+        # 在機器人的事件迴圈上依完成順序產生各頻道的結果，最後是摘要
+        content, channel_ids, missing = plan
+        progress = BroadcastProgress(len(channel_ids) + len(missing))
+        for result in self.failed_results(progress, missing, '找不到指定的頻道'):
+            yield result
+        if channel_ids:
+            results = asyncio.Queue()
+            self.submit_broadcast(channel_ids, content, results.put_nowait)
+            while progress.pending:
+                try:
+                    result = await asyncio.wait_for(results.get(), BROADCAST_IDLE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    logger.warning("廣播等待逾時，%s 個頻道尚未完成", progress.pending)
+                    break
+                yield progress.record(result)
+        yield progress.summary()
+
+    @property
+    def exporter(self):
+        return self.discord_bot.exporter
+
+    def list_exports(self):
+        return [job.to_dict() for job in self.exporter.jobs()]
+
+    def get_export(self, job_id):
+        job = self.exporter.get(job_id)
+        if job is None:
+            raise PanelError('找不到指定的匯出工作', 404)
+        return job.to_dict(detail=True)
+
+    async def create_export(self, data):
+        # 在機器人的事件迴圈上建立匯出工作，目標的指定方式與廣播相同
+        targets = self.resolve_targets(data, EXPORT_MAX_CHANNELS)
+        missing = [channel_id for channel_id in targets if not self.channel_exists(channel_id)]
+        if missing:
+            raise PanelError(f"找不到指定的頻道: {', '.join(missing[:5])}", 404)
+        job = await self.exporter.start(targets)
+        return job.to_dict()
+
+    def start_export(self, data):
+        return self.run(self.create_export(data))
+
+    async def stop_export(self, job_id):
+        job = await self.exporter.cancel(job_id)
+        if job is None:
+            raise PanelError('找不到指定的匯出工作', 404)
+        return job.to_dict()
+
+    def cancel_export(self, job_id):
+        return self.run(self.stop_export(job_id))
+
+    def export_file(self, job_id, channel_id):
+        # 只提供已匯出完成的頻道，未完成的檔案結尾可能是寫到一半的資料
+        try:
+            path = output_path(EXPORT_DIR, job_id, channel_id)
+        except ValueError:
+            raise PanelError('找不到指定的匯出檔案', 404)
+        job = self.get_export(job_id)
+        progress = next((progress for progress in job['channel_progress']
+                         if progress['channel_id'] == channel_id), None)
+        if progress is None or not os.path.exists(path):
+            raise PanelError('找不到指定的匯出檔案', 404)
+        if not progress['done']:
+            raise PanelError('頻道尚未匯出完成', 409)
+        return path
+
+    @staticmethod
+    def parse_snowflake(value, name):
+        if value in (None, ''):
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            raise PanelError(f'無效的 {name}', 400)
+
+    @staticmethod
+    def parse_time_bound(value, name, high):
+        # 將 ISO 時間轉換為 snowflake，查詢時直接使用主鍵範圍
+        if not value:
+            return None
+        try:
+            moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            raise PanelError(f'無效的 {name}', 400)
+        return discord.utils.time_snowflake(moment, high=high)
+
+    @staticmethod
+    def parse_limit(value, default=ARCHIVE_PAGE_SIZE):
+        if value in (None, ''):
+            return default
+        try:
+            limit = int(value)
+        except ValueError:
+            raise PanelError('無效的 limit', 400)
+        return max(1, min(limit, ARCHIVE_MAX_PAGE_SIZE))
+
+    @property
+    def archive(self):
+        archive = getattr(self.discord_bot, 'archive', None)
+        if archive is None:
+            raise PanelError('訊息封存未啟用', 404)
+        return archive
+
+    def archive_search(self, params):
+        # 以全文索引搜尋封存的訊息，由新到舊分頁
+        text = (params.get('q') or '').strip()
+        if not text:
+            raise PanelError('缺少必要的參數', 400)
+        limit = self.parse_limit(params.get('limit'))
+        messages, has_more = self.archive.search(
+            text,
+            guild_id=self.parse_snowflake(params.get('guild_id'), 'guild_id'),
+            channel_id=self.parse_snowflake(params.get('channel_id'), 'channel_id'),
+            author_id=self.parse_snowflake(params.get('author_id'), 'author_id'),
+            before_id=self.parse_snowflake(params.get('before_id'), 'before_id'),
+            limit=limit)
+        return {
+            'messages': messages,
+            'has_more': has_more,
+            'next': {'before_id': messages[-1]['id']} if has_more else None,
+        }
+
+    def archive_range(self, channel_id, params):
+        # 依 ID 或時間範圍讀取頻道的封存訊息
+        channel = self.parse_snowflake(channel_id, 'channel_id')
+        after_id = self.parse_snowflake(params.get('after_id'), 'after_id')
+        before_id = self.parse_snowflake(params.get('before_id'), 'before_id')
+        start = self.parse_time_bound(params.get('start'), 'start', high=False)
+        end = self.parse_time_bound(params.get('end'), 'end', high=True)
+        limit = self.parse_limit(params.get('limit'))
+
+        # 有起點而沒有 before_id 游標時由舊到新讀取，否則由新到舊
+        forward = (after_id is not None or start is not None) and before_id is None
+        if start is not None:
+            after_id = max(after_id or 0, start - 1)
+        if end is not None:
+            before_id = min(before_id, end + 1) if before_id is not None else end + 1
+
+        messages, has_more = self.archive.range(
+            channel, after_id=after_id, before_id=before_id, limit=limit, forward=forward)
+        next_page = None
+        if has_more and messages:
+            next_page = ({'after_id': messages[-1]['id']} if forward
+                         else {'before_id': messages[0]['id']})
+        return {'messages': messages, 'has_more': has_more, 'next': next_page}
@@ -3,8 +3,14 @@ class EventHandler {
     constructor() {
         this.currentGuildId = null;
         this.currentChannelId = null;
-        this.lastMessageTimestamp = null;
+        this.lastMessageId = null;
+        this.oldestMessageId = null;
+        this.hasOlderMessages = true;
+        this.loadingOlder = false;
+        this.loadingNewer = false;
         this.isFirstLoad = true;
+        this.eventSource = null;
+        this.pollTimer = null;
         this.initializeElements();
         this.setupEventListeners();
     }
@@ -14,6 +20,9 @@ class EventHandler {
         console.debug('初始化事件處理器');
         await this.setupGuildSelector();
         this.setupMessageRefresh();
+        this.setupLogLevel();
+        this.setupShardView();
+        this.setupExportView();
     }
 
     initializeElements() {
@@ -24,6 +33,13 @@ class EventHandler {
         this.messageInput = document.getElementById('message-input');
         this.sendButton = document.getElementById('send-button');
         this.refreshButton = document.getElementById('refresh-button');
+        this.logLevelSelector = document.getElementById('log-level-selector');
+        this.shardPanel = document.getElementById('shard-panel');
+        this.shardRows = document.getElementById('shard-rows');
+        this.exportPanel = document.getElementById('export-panel');
+        this.exportRows = document.getElementById('export-rows');
+        this.exportChannelButton = document.getElementById('export-channel-btn');
+        this.exportGuildButton = document.getElementById('export-guild-btn');
 
         // 檢查必要的元素是否存在
         if (!this.messageContainer) {
@@ -45,9 +61,10 @@ class EventHandler {
         if (this.channelSelector) {
             this.channelSelector.addEventListener('change', () => {
                 this.currentChannelId = this.channelSelector.value;
-                this.lastMessageTimestamp = null; // 重置時間戳
+                this.resetCursors(); // 重置游標
                 this.isFirstLoad = true; // 重置首次載入標記
                 this.updateMessages();
+                this.openStream(this.currentChannelId);
             });
         }
 
@@ -59,16 +76,52 @@ class EventHandler {
             });
         }
 
+        // 訊息列表只渲染可視範圍附近的訊息；捲動超出已載入的範圍時向伺服器載入
+        if (this.messageContainer) {
+            MessageManager.attach(this.messageContainer, {
+                createElement: message => this.createMessageElement(message),
+                onReachTop: () => this.loadOlderMessages(),
+                onReachBottom: () => this.loadNewerMessages()
+            });
+        }
+
         // 設置重新整理按鈕事件（如果按鈕存在）
         if (this.refreshButton) {
             this.refreshButton.addEventListener('click', () => {
-                this.lastMessageTimestamp = null; // 重置時間戳
+                this.resetCursors(); // 重置游標
                 this.isFirstLoad = true; // 重置首次載入標記
                 this.updateMessages();
             });
         }
     }
 
+    // 比較兩個訊息 ID；ID 超過 Number 的精度，以字串長度與字典序比較
+    static compareIds(a, b) {
+        return MessageManager.compareIds(a, b);
+    }
+
+    // 重置訊息游標
+    resetCursors() {
+        this.lastMessageId = null;
+        this.oldestMessageId = null;
+        this.hasOlderMessages = true;
+    }
+
+    // 記錄收到的最新訊息 ID 與目前保存的最舊訊息 ID
+    trackCursors(messages) {
+        messages.forEach(message => {
+            if (!this.lastMessageId || EventHandler.compareIds(message.id, this.lastMessageId) > 0) {
+                this.lastMessageId = message.id;
+            }
+        });
+        // 最舊的訊息因超過保存上限被移除時，之後可以再往回載入
+        const oldest = MessageManager.oldestId();
+        if (oldest && this.oldestMessageId && EventHandler.compareIds(oldest, this.oldestMessageId) > 0) {
+            this.hasOlderMessages = true;
+        }
+        this.oldestMessageId = oldest;
+    }
+
     // 設置伺服器選擇器
     async setupGuildSelector() {
         if (!this.guildSelector) {
@@ -150,9 +203,10 @@ class EventHandler {
                 
                 // 重置狀態並更新訊息
                 this.isFirstLoad = true;
-                this.lastMessageTimestamp = null;
+                this.resetCursors();
                 console.log(`[DEBUG] 開始更新訊息...`);
                 await this.updateMessages();
+                this.openStream(firstChannelId);
             }
             
             console.log(`[DEBUG] 頻道列表更新完成`);
@@ -178,11 +232,10 @@ class EventHandler {
             console.debug(`正在更新頻道 ${this.currentChannelId} 的訊息`);
             let url = `/messages/${this.currentChannelId}`;
             
-            // 如果不是第一次載入，添加時間戳參數
-            if (!this.isFirstLoad && this.lastMessageTimestamp) {
-                const timestamp = new Date(this.lastMessageTimestamp).toISOString();
-                url += `?after=${encodeURIComponent(timestamp)}`;
-                console.debug(`請求時間戳之後的訊息: ${timestamp}`);
+            // 如果不是第一次載入，只請求最新訊息 ID 之後的訊息
+            if (!this.isFirstLoad && this.lastMessageId) {
+                url += `?after_id=${this.lastMessageId}`;
+                console.debug(`請求訊息 ${this.lastMessageId} 之後的訊息`);
             }
             
             const response = await fetch(url);
@@ -195,27 +248,141 @@ class EventHandler {
             console.debug(`收到 ${messages.length} 條訊息`);
 
             if (messages.length > 0) {
-                // 如果是第一次載入，清空訊息容器
+                // 如果是第一次載入，清空訊息列表
                 if (this.isFirstLoad) {
-                    this.messageContainer.innerHTML = '';
+                    MessageManager.reset();
                     this.isFirstLoad = false;
                 }
 
-                // 添加新訊息
-                messages.forEach(message => {
-                    const messageElement = this.createMessageElement(message);
-                    this.messageContainer.appendChild(messageElement);
-                });
+                this.appendMessages(messages);
+            }
+        } catch (error) {
+            console.error('更新訊息時發生錯誤:', error);
+        }
+    }
+
+    // 添加訊息到列表，略過已顯示的訊息；停在底部時會自動捲動
+    appendMessages(messages) {
+        const added = MessageManager.add(messages);
+        if (added.length === 0) {
+            return;
+        }
 
-                // 更新最後一條訊息的時間戳
-                this.lastMessageTimestamp = messages[messages.length - 1].timestamp;
-                console.debug(`更新最後一條訊息的時間戳: ${this.lastMessageTimestamp}`);
+        // 更新最新與最舊訊息的 ID
+        this.trackCursors(added);
+        console.debug(`更新最後一條訊息的 ID: ${this.lastMessageId}`);
+    }
 
-                // 滾動到底部
-                this.messageContainer.scrollTop = this.messageContainer.scrollHeight;
+    // 往回載入最舊訊息之前的一頁訊息
+    async loadOlderMessages(pageSize = 50) {
+        if (this.loadingOlder || !this.hasOlderMessages || !this.oldestMessageId || !this.currentChannelId) {
+            return;
+        }
+
+        const channelId = this.currentChannelId;
+        this.loadingOlder = true;
+        try {
+            const response = await fetch(
+                `/messages/${channelId}?before_id=${this.oldestMessageId}&limit=${pageSize}`);
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
             }
+            const messages = await response.json();
+            if (channelId !== this.currentChannelId) {
+                return;
+            }
+            if (messages.length < pageSize) {
+                this.hasOlderMessages = false;
+            }
+
+            // 插入到最前面，渲染視窗移到這些訊息並維持目前的捲動位置
+            MessageManager.prepend(messages);
+            this.trackCursors(messages);
+            console.debug(`載入 ${messages.length} 條較舊的訊息`);
         } catch (error) {
-            console.error('更新訊息時發生錯誤:', error);
+            console.error('載入較舊的訊息時發生錯誤:', error);
+        } finally {
+            this.loadingOlder = false;
+        }
+    }
+
+    // 較新的訊息因超過保存上限被移除後，捲動到底部時依序重新載入
+    async loadNewerMessages(pageSize = 50) {
+        const newestId = MessageManager.newestId();
+        if (this.loadingNewer || !newestId || !this.currentChannelId) {
+            return;
+        }
+
+        const channelId = this.currentChannelId;
+        this.loadingNewer = true;
+        try {
+            const response = await fetch(
+                `/messages/${channelId}?after_id=${newestId}&limit=${pageSize}`);
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            const messages = await response.json();
+            if (channelId !== this.currentChannelId) {
+                return;
+            }
+            MessageManager.appendNewer(messages, messages.length < pageSize);
+            this.trackCursors(messages);
+            console.debug(`重新載入 ${messages.length} 條較新的訊息`);
+        } catch (error) {
+            console.error('載入較新的訊息時發生錯誤:', error);
+        } finally {
+            this.loadingNewer = false;
+        }
+    }
+
+    // 開啟頻道的訊息推送連線
+    openStream(channelId) {
+        this.closeStream();
+        if (!channelId) {
+            return;
+        }
+
+        // 瀏覽器不支援 SSE 時改用輪詢
+        if (!window.EventSource) {
+            this.startPolling();
+            return;
+        }
+
+        const source = new EventSource(`/stream/${channelId}`);
+        this.eventSource = source;
+
+        source.onmessage = (event) => {
+            if (channelId !== this.currentChannelId || this.isFirstLoad) {
+                return;
+            }
+            this.appendMessages([JSON.parse(event.data)]);
+        };
+
+        // 伺服器要求重新同步時，補抓遺漏的訊息
+        source.addEventListener('resync', () => {
+            console.debug('訊息推送要求重新同步');
+            this.updateMessages();
+        });
+
+        // 重新連線成功後補抓斷線期間的訊息
+        let reconnecting = false;
+        source.onopen = () => {
+            console.debug(`已連接頻道 ${channelId} 的訊息推送`);
+            if (reconnecting) {
+                this.updateMessages();
+            }
+        };
+        source.onerror = () => {
+            console.debug('訊息推送連線中斷，等待重新連線');
+            reconnecting = true;
+        };
+    }
+
+    // 關閉訊息推送連線
+    closeStream() {
+        if (this.eventSource) {
+            this.eventSource.close();
+            this.eventSource = null;
         }
     }
 
@@ -244,7 +411,11 @@ class EventHandler {
                 if (attachment.content_type && attachment.content_type.startsWith('image/')) {
                     const img = document.createElement('img');
                     img.className = 'message-image';
-                    img.src = attachment.url;
+                    // 經過 /media 代理載入縮圖，放大時才載入原圖
+                    img.src = MessageManager.mediaUrl(attachment.url, MessageManager.THUMBNAIL_WIDTH);
+                    img.dataset.fullSrc = MessageManager.mediaUrl(attachment.url);
+                    img.loading = 'lazy';
+                    img.decoding = 'async';
                     img.alt = 'Message attachment';
                     img.onclick = () => this.toggleZoom(img);
                     div.appendChild(img);
@@ -262,8 +433,8 @@ class EventHandler {
         const errorDiv = document.createElement('div');
         errorDiv.className = 'error-message';
         errorDiv.textContent = message;
-        this.messageContainer.innerHTML = '';
-        this.messageContainer.appendChild(errorDiv);
+        MessageManager.reset();
+        this.messageContainer.insertBefore(errorDiv, this.messageContainer.lastChild);
     }
 
     // 切換圖片縮放
@@ -275,6 +446,10 @@ class EventHandler {
             img.classList.remove('zoomed');
             overlay.style.display = 'none';
         } else {
+            if (img.dataset.fullSrc) {
+                img.src = img.dataset.fullSrc;
+                delete img.dataset.fullSrc;
+            }
             img.classList.add('zoomed');
             overlay.style.display = 'block';
         }
@@ -308,16 +483,212 @@ class EventHandler {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
 
-            await this.updateMessages();
+            // 訊息已排入發送佇列，背景追蹤發送結果
+            const { job_id: jobId } = await response.json();
+            this.watchSendJob(jobId);
+
+            // 有推送連線時，新訊息會經由推送送達
+            if (!this.eventSource) {
+                await this.updateMessages();
+            }
         } catch (error) {
             console.error('發送訊息時發生錯誤:', error);
             this.showError('無法發送訊息');
         }
     }
 
+    // 追蹤發送工作，發送失敗時顯示錯誤
+    async watchSendJob(jobId, attempts = 20) {
+        for (let i = 0; i < attempts; i++) {
+            await new Promise(resolve => setTimeout(resolve, 500));
+            try {
+                const response = await fetch(`/send-status/${jobId}`);
+                if (!response.ok) {
+                    return;
+                }
+                const job = await response.json();
+                if (job.status === 'sent') {
+                    console.debug(`訊息已發送，延遲 ${job.latency_ms} ms`);
+                    return;
+                }
+                if (job.status === 'failed') {
+                    console.error('發送訊息失敗:', job.error);
+                    this.showError('無法發送訊息');
+                    return;
+                }
+            } catch (error) {
+                console.error('查詢發送狀態時發生錯誤:', error);
+                return;
+            }
+        }
+    }
+
+    // 顯示目前的日誌級別，並在選擇後於伺服器端即時調整
+    // 展開分片面板時定期更新各分片的延遲與事件速率
+    setupShardView(interval = 5000) {
+        if (!this.shardPanel || !this.shardRows) {
+            return;
+        }
+        let timer = null;
+        this.shardPanel.addEventListener('toggle', () => {
+            clearInterval(timer);
+            timer = null;
+            if (this.shardPanel.open) {
+                this.updateShards();
+                timer = setInterval(() => this.updateShards(), interval);
+            }
+        });
+    }
+
+    async updateShards() {
+        try {
+            const response = await fetch('/shards');
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            const data = await response.json();
+            this.shardRows.innerHTML = '';
+            data.shards.forEach(shard => {
+                const row = document.createElement('tr');
+                [shard.id, shard.state, shard.latency_ms ?? '-', shard.guilds,
+                 shard.events_per_second, shard.reconnects].forEach(value => {
+                    const cell = document.createElement('td');
+                    cell.textContent = value;
+                    row.appendChild(cell);
+                });
+                this.shardRows.appendChild(row);
+            });
+        } catch (error) {
+            console.error('獲取分片狀態時發生錯誤:', error);
+        }
+    }
+
+    // 展開匯出面板時定期更新各匯出工作的進度與速率
+    setupExportView(interval = 2000) {
+        if (!this.exportPanel || !this.exportRows) {
+            return;
+        }
+        let timer = null;
+        this.exportPanel.addEventListener('toggle', () => {
+            clearInterval(timer);
+            timer = null;
+            if (this.exportPanel.open) {
+                this.updateExports();
+                timer = setInterval(() => this.updateExports(), interval);
+            }
+        });
+        this.exportChannelButton?.addEventListener('click', () => {
+            if (this.currentChannelId) {
+                this.startExport({ channel_ids: [this.currentChannelId] });
+            }
+        });
+        this.exportGuildButton?.addEventListener('click', () => {
+            if (this.currentGuildId) {
+                this.startExport({ guild_id: this.currentGuildId });
+            }
+        });
+    }
+
+    async startExport(body) {
+        try {
+            const response = await fetch('/exports', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify(body)
+            });
+            if (!response.ok) {
+                const data = await response.json();
+                throw new Error(data.error || `HTTP error! status: ${response.status}`);
+            }
+            await this.updateExports();
+        } catch (error) {
+            console.error('建立匯出工作時發生錯誤:', error);
+        }
+    }
+
+    async cancelExport(jobId) {
+        try {
+            await fetch(`/exports/${jobId}/cancel`, { method: 'POST' });
+            await this.updateExports();
+        } catch (error) {
+            console.error('取消匯出工作時發生錯誤:', error);
+        }
+    }
+
+    async updateExports() {
+        try {
+            const response = await fetch('/exports');
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            const data = await response.json();
+            this.exportRows.innerHTML = '';
+            data.jobs.forEach(job => {
+                const row = document.createElement('tr');
+                [job.id.slice(0, 8), job.status, `${job.channels_done}/${job.channels}`,
+                 job.messages, job.messages_per_second].forEach(value => {
+                    const cell = document.createElement('td');
+                    cell.textContent = value;
+                    row.appendChild(cell);
+                });
+                const action = document.createElement('td');
+                if (job.status === 'running') {
+                    const button = document.createElement('button');
+                    button.textContent = t('export-cancel');
+                    button.addEventListener('click', () => this.cancelExport(job.id));
+                    action.appendChild(button);
+                }
+                row.appendChild(action);
+                this.exportRows.appendChild(row);
+            });
+        } catch (error) {
+            console.error('獲取匯出工作時發生錯誤:', error);
+        }
+    }
+
+    async setupLogLevel() {
+        if (!this.logLevelSelector) {
+            return;
+        }
+        try {
+            const response = await fetch('/log-level');
+            if (response.ok) {
+                const data = await response.json();
+                this.logLevelSelector.value = data.level;
+            }
+        } catch (error) {
+            console.error('獲取日誌級別時發生錯誤:', error);
+        }
+
+        this.logLevelSelector.addEventListener('change', async () => {
+            try {
+                const response = await fetch('/log-level', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ level: this.logLevelSelector.value })
+                });
+                if (!response.ok) {
+                    console.error('調整日誌級別失敗:', await response.text());
+                }
+            } catch (error) {
+                console.error('調整日誌級別時發生錯誤:', error);
+            }
+        });
+    }
+
     setupMessageRefresh() {
+        // 新訊息由伺服器推送，只有不支援 SSE 的瀏覽器需要輪詢
+        if (!window.EventSource) {
+            this.startPolling();
+        }
+    }
+
+    startPolling() {
+        if (this.pollTimer) {
+            return;
+        }
         // 每 5 秒更新一次訊息
-        setInterval(() => {
+        this.pollTimer = setInterval(() => {
             if (this.currentChannelId) {
                 this.updateMessages();
             }
@@ -14,7 +14,21 @@ const translations = {
         'loading': 'Loading...',
         'language': 'Language',
         'english': 'English',
-        'chinese': 'Traditional Chinese'
+        'chinese': 'Traditional Chinese',
+        'shards': 'Shards',
+        'shard-state': 'State',
+        'shard-latency': 'Latency (ms)',
+        'shard-guilds': 'Guilds',
+        'shard-rate': 'Events/s',
+        'shard-reconnects': 'Reconnects',
+        'exports': 'History exports',
+        'export-channel': 'Export channel',
+        'export-guild': 'Export server',
+        'export-status': 'Status',
+        'export-channels': 'Channels',
+        'export-messages': 'Messages',
+        'export-rate': 'Messages/s',
+        'export-cancel': 'Cancel'
     },
     'zh-TW': {
         'title': 'Discord 機器人控制面板',
@@ -30,7 +44,21 @@ const translations = {
         'loading': '載入中...',
         'language': '語言',
         'english': '英文',
-        'chinese': '繁體中文'
+        'chinese': '繁體中文',
+        'shards': '分片',
+        'shard-state': '狀態',
+        'shard-latency': '延遲 (ms)',
+        'shard-guilds': '伺服器數',
+        'shard-rate': '事件/秒',
+        'shard-reconnects': '重新連線',
+        'exports': '歷史訊息匯出',
+        'export-channel': '匯出頻道',
+        'export-guild': '匯出伺服器',
+        'export-status': '狀態',
+        'export-channels': '頻道',
+        'export-messages': '訊息數',
+        'export-rate': '訊息/秒',
+        'export-cancel': '取消'
     }
 };
 
@@ -1,141 +1,395 @@
 // 訊息管理模組
+// 以訊息 ID 為鍵保存有上限的訊息，只把可視範圍附近的訊息放進 DOM：
+// - 新訊息只新增元素，不重建整個列表
+// - 捲動時移動渲染視窗，視窗外的訊息以上下兩個空白元素佔位
+// - 訊息數超過上限時，從離視窗較遠的一端移除
 const MessageManager = {
-    allMessages: [],
-    lastMessageCount: 0,
-    lastUpdateTime: null,
-    currentGuildId: '',
-    hasNewMessages: false,
+    // 最多保存的訊息數
+    MAX_MESSAGES: 2000,
+    // 同時放在 DOM 中的訊息元素數
+    WINDOW_SIZE: 150,
+    // 捲動到視窗邊緣時一次移動的訊息數
+    WINDOW_STEP: 50,
+    // 距離邊緣多少像素時移動視窗
+    EDGE_PX: 300,
+    // 尚未量測過的訊息使用的預估高度
+    ESTIMATED_HEIGHT: 60,
+    // 訊息中圖片縮圖的寬度
+    THUMBNAIL_WIDTH: 320,
 
-    // 顯示訊息
-    displayMessages(messages) {
-        const messageList = document.getElementById('messages');
-        if (!messageList) {
-            console.error('找不到訊息列表元素');
-            return;
+    ids: [],
+    messages: new Map(),
+    elements: new Map(),
+    heights: new Map(),
+    start: 0,
+    end: 0,
+    // 較新的訊息因超過上限被移除，捲動到底部時需要重新載入
+    newerTruncated: false,
+    container: null,
+    topSpacer: null,
+    bottomSpacer: null,
+    renderer: null,
+    onReachTop: null,
+    onReachBottom: null,
+    scrollQueued: false,
+    gap: 0,
+
+    // 將 Discord CDN 網址轉為 /media 代理網址，width 指定縮圖寬度
+    mediaUrl(url, width) {
+        if (!url) {
+            return url;
+        }
+        const params = new URLSearchParams({ url });
+        if (width) {
+            params.set('w', width);
         }
+        return `/media?${params}`;
+    },
 
-        try {
-            // 清空現有訊息
-            messageList.innerHTML = '';
-            
-            messages.forEach(message => {
-                const messageElement = document.createElement('div');
-                messageElement.className = 'message';
-                messageElement.dataset.messageId = message.id;
-                messageElement.dataset.channelId = message.channel_id;
-                
-                const header = document.createElement('div');
-                header.className = 'message-header';
-                
-                const author = document.createElement('span');
-                author.className = 'message-author';
-                author.textContent = message.author;
-                
-                const timestamp = document.createElement('span');
-                timestamp.className = 'message-timestamp';
-                timestamp.textContent = new Date(message.timestamp).toLocaleString();
-                
-                const channel = document.createElement('span');
-                channel.className = 'message-channel';
-                channel.textContent = `#${message.channel_name}`;
-                
-                const messageId = document.createElement('span');
-                messageId.className = 'message-id';
-                messageId.textContent = `ID: ${message.id}`;
-
-                header.appendChild(author);
-                header.appendChild(timestamp);
-                header.appendChild(channel);
-                header.appendChild(messageId);
-                
-                const content = document.createElement('div');
-                content.className = 'message-content';
-                content.textContent = message.content || '';
-                
-                messageElement.appendChild(header);
-                messageElement.appendChild(content);
-
-                // 如果有附件，添加附件
-                if (message.attachments && message.attachments.length > 0) {
-                    const attachmentsContainer = document.createElement('div');
-                    attachmentsContainer.className = 'message-attachments';
-                    
-                    message.attachments.forEach(attachment => {
-                        if (attachment.url) {
-                            const imgContainer = document.createElement('div');
-                            imgContainer.className = 'image-container';
-                            
-                            const img = document.createElement('img');
-                            img.src = attachment.url;
-                            img.alt = '附件圖片';
-                            img.className = 'message-image';
-                            img.onclick = () => {
-                                window.toggleZoom(img);
-                                // 點擊遮罩層時關閉圖片
-                                const overlay = document.querySelector('.overlay');
-                                overlay.onclick = () => {
-                                    window.toggleZoom(img);
-                                };
-                            };
-                            imgContainer.appendChild(img);
-                            attachmentsContainer.appendChild(imgContainer);
-                        }
-                    });
-                    
-                    messageElement.appendChild(attachmentsContainer);
-                }
+    // 比較兩個訊息 ID；ID 超過 Number 的精度，以字串長度與字典序比較
+    compareIds(a, b) {
+        if (a.length !== b.length) {
+            return a.length - b.length;
+        }
+        return a < b ? -1 : a > b ? 1 : 0;
+    },
 
-                messageList.appendChild(messageElement);
+    // 綁定訊息容器；createElement 用來建立訊息元素，onReachTop / onReachBottom 在需要向伺服器載入時呼叫
+    attach(container, { createElement, onReachTop, onReachBottom } = {}) {
+        this.container = container;
+        this.renderer = createElement || (message => this.createMessageElement(message));
+        this.onReachTop = onReachTop || null;
+        this.onReachBottom = onReachBottom || null;
+        this.gap = parseFloat(getComputedStyle(container).rowGap) || 0;
+        container.addEventListener('scroll', () => {
+            if (this.scrollQueued) {
+                return;
+            }
+            this.scrollQueued = true;
+            requestAnimationFrame(() => {
+                this.scrollQueued = false;
+                this.handleScroll();
             });
+        });
+        this.reset();
+    },
 
-            // 滾動到底部
-            messageList.scrollTop = messageList.scrollHeight;
-        } catch (error) {
-            console.error('顯示訊息時發生錯誤:', error);
+    // 清空所有訊息（切換頻道或重新整理時）
+    reset() {
+        this.ids = [];
+        this.messages.clear();
+        this.elements.clear();
+        this.heights.clear();
+        this.start = 0;
+        this.end = 0;
+        this.newerTruncated = false;
+        if (!this.container) {
+            return;
         }
+        this.container.innerHTML = '';
+        this.topSpacer = document.createElement('div');
+        this.topSpacer.className = 'message-spacer';
+        this.bottomSpacer = document.createElement('div');
+        this.bottomSpacer.className = 'message-spacer';
+        this.container.appendChild(this.topSpacer);
+        this.container.appendChild(this.bottomSpacer);
+    },
+
+    get size() {
+        return this.ids.length;
+    },
+
+    oldestId() {
+        return this.ids.length > 0 ? this.ids[0] : null;
+    },
+
+    newestId() {
+        return this.ids.length > 0 ? this.ids[this.ids.length - 1] : null;
     },
 
     // 獲取最後一條訊息
     getLastMessage() {
-        if (this.allMessages.length > 0) {
-            return this.allMessages[this.allMessages.length - 1];
+        const id = this.newestId();
+        return id ? this.messages.get(id) : null;
+    },
+
+    // 二分搜尋訊息 ID 的插入位置
+    indexOf(id) {
+        let low = 0;
+        let high = this.ids.length;
+        while (low < high) {
+            const middle = (low + high) >> 1;
+            if (this.compareIds(this.ids[middle], id) < 0) {
+                low = middle + 1;
+            } else {
+                high = middle;
+            }
+        }
+        return low;
+    },
+
+    // 依 ID 順序加入訊息，已存在時返回 -1
+    insert(message) {
+        if (this.messages.has(message.id)) {
+            return -1;
+        }
+        const last = this.newestId();
+        const index = !last || this.compareIds(message.id, last) > 0
+            ? this.ids.length : this.indexOf(message.id);
+        this.ids.splice(index, 0, message.id);
+        this.messages.set(message.id, message);
+        return index;
+    },
+
+    // 捲動位置是否在底部附近
+    isPinned() {
+        const container = this.container;
+        return container.scrollHeight - container.scrollTop - container.clientHeight < this.EDGE_PX;
+    },
+
+    element(id) {
+        let element = this.elements.get(id);
+        if (!element) {
+            element = this.renderer(this.messages.get(id));
+            this.elements.set(id, element);
+        }
+        return element;
+    },
+
+    // 從 DOM 移除訊息元素，保留元素與量測到的高度供之後重用
+    detach(id) {
+        const element = this.elements.get(id);
+        if (element && element.parentNode) {
+            // 加上列表的 gap，佔位元素的高度才會與實際渲染時相同
+            this.heights.set(id, element.offsetHeight + this.gap);
+            element.remove();
+        }
+    },
+
+    // 加入新訊息（首次載入、輪詢與推送），返回實際加入的訊息
+    add(messages) {
+        if (!this.container) {
+            return [];
+        }
+        const pinned = this.isPinned();
+        const added = [];
+        messages.forEach(message => {
+            // 較新的訊息被移除後先不加入，捲動到底部時再依序載入，避免中間出現缺口
+            if (this.newerTruncated && this.compareIds(message.id, this.newestId()) > 0) {
+                return;
+            }
+            const index = this.insert(message);
+            if (index < 0) {
+                return;
+            }
+            added.push(message);
+            if (index < this.start) {
+                this.start++;
+                this.end++;
+            } else if (index < this.end) {
+                this.container.insertBefore(this.element(message.id), this.element(this.ids[index + 1]));
+                this.end++;
+            } else if (index === this.end && this.end === this.ids.length - 1 && pinned) {
+                // 視窗在底部且使用者沒有往上捲動時，直接接在最後
+                this.container.insertBefore(this.element(message.id), this.bottomSpacer);
+                this.end++;
+            }
+        });
+        if (added.length === 0) {
+            return added;
+        }
+
+        // 停在底部時從上方移出舊的元素，讓 DOM 中的元素數維持固定
+        if (pinned) {
+            while (this.end - this.start > this.WINDOW_SIZE) {
+                this.detach(this.ids[this.start]);
+                this.start++;
+            }
+        }
+        this.evict();
+        this.updateSpacers();
+        if (pinned) {
+            this.container.scrollTop = this.container.scrollHeight;
+        }
+        return added;
+    },
+
+    // 加入往回翻頁載入的較舊訊息，並把視窗移到這些訊息
+    prepend(messages) {
+        let inserted = 0;
+        messages.forEach(message => {
+            const index = this.insert(message);
+            if (index < 0) {
+                return;
+            }
+            inserted++;
+            if (index <= this.start) {
+                this.start++;
+                this.end++;
+            }
+        });
+        if (inserted > 0) {
+            this.moveWindow(this.start - inserted);
+            this.evict();
+            this.updateSpacers();
+        }
+        return inserted;
+    },
+
+    // 加入捲動到底部時重新載入的較新訊息；complete 表示已經載入到最新
+    appendNewer(messages, complete) {
+        this.newerTruncated = false;
+        const pinned = this.isPinned();
+        messages.forEach(message => this.insert(message));
+        this.newerTruncated = !complete;
+        if (pinned) {
+            this.moveWindow(this.start + this.WINDOW_STEP);
+        }
+        this.evict();
+        this.updateSpacers();
+    },
+
+    // 找出目前可視範圍中的第一個訊息元素，移動視窗後以它維持捲動位置
+    findAnchor() {
+        const top = this.container.getBoundingClientRect().top;
+        for (let index = this.start; index < this.end; index++) {
+            const element = this.elements.get(this.ids[index]);
+            if (element && element.getBoundingClientRect().bottom > top) {
+                return element;
+            }
         }
         return null;
     },
 
-    // 更新訊息
+    // 將渲染視窗移到從 newStart 開始的 WINDOW_SIZE 則訊息
+    moveWindow(newStart) {
+        const total = this.ids.length;
+        newStart = Math.max(0, Math.min(newStart, total - this.WINDOW_SIZE));
+        const newEnd = Math.min(total, newStart + this.WINDOW_SIZE);
+        if (newStart === this.start && newEnd === this.end) {
+            return;
+        }
+
+        const anchor = this.findAnchor();
+        const anchorTop = anchor ? anchor.getBoundingClientRect().top : 0;
+        for (let index = this.start; index < this.end; index++) {
+            if (index < newStart || index >= newEnd) {
+                this.detach(this.ids[index]);
+            }
+        }
+        // 由後往前放入元素，已經在正確位置的元素不移動
+        let next = this.bottomSpacer;
+        for (let index = newEnd - 1; index >= newStart; index--) {
+            const element = this.element(this.ids[index]);
+            if (element.nextSibling !== next || !element.parentNode) {
+                this.container.insertBefore(element, next);
+            }
+            next = element;
+        }
+        this.start = newStart;
+        this.end = newEnd;
+        this.updateSpacers();
+        if (anchor && anchor.parentNode) {
+            this.container.scrollTop += anchor.getBoundingClientRect().top - anchorTop;
+        }
+    },
+
+    handleScroll() {
+        const container = this.container;
+        if (!container) {
+            return;
+        }
+        if (container.scrollTop < this.topSpacer.offsetHeight + this.EDGE_PX) {
+            if (this.start > 0) {
+                this.moveWindow(this.start - this.WINDOW_STEP);
+            } else if (this.onReachTop) {
+                this.onReachTop();
+            }
+        }
+        const bottomEdge = container.scrollHeight - this.bottomSpacer.offsetHeight - this.EDGE_PX;
+        if (container.scrollTop + container.clientHeight > bottomEdge) {
+            if (this.end < this.ids.length) {
+                this.moveWindow(this.start + this.WINDOW_STEP);
+            } else if (this.newerTruncated && this.onReachBottom) {
+                this.onReachBottom();
+            }
+        }
+    },
+
+    // 超過上限時，從離視窗較遠的一端移除訊息
+    evict() {
+        const excess = this.ids.length - this.MAX_MESSAGES;
+        if (excess <= 0) {
+            return;
+        }
+        let removed;
+        if (this.start >= this.ids.length - this.end) {
+            const count = Math.min(excess, this.start);
+            removed = this.ids.splice(0, count);
+            this.start -= count;
+            this.end -= count;
+        } else {
+            const count = Math.min(excess, this.ids.length - this.end);
+            removed = this.ids.splice(this.ids.length - count, count);
+            this.newerTruncated = true;
+        }
+        removed.forEach(id => {
+            this.messages.delete(id);
+            this.elements.delete(id);
+            this.heights.delete(id);
+        });
+    },
+
+    // 以量測到的高度（未量測過的使用平均值）設定上下佔位元素的高度
+    updateSpacers() {
+        let measured = 0;
+        this.heights.forEach(height => {
+            measured += height;
+        });
+        const estimate = this.heights.size > 0 ? measured / this.heights.size : this.ESTIMATED_HEIGHT;
+        const heightOf = id => {
+            const height = this.heights.get(id);
+            return height === undefined ? estimate : height;
+        };
+        let top = 0;
+        for (let index = 0; index < this.start; index++) {
+            top += heightOf(this.ids[index]);
+        }
+        let bottom = 0;
+        for (let index = this.end; index < this.ids.length; index++) {
+            bottom += heightOf(this.ids[index]);
+        }
+        this.topSpacer.style.height = `${top}px`;
+        this.bottomSpacer.style.height = `${bottom}px`;
+    },
+
+    // 顯示訊息；未指定訊息時保留目前的內容
+    displayMessages(messages) {
+        if (!messages) {
+            return;
+        }
+        this.reset();
+        this.add(messages);
+    },
+
+    // 更新訊息，只新增尚未顯示的訊息
     updateMessages(newMessages, isRefresh = false) {
         try {
             if (!Array.isArray(newMessages)) {
                 console.error('無效的訊息格式:', newMessages);
-                return;
+                return [];
             }
-
-            // 檢查是否有新訊息
-            const hasNewMessages = newMessages.length > 0;
-            if (hasNewMessages) {
-                console.debug(`更新 ${newMessages.length} 條訊息`);
-                
-                // 如果是重新整理，清空現有訊息
-                if (isRefresh) {
-                    this.allMessages = [];
-                }
-                
-                // 添加新訊息到現有訊息的後面
-                const existingMessageIds = new Set(this.allMessages.map(msg => msg.timestamp));
-                const uniqueNewMessages = newMessages.filter(msg => !existingMessageIds.has(msg.timestamp));
-                
-                if (uniqueNewMessages.length > 0) {
-                    this.allMessages.push(...uniqueNewMessages);
-                    this.hasNewMessages = true;
-                    console.debug(`添加 ${uniqueNewMessages.length} 條新訊息`);
-                }
-                
-                // 顯示所有訊息
-                this.displayMessages(this.allMessages);
+            if (isRefresh) {
+                this.reset();
+            }
+            const added = this.add(newMessages);
+            if (added.length > 0) {
+                console.debug(`添加 ${added.length} 條新訊息`);
             }
+            return added;
         } catch (error) {
             console.error('更新訊息時發生錯誤:', error);
+            return [];
         }
     },
 
@@ -186,7 +440,9 @@ const MessageManager = {
                     imgContainer.className = 'image-container';
                     
                     const img = document.createElement('img');
-                    img.src = attachment.url;
+                    img.src = this.mediaUrl(attachment.url, this.THUMBNAIL_WIDTH);
+                    img.dataset.fullSrc = this.mediaUrl(attachment.url);
+                    img.loading = 'lazy';
                     img.alt = '附件圖片';
                     img.className = 'message-image';
                     
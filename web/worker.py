@@ -0,0 +1,334 @@
+"""
+控制面板工作程序
+
+在獨立的程序中執行控制面板，透過 Unix socket 連線到以 WEB_SERVER=ipc 啟動的機器人：
+- 伺服器目錄、頻道訊息快取與訊息推送都在本程序保存唯讀複本，讀取不經過機器人
+- 只有第一次讀取頻道、往回翻頁超出快取、發送訊息與查詢機器人狀態時才送出請求
+- 封存搜尋直接以唯讀方式開啟同一個 SQLite 資料庫
+- 以 SO_REUSEPORT 監聽，可啟動多個工作程序共用同一個連接埠
+- 只對應一個機器人程序；分片分散到多個程序時，以相同的 SHARD_IDS 啟動，
+  預設的 socket 與連接埠會對應到該程序（見 utils/config.py 的 DATA_DIR 與 FLASK_PORT）
+
+用法：
+    python -m web.worker [--socket log/panel.sock] [--host localhost] [--port 5000]
+"""
+
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import threading
+import uuid
+
+from bot.core.archive import MessageArchive
+from bot.core.cache import ChannelMessageCache
+from bot.core.directory import GuildDirectory
+from bot.core.hub import RESYNC, MessageHub
+from bot.core.logger import setup_logging, stop_logging
+from bot.core.metrics import CACHE_HIT, CACHE_MISS, registry
+from bot.core.serializer import Attachment, MessageRecord
+from utils.config import DATA_DIR, FLASK_HOST, FLASK_PORT, IPC_SOCKET, LOG_LEVEL, LOG_SAMPLE_EVERY
+from .app import FlaskApp
+from .ipc import encode_frame, read_frame
+from .service import PanelError, PanelService
+
+# 獲取日誌記錄器
+logger = logging.getLogger(__name__)
+
+# 重新連線的等待時間上限（秒）
+RECONNECT_MAX_SECONDS = 10
+
+
+class IPCClient:
+    # 在工作程序的事件迴圈上維持與機器人的連線，斷線時自動重新連線
+    def __init__(self, path, replica):
+        self.path = path
+        self.replica = replica
+        self.loop = None
+        self.writer = None
+        self.pending = {}
+        self.ids = itertools.count(1)
+        self.task = None
+
+    @property
+    def connected(self):
+        return self.writer is not None
+
+    def start(self, loop):
+        self.loop = loop
+        self.task = asyncio.run_coroutine_threadsafe(self.run(), loop)
+
+    async def run(self):
+        delay = 0.5
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path)
+            except OSError as e:
+                logger.warning("無法連線到機器人程序 (%s)，%.1f 秒後重試", e, delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RECONNECT_MAX_SECONDS)
+                continue
+
+            delay = 0.5
+            self.writer = writer
+            logger.info("已連線到機器人程序: %s", self.path)
+            self.replica.on_connect()
+            try:
+                while True:
+                    self.dispatch(await read_frame(reader))
+            except (asyncio.IncompleteReadError, ConnectionError):
+                logger.warning("與機器人程序的連線已中斷")
+            except Exception as e:
+                logger.error("讀取機器人程序訊息時發生錯誤: %s", e, exc_info=True)
+            finally:
+                self.writer = None
+                writer.close()
+                for future in self.pending.values():
+                    if not future.done():
+                        future.set_exception(PanelError('與機器人程序的連線已中斷', 503))
+                self.pending.clear()
+                self.replica.on_disconnect()
+
+    def dispatch(self, frame):
+        if 'event' in frame:
+            self.replica.on_event(frame)
+            return
+        future = self.pending.pop(frame.get('id'), None)
+        if future is None or future.done():
+            return
+        if 'error' in frame:
+            future.set_exception(PanelError(frame['error'], frame.get('status', 500)))
+        else:
+            future.set_result(frame.get('result'))
+
+    async def call(self, op, **args):
+        # 必須在工作程序的事件迴圈上呼叫
+        if self.writer is None:
+            raise PanelError('尚未連線到機器人程序', 503)
+        request_id = next(self.ids)
+        future = self.loop.create_future()
+        self.pending[request_id] = future
+        try:
+            self.writer.write(encode_frame({'id': request_id, 'op': op, 'args': args}))
+            await self.writer.drain()
+            return await future
+        finally:
+            self.pending.pop(request_id, None)
+
+
+class PanelReplica:
+    # 取代 DiscordBot 供 FlaskApp 使用，保存機器人狀態的唯讀複本
+    def __init__(self, socket_path, archive_path=None):
+        self.message_cache = ChannelMessageCache()
+        self.hub = MessageHub()
+        self.directory = GuildDirectory()
+        self.archive = self.open_archive(archive_path) if archive_path else None
+        self.client = IPCClient(socket_path, self)
+        self.watches = {}
+        # 關注頻道的請求尚未完成時，先暫存期間收到的事件
+        self.buffered = {}
+        # 進行中的廣播，broadcast_id 對應接收結果的函式
+        self.broadcasts = {}
+
+    @staticmethod
+    def open_archive(path):
+        try:
+            return MessageArchive(path, readonly=True)
+        except Exception as e:
+            logger.warning("無法開啟訊息封存 %s，封存查詢將停用: %s", path, e)
+            return None
+
+    def on_connect(self):
+        # 重新連線後請訂閱者重新讀取，頻道會在讀取時重新關注
+        for channel_id in self.hub.get_stats():
+            self.hub.publish(channel_id, RESYNC)
+
+    def on_disconnect(self):
+        # 斷線期間的事件已遺失，清空快取，重新連線後再從機器人讀取
+        self.message_cache.clear()
+        self.buffered.clear()
+
+    def on_event(self, event):
+        kind = event['event']
+        if kind == 'directory':
+            self.directory.load(event['directory'])
+            return
+        if kind == 'broadcast':
+            put = self.broadcasts.get(event['broadcast_id'])
+            if put is not None:
+                put(event['result'])
+            return
+        if kind == 'message':
+            event['message'] = MessageRecord.from_wire(event['message'])
+            channel_id = str(event['message'].channel_id)
+        else:
+            channel_id = event['channel_id']
+        buffered = self.buffered.get(channel_id)
+        if buffered is not None:
+            buffered.append(event)
+        else:
+            self.apply(channel_id, event)
+
+    def apply(self, channel_id, event):
+        kind = event['event']
+        if kind == 'message':
+            self.message_cache.add(channel_id, event['message'])
+            if self.hub.has_subscribers(channel_id):
+                self.hub.publish(channel_id, event['message'])
+        elif kind == 'edit':
+            fields = event['fields']
+            if 'attachments' in fields:
+                fields['attachments'] = tuple(
+                    Attachment(*attachment) for attachment in fields['attachments'])
+            self.message_cache.update(channel_id, event['message_id'], fields)
+        elif kind == 'delete':
+            self.message_cache.remove(channel_id, event['message_ids'])
+
+    async def watch(self, channel_id):
+        # 同一個頻道同時只送出一個關注請求，其他請求等待同一個結果
+        task = self.watches.get(channel_id)
+        if task is None:
+            task = self.watches[channel_id] = asyncio.ensure_future(self._watch(channel_id))
+            task.add_done_callback(lambda _: self.watches.pop(channel_id, None))
+        await asyncio.shield(task)
+
+    async def _watch(self, channel_id):
+        self.buffered[channel_id] = []
+        try:
+            messages = await self.client.call('watch', channel_id=channel_id)
+            self.message_cache.fill(
+                channel_id, [MessageRecord.from_wire(message) for message in messages])
+            for event in self.buffered.get(channel_id, ()):
+                self.apply(channel_id, event)
+        finally:
+            self.buffered.pop(channel_id, None)
+
+
+class RemotePanelService(PanelService):
+    # 從複本讀取狀態，需要機器人處理的操作透過程序間通訊轉送
+    def __init__(self, replica):
+        super().__init__(replica, replica.message_cache)
+
+    @property
+    def loop(self):
+        return self.discord_bot.client.loop
+
+    @property
+    def directory(self):
+        return self.discord_bot.directory
+
+    def call(self, op, **args):
+        return self.run(self.discord_bot.client.call(op, **args))
+
+    def get_channel(self, channel_id):
+        if not self.directory.has_channel(channel_id):
+            logger.warning("找不到指定的頻道: %s", channel_id)
+            raise PanelError('找不到指定的頻道', 404)
+        return channel_id
+
+    def get_messages_threaded(self, channel_id, params):
+        # 關注中的頻道由推送保持最新，只有第一次讀取與往回翻頁超出快取時才送出請求
+        self.get_channel(channel_id)
+        after_id, before_id, limit = self.parse_cursor(params)
+        if self.message_cache.is_warm(channel_id):
+            CACHE_HIT.inc()
+        else:
+            CACHE_MISS.inc()
+            self.run(self.discord_bot.watch(channel_id))
+        if self.newer_gap(channel_id, after_id, before_id):
+            # 快取以外的較新訊息由機器人向 Discord 讀取
+            newer = self.call('messages', channel_id=channel_id, params=dict(params))
+            return [MessageRecord.from_wire(message) for message in newer]
+        messages = self.read_messages(channel_id, after_id, before_id, limit)
+        cursor = self.older_cursor(messages, after_id, before_id, limit)
+        if cursor is not None:
+            older = self.call('messages', channel_id=channel_id,
+                              params={'before_id': str(cursor), 'limit': str(limit - len(messages))})
+            messages = [MessageRecord.from_wire(message) for message in older] + messages
+        return messages
+
+    def get_shards(self):
+        return self.call('shards')
+
+    def get_persistence_stats(self):
+        return self.call('persistence')
+
+    def get_log_level(self):
+        return self.call('log_level')
+
+    def set_log_level(self, level, name=None, sample_every=None):
+        return self.call('log_level', level=level, logger_name=name, sample_every=sample_every)
+
+    def render_metrics(self):
+        # 機器人程序的指標加上本工作程序的控制面板指標
+        return self.call('metrics') + registry.render(('panel_',))
+
+    def send_message(self, channel_id, content):
+        return self.call('send', channel_id=channel_id, content=content)
+
+    def get_send_status(self, job_id):
+        return self.call('send_status', job_id=job_id)
+
+    def list_exports(self):
+        return self.call('exports')
+
+    def get_export(self, job_id):
+        return self.call('export', job_id=job_id)
+
+    def start_export(self, data):
+        return self.call('export_start', data=data)
+
+    def cancel_export(self, job_id):
+        return self.call('export_cancel', job_id=job_id)
+
+    def channel_exists(self, channel_id):
+        return self.directory.has_channel(channel_id)
+
+    def submit_broadcast(self, channel_ids, content, put):
+        broadcast_id = uuid.uuid4().hex
+        self.discord_bot.broadcasts[broadcast_id] = put
+        try:
+            self.call('broadcast', broadcast_id=broadcast_id, channel_ids=channel_ids,
+                      content=content)
+        except Exception:
+            self.finish_broadcast(broadcast_id)
+            raise
+        return broadcast_id
+
+    def finish_broadcast(self, handle):
+        self.discord_bot.broadcasts.pop(handle, None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--socket', default=IPC_SOCKET, help='機器人程序的 Unix socket 路徑')
+    parser.add_argument('--host', default=FLASK_HOST)
+    parser.add_argument('--port', type=int, default=FLASK_PORT)
+    parser.add_argument('--archive', default=os.path.join(DATA_DIR, 'archive.db'),
+                        help='訊息封存資料庫，以唯讀方式開啟')
+    args = parser.parse_args()
+
+    setup_logging(LOG_LEVEL, LOG_SAMPLE_EVERY)
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name='IPCClient', daemon=True).start()
+
+    replica = PanelReplica(args.socket, args.archive)
+    replica.client.start(loop)
+    flask_app = FlaskApp(replica, RemotePanelService(replica))
+    flask_app.start(args.host, args.port, reuse_port=True)
+    logger.info("控制面板工作程序 %s 已啟動", os.getpid())
+    try:
+        flask_app.server_thread.join()
+    except KeyboardInterrupt:
+        logger.info("正在關閉控制面板工作程序...")
+        flask_app.shutdown()
+        replica.hub.close()
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        stop_logging()
+
+
+if __name__ == '__main__':
+    main()